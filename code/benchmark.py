@@ -0,0 +1,173 @@
+'''
+Benchmark da carga com dados sintéticos (ver dados_sinteticos.py), sem
+baixar os arquivos da Receita. Para cada escala (linhas de
+estabelecimento; as outras tabelas na proporção da base real), gera os
+arquivos e carrega cada tabela num processo separado, com as métricas da
+carga ligadas (ver metricas.py). Assim o pico de memória é o da tabela.
+
+Para cada tabela registra linhas/s da carga inteira e das etapas parse,
+transform e write, além do pico de memória (RSS). Os resultados vão como
+linhas JSON para --resultado, com a versão do código (git describe). Com
+--comparar, os números são comparados com os de outra versão no mesmo
+arquivo: uma queda de velocidade ou um aumento de memória acima de
+--tolerancia é informado como regressão (código de saída 1).
+
+A saída padrão é Parquet numa pasta temporária (sem banco). Com --saida
+postgres a carga usa o banco do ".env", mas no banco informado em --banco,
+porque as tabelas são apagadas e recriadas.
+
+Exemplos:
+    python benchmark.py --escalas 10000,100000,1000000
+    python benchmark.py --saida postgres --banco Dados_RFB_benchmark --env .env
+    python benchmark.py --escalas 100000 --comparar v1.0
+'''
+import argparse
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import dados_sinteticos
+import metricas
+import tabelas
+
+ETAPAS_TABELA = ['parse', 'transform', 'write']
+RESULTADO_PADRAO = 'benchmark_resultados.jsonl'
+
+
+def versao():
+    '''
+    Versão do código (git describe), ou "desconhecida" fora do git
+    '''
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecida'
+
+
+def carregar_tabela(tabela, pasta, saida, env, banco):
+    '''
+    Carrega a tabela num processo separado (ETL_coletar_dados_e_gravar_BD.py
+    --stages load) e retorna (segundos, medições da tabela)
+    '''
+    arquivo_metricas = os.path.join(pasta, 'metricas-' + tabela + '.jsonl')
+    ambiente = dict(os.environ)
+    ambiente.update({'EXTRACTED_FILES_PATH': pasta, 'OUTPUT_FILES_PATH': pasta, 'STREAM_ZIP': 'false',
+                     'OUTPUT_FORMAT': saida, 'PARQUET_PATH': os.path.join(pasta, 'parquet'),
+                     'LOAD_MODE': 'full', 'RESUME': 'false', 'METRICS_FILE': arquivo_metricas,
+                     'METRICS_PROMETHEUS': '', 'PROFILE_STAGE': ''})
+    if banco:
+        ambiente['DB_NAME'] = banco
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ETL_coletar_dados_e_gravar_BD.py')
+    inicio = time.time()
+    subprocess.run([sys.executable, script, '--env', env, '--stages', 'load', '--tables', tabela],
+                   env=ambiente, check=True, stdout=subprocess.DEVNULL)
+    return time.time() - inicio, metricas.ler(arquivo_metricas)
+
+
+def resumo(tabela, segundos, medicoes):
+    '''
+    linhas/s da carga e de cada etapa e pico de RSS da tabela (as tabelas
+    derivadas entram na etapa write da tabela de origem)
+    '''
+    grupo = [tabela] + tabelas.derivadas(tabela)
+    soma = metricas.totais([m for m in medicoes if m.get('tabela') in grupo])
+    linhas = max(soma.get(('parse', tabela), soma.get(('write', tabela), {'linhas': 0}))['linhas'], 0)
+    r = {'tabela': tabela, 'linhas': linhas, 'segundos': round(segundos, 2),
+         'linhas_por_segundo': round(linhas / segundos) if segundos else None,
+         # Cada tabela é carregada num processo novo: o pico do processo é o da tabela
+         'pico_rss_mb': max([t['pico_rss_processo_mb'] for t in soma.values()] or [None])}
+    for etapa in ETAPAS_TABELA:
+        segundos_etapa = sum(t['segundos'] for (e, _), t in soma.items() if e == etapa)
+        r[etapa + '_linhas_por_segundo'] = round(linhas / segundos_etapa) if segundos_etapa else None
+    return r
+
+
+def comparar(atuais, anteriores, tolerancia):
+    '''
+    Regressões entre os resultados atuais e os de outra versão (mesma
+    escala, saída e tabela)
+    '''
+    base = {(r['escala'], r['saida'], r['tabela']): r for r in anteriores}
+    regressoes = []
+    for r in atuais:
+        a = base.get((r['escala'], r['saida'], r['tabela']))
+        if a is None:
+            continue
+        if a['linhas_por_segundo'] and r['linhas_por_segundo'] and \
+                r['linhas_por_segundo'] < a['linhas_por_segundo'] * (1 - tolerancia):
+            regressoes.append('%s (escala %i): %i -> %i linhas/s' % (r['tabela'], r['escala'], a['linhas_por_segundo'],
+                                                                      r['linhas_por_segundo']))
+        if a['pico_rss_mb'] and r['pico_rss_mb'] and r['pico_rss_mb'] > a['pico_rss_mb'] * (1 + tolerancia):
+            regressoes.append('%s (escala %i): pico de memória %.0f -> %.0f MB' % (r['tabela'], r['escala'],
+                                                                                    a['pico_rss_mb'], r['pico_rss_mb']))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da carga com dados sintéticos')
+    parser.add_argument('--escalas', default='10000,100000,1000000', help='linhas de estabelecimento de cada escala')
+    parser.add_argument('--tabelas', help='tabelas separadas por vírgula (padrão: todas)')
+    parser.add_argument('--arquivos', type=int, default=1, help='arquivos por tabela de fatos')
+    parser.add_argument('--saida', choices=['parquet', 'postgres'], default='parquet')
+    parser.add_argument('--banco', help='banco usado com --saida postgres (as tabelas são recriadas)')
+    parser.add_argument('--env', help='arquivo .env com a conexão e as opções da carga (WORKERS, ...)')
+    parser.add_argument('--resultado', default=RESULTADO_PADRAO, help='arquivo JSON lines com os resultados')
+    parser.add_argument('--comparar', help='versão anterior (no arquivo de resultados) para comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.1, help='variação aceita na comparação (0.1 = 10%%)')
+    args = parser.parse_args()
+    if args.saida == 'postgres' and not args.banco:
+        parser.error('--saida postgres precisa de --banco (as tabelas do banco são apagadas e recriadas)')
+
+    nomes_tabelas = args.tabelas.split(',') if args.tabelas else \
+        [t for t, spec in tabelas.TABELAS.items() if not spec.get('origem')]
+    execucao = {'versao': versao(), 'data': datetime.datetime.now().isoformat(timespec='seconds'),
+                'saida': args.saida}
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as pasta_temporaria:
+        env = args.env or os.path.join(pasta_temporaria, 'vazio.env')
+        if not args.env:
+            open(env, 'w').close()
+        for escala in [int(e) for e in args.escalas.split(',')]:
+            pasta = os.path.join(pasta_temporaria, str(escala))
+            inicio = time.time()
+            # As dimensões entram sempre: as tabelas de fatos usam os códigos delas
+            dados_sinteticos.gerar(pasta, dados_sinteticos.linhas_por_tabela(escala), args.arquivos)
+            print('Escala %i: arquivos gerados em %.0f segundos' % (escala, time.time() - inicio))
+            print('tabela'.ljust(16) + 'linhas'.rjust(10) + 'total/s'.rjust(11) + 'parse/s'.rjust(11) +
+                  'transf./s'.rjust(11) + 'write/s'.rjust(11) + 'pico MB'.rjust(9))
+            for tabela in nomes_tabelas:
+                segundos, medicoes = carregar_tabela(tabela, pasta, args.saida, env, args.banco)
+                r = dict(execucao, escala=escala, **resumo(tabela, segundos, medicoes))
+                resultados.append(r)
+                print(tabela.ljust(16) + str(r['linhas']).rjust(10) +
+                      ''.join(str(r[c] if r[c] is not None else '-').rjust(11)
+                              for c in ['linhas_por_segundo', 'parse_linhas_por_segundo',
+                                        'transform_linhas_por_segundo', 'write_linhas_por_segundo']) +
+                      str(r['pico_rss_mb']).rjust(9))
+
+    with open(args.resultado, 'a', encoding='utf-8') as f:
+        for r in resultados:
+            f.write(json.dumps(r, ensure_ascii=False) + '\n')
+    print('Resultados gravados em ' + args.resultado + ' (versão ' + execucao['versao'] + ')')
+
+    if args.comparar:
+        with open(args.resultado, 'r', encoding='utf-8') as f:
+            anteriores = [json.loads(l) for l in f if l.strip()]
+        anteriores = [r for r in anteriores if r['versao'] == args.comparar and r['saida'] == args.saida]
+        regressoes = comparar(resultados, anteriores, args.tolerancia)
+        for regressao in regressoes:
+            print('Regressão: ' + regressao)
+        if not regressoes:
+            print('Sem regressões em relação à versão ' + args.comparar)
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+'''
+Benchmark da busca por nome (busca.py): latência p50/p99 da busca por
+prefixo (as primeiras palavras de nomes existentes) e da busca aproximada
+(nomes existentes com uma letra trocada).
+
+Usa o banco do arquivo ".env", carregado com SEARCH_INDEX=true e com os
+índices criados. Os nomes são sorteados de empresa (TABLESAMPLE).
+
+Exemplo:
+    python benchmark_busca.py --buscas 500
+'''
+import argparse
+import os
+import pathlib
+import random
+
+import numpy as np
+
+import benchmark_consulta
+import busca
+import carga
+import pipeline
+
+
+def sortear_nomes(conn, quantidade):
+    with conn.cursor() as cur:
+        cur.execute('SELECT razao_social_busca FROM empresa TABLESAMPLE SYSTEM (1) '
+                    'WHERE length(razao_social_busca) >= 6 LIMIT %s;', (quantidade,))
+        nomes = [r[0] for r in cur.fetchall()]
+    conn.rollback()
+    return nomes
+
+
+def prefixo(nome):
+    return ' '.join(nome.split()[:2])
+
+
+def com_erro(nome, rng):
+    # Uma letra trocada, como num nome digitado errado
+    i = rng.randrange(len(nome))
+    return nome[:i] + rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') + nome[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da busca por nome')
+    parser.add_argument('--buscas', type=int, default=500, help='buscas de cada tipo')
+    parser.add_argument('--limite', type=int, default=busca.LIMITE_PADRAO, help='resultados por busca')
+    parser.add_argument('--env', default=os.path.join(pathlib.Path().resolve(), '.env'),
+                        help='caminho do arquivo .env')
+    args = parser.parse_args()
+    config = pipeline.configuracao(args.env)
+    engine, conn = carga.conectar(config['db'])
+
+    nomes = sortear_nomes(conn, args.buscas)
+    if not nomes:
+        print('Nenhum nome em empresa.razao_social_busca: carregue as tabelas com SEARCH_INDEX=true.')
+        return
+    rng = random.Random(0)
+    tipos = {'prefixo': [prefixo(n) for n in nomes], 'aproximada': [com_erro(n, rng) for n in nomes]}
+    for tipo, termos in tipos.items():
+        encontrados = []
+        tempos = benchmark_consulta.latencias(lambda t: encontrados.append(len(busca.buscar(conn, t, args.limite))),
+                                              termos)
+        p50, p99 = np.percentile(tempos, [50, 99])
+        print(tipo.ljust(12) + str(len(termos)).rjust(6) + ' buscas   p50 ' + ('%.1f' % p50).rjust(8) + ' ms   p99 ' +
+              ('%.1f' % p99).rjust(8) + ' ms   ' + ('%.1f' % np.mean(encontrados)).rjust(6) + ' resultados/busca')
+    conn.close()
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Benchmark da gravação no banco: compara o caminho antigo (to_sql em pedaços
+de 4096 linhas) com o COPY ... FROM STDIN do carga.py.
+
+Usa as mesmas variáveis de conexão do arquivo ".env" e grava em tabelas
+temporárias (benchmark_carga_*), que são apagadas no final.
+
+Exemplo:
+    python benchmark_carga.py --linhas 200000
+'''
+import argparse
+import os
+import pathlib
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+import carga
+
+
+def dados_sinteticos(linhas, seed=0):
+    '''
+    DataFrame com o formato das colunas principais de estabelecimento
+    '''
+    rng = np.random.default_rng(seed)
+    ufs = np.array(['SP', 'RJ', 'MG', 'PR', 'RS', 'BA', 'SC', 'GO'])
+    return pd.DataFrame({
+        'cnpj_basico': pd.Series(rng.integers(0, 10 ** 8, linhas)).map('{:08d}'.format),
+        'cnpj_ordem': pd.Series(rng.integers(1, 10, linhas)).map('{:04d}'.format),
+        'cnpj_dv': pd.Series(rng.integers(0, 100, linhas)).map('{:02d}'.format),
+        'identificador_matriz_filial': pd.array(rng.integers(1, 3, linhas), dtype='Int32'),
+        'nome_fantasia': pd.Series(rng.integers(0, 10 ** 6, linhas)).map('EMPRESA {} LTDA'.format),
+        'situacao_cadastral': pd.array(rng.integers(1, 9, linhas), dtype='Int32'),
+        'data_situacao_cadastral': pd.array(rng.integers(19900101, 20231231, linhas), dtype='Int32'),
+        'cnae_fiscal_principal': pd.array(rng.integers(111301, 9900800, linhas), dtype='Int32'),
+        'uf': ufs[rng.integers(0, len(ufs), linhas)],
+        'municipio': pd.array(rng.integers(1, 9999, linhas), dtype='Int32'),
+    })
+
+
+def medir(nome, funcao, conn, tabela, linhas):
+    with conn.cursor() as cur:
+        cur.execute('DROP TABLE IF EXISTS "' + tabela + '";')
+    conn.commit()
+    inicio = time.time()
+    funcao()
+    segundos = time.time() - inicio
+    with conn.cursor() as cur:
+        cur.execute('DROP TABLE IF EXISTS "' + tabela + '";')
+    conn.commit()
+    print(nome.ljust(8) + str(linhas).rjust(10) + ' linhas ' + ('%.2f' % segundos).rjust(9) + ' s ' +
+          str(round(linhas / segundos)).rjust(10) + ' linhas/s')
+    return segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark to_sql x COPY')
+    parser.add_argument('--linhas', type=int, default=200000, help='linhas sintéticas por teste')
+    parser.add_argument('--env', default=os.path.join(pathlib.Path().resolve(), '.env'),
+                        help='caminho do arquivo .env')
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=args.env)
+    db = {'user': os.getenv('DB_USER'), 'passw': os.getenv('DB_PASSWORD'), 'host': os.getenv('DB_HOST'),
+          'port': os.getenv('DB_PORT'), 'database': os.getenv('DB_NAME')}
+    engine, conn = carga.conectar(db)
+
+    df = dados_sinteticos(args.linhas)
+
+    t_to_sql = medir('to_sql', lambda: carga.gravar(df, 'benchmark_carga_to_sql', engine, conn, 'to_sql'),
+                     conn, 'benchmark_carga_to_sql', args.linhas)
+    def copy():
+        # A tabela do benchmark não tem DDL em tabelas.py: criada uma vez, antes do COPY
+        carga.criar_tabela(df, 'benchmark_carga_copy', engine)
+        return carga.gravar(df, 'benchmark_carga_copy', engine, conn, 'copy')
+
+    t_copy = medir('copy', copy, conn, 'benchmark_carga_copy', args.linhas)
+    print('COPY foi %.1fx mais rápido que o to_sql' % (t_to_sql / t_copy))
+
+    conn.close()
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
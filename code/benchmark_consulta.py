@@ -0,0 +1,118 @@
+'''
+Benchmark da consulta de cartões CNPJ (consulta.py): latência p50/p99 de
+consultas de um CNPJ e de lotes de CNPJs (padrão 1.000), sem o cache (cada
+consulta vai ao banco) e com o cache já preenchido, e das consultas de um
+CNPJ feitas por várias threads ao mesmo tempo, dividindo as
+LOOKUP_POOL_SIZE conexões do pool.
+
+Usa o banco do arquivo ".env", já carregado e com os índices criados. Os
+CNPJs consultados são sorteados de estabelecimento (TABLESAMPLE).
+
+Exemplo:
+    python benchmark_consulta.py --consultas 2000 --lotes 20 --tamanho-lote 1000 --threads 8
+'''
+import argparse
+import concurrent.futures
+import os
+import pathlib
+import random
+import time
+
+import numpy as np
+
+import consulta
+import pipeline
+
+
+def sortear_cnpjs(c, quantidade, seed=0):
+    '''
+    CNPJs (14 dígitos) sorteados de estabelecimento
+    '''
+    conn = c.pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT setseed(%s);', (seed / 1000,))
+            cur.execute('SELECT cnpj_basico, cnpj_ordem, cnpj_dv FROM estabelecimento TABLESAMPLE SYSTEM (1) '
+                        'ORDER BY random() LIMIT %s;', (quantidade,))
+            linhas = cur.fetchall()
+    finally:
+        c.pool.putconn(conn)
+    return ['%08d%04d%02d' % linha for linha in linhas]
+
+
+def latencias(funcao, entradas):
+    '''
+    Tempo (ms) de cada chamada de "funcao" com cada entrada
+    '''
+    tempos = []
+    for entrada in entradas:
+        inicio = time.perf_counter()
+        funcao(entrada)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def latencias_em_threads(funcao, entradas, threads):
+    '''
+    Tempo (ms) de cada chamada, com as entradas divididas entre "threads"
+    threads, e o tempo total (segundos)
+    '''
+    inicio = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        partes = pool.map(lambda i: latencias(funcao, entradas[i::threads]), range(threads))
+        tempos = [t for parte in partes for t in parte]
+    return tempos, time.perf_counter() - inicio
+
+
+def imprimir(nome, tempos, por_item=1, segundos=None):
+    # Com várias threads a vazão vem do tempo total, não da soma das latências
+    segundos = segundos or sum(tempos) / 1000
+    p50, p99 = np.percentile(tempos, [50, 99])
+    print(nome.ljust(32) + str(len(tempos)).rjust(7) + ' consultas   p50 ' + ('%.2f' % p50).rjust(9) + ' ms   p99 ' +
+          ('%.2f' % p99).rjust(9) + ' ms   ' + str(round(por_item * len(tempos) / segundos)).rjust(9) +
+          ' CNPJs/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da consulta de cartões CNPJ')
+    parser.add_argument('--consultas', type=int, default=2000, help='consultas de um CNPJ')
+    parser.add_argument('--lotes', type=int, default=20, help='consultas em lote')
+    parser.add_argument('--tamanho-lote', type=int, default=1000, help='CNPJs por lote')
+    parser.add_argument('--threads', type=int, help='threads consultando ao mesmo tempo (padrão: LOOKUP_POOL_SIZE)')
+    parser.add_argument('--env', default=os.path.join(pathlib.Path().resolve(), '.env'),
+                        help='caminho do arquivo .env')
+    args = parser.parse_args()
+    config = pipeline.configuracao(args.env)
+
+    conexoes = config['lookup_pool_size']
+    threads = args.threads or conexoes
+    print('Pool de ' + str(conexoes) + ' conexões, ' + str(threads) + ' threads nas consultas concorrentes')
+
+    with consulta.Consulta(config['db'], conexoes, tamanho_cache=0) as sem_cache:
+        cnpjs = sortear_cnpjs(sem_cache, max(args.consultas, args.lotes * args.tamanho_lote))
+        if not cnpjs:
+            print('Nenhum CNPJ em estabelecimento: carregue as tabelas antes do benchmark.')
+            return
+        print(str(len(cnpjs)) + ' CNPJs sorteados de estabelecimento')
+        unitarias = [random.Random(i).choice(cnpjs) for i in range(args.consultas)]
+        lotes = [random.Random(i).sample(cnpjs, min(args.tamanho_lote, len(cnpjs))) for i in range(args.lotes)]
+
+        # A primeira consulta em cada conexão prepara o statement
+        latencias_em_threads(sem_cache.buscar, cnpjs[:conexoes], conexoes)
+        imprimir('1 CNPJ, sem cache', latencias(sem_cache.buscar, unitarias))
+        imprimir('lote de ' + str(args.tamanho_lote) + ', sem cache', latencias(sem_cache.buscar_lote, lotes),
+                 args.tamanho_lote)
+        tempos, segundos = latencias_em_threads(sem_cache.buscar, unitarias, threads)
+        imprimir('1 CNPJ, ' + str(threads) + ' threads, sem cache', tempos, segundos=segundos)
+
+    with consulta.Consulta(config['db'], conexoes, config['lookup_cache_size'], config['lookup_cache_ttl']) as com_cache:
+        for lote in lotes:
+            com_cache.buscar_lote(lote)
+        com_cache.buscar_lote(unitarias)
+        imprimir('1 CNPJ, com cache', latencias(com_cache.buscar, unitarias))
+        imprimir('lote de ' + str(args.tamanho_lote) + ', com cache', latencias(com_cache.buscar_lote, lotes),
+                 args.tamanho_lote)
+
+
+if __name__ == '__main__':
+    main()
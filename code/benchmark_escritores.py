@@ -0,0 +1,94 @@
+'''
+Benchmark da fila de gravação: carrega arquivos ESTABELE sintéticos (ver
+dados_sinteticos.py) com a leitura e a gravação alternadas
+(WRITERS=0) e com a leitura numa thread e 1 ou mais escritores, cada um com
+a sua conexão (WRITERS=1, 2, ...).
+
+Usa as mesmas variáveis de conexão do arquivo ".env" e grava em tabelas
+temporárias (estabelecimento__benchmark e
+estabelecimento_cnae_secundaria__benchmark), que são apagadas no final.
+
+Exemplo:
+    python benchmark_escritores.py --linhas 1000000 --escritores 0,1,2,4
+'''
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+import carga
+import dados_sinteticos
+import tabelas
+
+SUFIXO = '__benchmark'
+
+
+def medir(escritores, arquivos, db, engine, conn, chunksize):
+    grupo = ['estabelecimento'] + tabelas.derivadas('estabelecimento')
+    with conn.cursor() as cur:
+        for nome in grupo:
+            cur.execute('DROP TABLE IF EXISTS "' + nome + SUFIXO + '";')
+    conn.commit()
+    for nome in grupo:
+        carga.preparar_tabela(nome, conn, SUFIXO)
+
+    inicio = time.time()
+    linhas = 0
+    for arquivo in arquivos:
+        linhas += carga.carregar_arquivo('estabelecimento', arquivo, engine, conn, 'copy', chunksize, SUFIXO,
+                                         db=db, escritores=escritores)
+    segundos = time.time() - inicio
+
+    with conn.cursor() as cur:
+        for nome in grupo:
+            cur.execute('DROP TABLE IF EXISTS "' + nome + SUFIXO + '";')
+    conn.commit()
+    return linhas, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da fila de gravação (WRITERS)')
+    parser.add_argument('--linhas', type=int, default=1000000, help='linhas de cada arquivo sintético')
+    parser.add_argument('--arquivos', type=int, default=2, help='quantidade de arquivos ESTABELE')
+    parser.add_argument('--chunksize', type=int, default=200000, help='linhas por parte')
+    parser.add_argument('--escritores', default='0,1,2,4', help='valores de WRITERS comparados')
+    parser.add_argument('--env', default=os.path.join(pathlib.Path().resolve(), '.env'),
+                        help='caminho do arquivo .env')
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=args.env)
+    db = {'user': os.getenv('DB_USER'), 'passw': os.getenv('DB_PASSWORD'), 'host': os.getenv('DB_HOST'),
+          'port': os.getenv('DB_PORT'), 'database': os.getenv('DB_NAME')}
+    engine, conn = carga.conectar(db)
+    # A leitura só avança enquanto a gravação espera o banco se houver CPU
+    # livre: com o PostgreSQL na mesma máquina e poucos núcleos não há ganho
+    print('Núcleos de CPU nesta máquina: ' + str(os.cpu_count()))
+
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivos = []
+        for i in range(args.arquivos):
+            arquivos.append(os.path.join(pasta, 'K3241.K03200Y%i.D30513.ESTABELE' % i))
+            dados_sinteticos.gerar_tabela('estabelecimento', arquivos[-1], args.linhas, seed=i)
+
+        resultados = {}
+        for escritores in [int(e) for e in args.escritores.split(',')]:
+            linhas, segundos = medir(escritores, arquivos, db, engine, conn, args.chunksize)
+            resultados[escritores] = segundos
+            print('WRITERS=' + str(escritores).ljust(3) + str(linhas).rjust(10) + ' linhas ' +
+                  ('%.2f' % segundos).rjust(9) + ' s ' + str(round(linhas / segundos)).rjust(10) + ' linhas/s')
+
+    if 0 in resultados:
+        for escritores, segundos in resultados.items():
+            if escritores:
+                print('WRITERS=%i: %.2fx a velocidade da leitura e gravação alternadas' %
+                      (escritores, resultados[0] / segundos))
+
+    conn.close()
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
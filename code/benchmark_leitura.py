@@ -0,0 +1,79 @@
+'''
+Benchmark da leitura dos CSVs: compara os leitores de READ_ENGINE
+(pd.read_csv e pyarrow.csv) lendo o mesmo arquivo, só o parse e o parse
+com os tratamentos (leitura.ler_partes). Não usa o banco de dados.
+
+Sem --arquivo, lê um arquivo ESTABELE sintético no formato da Receita.
+
+Exemplos:
+    python benchmark_leitura.py --linhas 2000000
+    python benchmark_leitura.py --arquivo C:\\...\\K3241.K03200Y0.D30513.ESTABELE --tabela estabelecimento
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import dados_sinteticos
+import leitura
+
+
+def medir_parse(tabela, arquivo, chunksize):
+    linhas = 0
+    with leitura.abrir_arquivo(arquivo) as f:
+        with leitura.leitor(f, tabela, chunksize) as reader:
+            while True:
+                try:
+                    linhas += len(reader.get_chunk(chunksize))
+                except StopIteration:
+                    return linhas
+
+
+def medir_partes(tabela, arquivo, chunksize):
+    return sum(len(df) for df in leitura.ler_partes(tabela, arquivo, chunksize))
+
+
+def comparar(tabela, arquivo, chunksize, motores):
+    tamanho = leitura.tamanho_arquivo(arquivo) / 1024 ** 2
+    print('Arquivo ' + leitura.nome_arquivo(arquivo) + ' (%.0f MB)' % tamanho)
+    resultados = {}
+    for motor in motores:
+        leitura.configurar(motor)
+        for nome, funcao in [('parse', medir_parse), ('parse+tratar', medir_partes)]:
+            inicio = time.time()
+            linhas = funcao(tabela, arquivo, chunksize)
+            segundos = time.time() - inicio
+            resultados[(motor, nome)] = segundos
+            print(motor.ljust(8) + nome.ljust(13) + str(linhas).rjust(10) + ' linhas ' +
+                  ('%.2f' % segundos).rjust(8) + ' s ' + ('%.1f' % (tamanho / segundos)).rjust(7) + ' MB/s ' +
+                  str(round(linhas / segundos)).rjust(9) + ' linhas/s')
+    if 'pandas' in motores:
+        for motor in motores:
+            if motor != 'pandas':
+                for nome in ['parse', 'parse+tratar']:
+                    print('%s foi %.2fx mais rápido que o pd.read_csv (%s)' %
+                          (motor, resultados[('pandas', nome)] / resultados[(motor, nome)], nome))
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos leitores de CSV (READ_ENGINE)')
+    parser.add_argument('--arquivo', help='CSV da Receita (sem ele, gera um ESTABELE sintético)')
+    parser.add_argument('--tabela', default='estabelecimento', help='tabela do arquivo (ver tabelas.py)')
+    parser.add_argument('--linhas', type=int, default=1000000, help='linhas do arquivo sintético')
+    parser.add_argument('--chunksize', type=int, default=500000, help='linhas por parte')
+    parser.add_argument('--motores', default=','.join(leitura.MOTORES_LEITURA), help='leitores comparados')
+    args = parser.parse_args()
+    motores = args.motores.split(',')
+
+    if args.arquivo:
+        comparar(args.tabela, args.arquivo, args.chunksize, motores)
+        return
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivo = os.path.join(pasta, 'K3241.K03200Y0.D30513.ESTABELE')
+        dados_sinteticos.gerar_tabela('estabelecimento', arquivo, args.linhas)
+        comparar('estabelecimento', arquivo, args.chunksize, motores)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+'''
+Busca por nome: razao_social (empresa) e nome_fantasia (estabelecimento).
+
+Com SEARCH_INDEX os nomes são normalizados na leitura de cada parte, em
+colunas <coluna>_busca (razao_social_busca, nome_fantasia_busca): sem
+acentos, em maiúsculas, só letras, números e espaços, e sem as
+terminações de tipo de empresa (LTDA, ME, EPP, EIRELI, S/A, ...). Depois da
+carga essas colunas recebem índices GIN do pg_trgm (trigramas), que servem
+tanto à busca por prefixo (LIKE 'COPEL%') quanto à busca aproximada
+(word_similarity), em vez de percorrer as 45 milhões de linhas de empresa.
+
+buscar() normaliza o termo do mesmo jeito e ordena o resultado: primeiro
+os nomes que começam com o termo, depois os mais parecidos.
+'''
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import tabelas
+
+LIMIAR_PADRAO = 0.5
+LIMITE_PADRAO = 20
+
+# Terminações retiradas do fim do nome (já sem pontuação: "S/A" vira "S A")
+SUFIXOS = ['LTDA', 'LIMITADA', 'ME', 'EPP', 'EIRELI', 'MEI', 'S A', 'SA', 'SS', 'S S']
+_RE_SUFIXOS = r'(?:\s+(?:' + '|'.join(SUFIXOS) + r'))+$'
+
+# Os workers em processos (fork) herdam estes valores do processo principal
+_config = {'ativa': False}
+
+
+def configurar(ativa=False):
+    _config['ativa'] = bool(ativa)
+    return _config['ativa']
+
+
+def ativa():
+    return _config['ativa']
+
+
+def normalizar(serie):
+    '''
+    Nomes normalizados para a busca, com as funções vetorizadas do
+    pyarrow.compute (várias vezes mais rápidas que o .str com NFKD)
+    '''
+    nomes = pa.array(serie, type=pa.string(), from_pandas=True)
+    nomes = pc.utf8_normalize(pc.utf8_upper(nomes), 'NFKD')
+    # Acentos viram marcas separadas (Ã -> A + ~) no NFKD
+    nomes = pc.replace_substring_regex(nomes, r'\p{Mn}+', '')
+    nomes = pc.utf8_trim_whitespace(pc.replace_substring_regex(nomes, '[^A-Z0-9]+', ' '))
+    nomes = pc.replace_substring_regex(nomes, _RE_SUFIXOS, '')
+    nomes = pc.if_else(pc.equal(nomes, ''), pa.scalar(None, pa.string()), nomes)
+    return nomes.to_pandas().set_axis(serie.index)
+
+
+def normalizar_termo(termo):
+    '''
+    Termo de busca normalizado como os nomes gravados ('' se não sobrar
+    nenhuma letra ou número)
+    '''
+    normalizado = normalizar(pd.Series([str(termo)]))[0]
+    return normalizado if isinstance(normalizado, str) else ''
+
+
+def resolver(tabela, df):
+    '''
+    Com SEARCH_INDEX, acrescenta ao dataframe as colunas de busca da tabela
+    (ver "busca" em tabelas.py)
+    '''
+    if not _config['ativa']:
+        return df
+    for coluna, nome in tabelas.colunas_busca(tabela):
+        df[nome] = normalizar(df[coluna]).astype(df[coluna].dtype)
+    return df
+
+
+#%%
+def criar_extensao(conn):
+    with conn.cursor() as cur:
+        cur.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+    conn.commit()
+
+
+def sql_busca(aproximada=False):
+    '''
+    Busca nas colunas de busca de todas as tabelas, uma subconsulta por
+    coluna (cada uma usa o índice GIN dela). A busca por prefixo para no
+    "limite" de linhas sem ordenar todos os nomes encontrados (um prefixo
+    comum como "COMERCIO" encontra milhões); a aproximada ordena pela
+    semelhança os nomes acima do limiar.
+    '''
+    consultas = []
+    for tabela, spec in tabelas.TABELAS.items():
+        for coluna, nome in tabelas.colunas_busca(tabela):
+            chave = ', '.join(c if c in spec['colunas'] else 'NULL::smallint AS ' + c
+                              for c in ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv'])
+            if aproximada:
+                filtro = '%(termo)s <%% ' + nome + ' AND ' + nome + ' NOT LIKE %(prefixo)s ORDER BY similaridade DESC'
+            else:
+                filtro = nome + ' LIKE %(prefixo)s'
+            consultas.append('(SELECT ' + chave + ', ' + coluna + ' AS nome, \'' + coluna + '\' AS campo, ' +
+                             'word_similarity(%(termo)s, ' + nome + ') AS similaridade FROM ' + tabela +
+                             ' WHERE ' + filtro + ' LIMIT %(limite)s)')
+    return ('SELECT * FROM (' + '\nUNION ALL\n'.join(consultas) + ') busca '
+            'ORDER BY similaridade DESC, length(nome) LIMIT %(limite)s;')
+
+
+def buscar(conn, termo, limite=LIMITE_PADRAO, limiar=LIMIAR_PADRAO):
+    '''
+    Empresas e estabelecimentos pelo nome: lista de dicionários
+    (cnpj_basico, cnpj_ordem, cnpj_dv, nome, campo, prefixo,
+    similaridade), primeiro os nomes que começam com o termo e, se não
+    chegarem a "limite", os mais parecidos (word_similarity >= limiar).
+    Termos com menos de 3 letras não usam os índices de trigramas.
+    '''
+    termo = normalizar_termo(termo)
+    if not termo:
+        return []
+    parametros = {'termo': termo, 'prefixo': termo + '%', 'limite': limite}
+    resultado = []
+    with conn.cursor() as cur:
+        # Só nesta transação: o limiar do operador <% usado nos índices
+        cur.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true);", (str(limiar),))
+        for aproximada in (False, True):
+            cur.execute(sql_busca(aproximada), parametros)
+            colunas = [d[0] for d in cur.description]
+            resultado += [dict(zip(colunas, linha), prefixo=not aproximada) for linha in cur.fetchall()]
+            parametros['limite'] = limite - len(resultado)
+            if parametros['limite'] <= 0:
+                break
+    conn.rollback()
+    return resultado
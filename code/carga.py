@@ -0,0 +1,420 @@
+import io
+import queue
+import sys
+import threading
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from sqlalchemy import create_engine
+
+import busca
+import dimensoes
+import leitura
+import manifesto
+import metricas
+import particoes
+import tabelas
+import tratamentos
+
+
+# Métodos de gravação aceitos na variável WRITE_METHOD do ".env":
+#  - copy: COPY ... FROM STDIN alimentado por um buffer em memória (padrão)
+#  - copy_csv: COPY ... FROM STDIN lendo direto o arquivo extraído
+#  - to_sql: DataFrame.to_sql em pedaços (INSERTs via SQLAlchemy, mais lento)
+METODOS_GRAVACAO = ['copy', 'copy_csv', 'to_sql']
+METODO_PADRAO = 'copy'
+
+# Partes já lidas e tratadas esperando a gravação: a leitura fica no
+# máximo FILA_PARTES partes à frente dos escritores
+FILA_PARTES = 2
+_FIM = None  # fim da leitura, na fila
+
+
+#%%
+def to_sql(dataframe, **kwargs):
+    '''
+    Quebra em pedacos a tarefa de inserir registros no banco
+    '''
+    size = 4096  #TODO param
+    total = len(dataframe)
+    name = kwargs.get('name')
+
+    def chunker(df):
+        return (df[i:i + size] for i in range(0, len(df), size))
+
+    for i, df in enumerate(chunker(dataframe)):
+        df.to_sql(**kwargs)
+        index = i * size
+        percent = (index * 100) / total
+        progress = f'{name} {percent:.2f}% {index:0{len(str(total))}}/{total}'
+        sys.stdout.write(f'\r{progress}')
+    sys.stdout.write('\n')
+
+
+#%%
+def colunas_sql(columns):
+    '''
+    Lista de colunas entre aspas para usar no comando COPY
+    '''
+    return ', '.join('"' + str(c) + '"' for c in columns)
+
+
+def criar_tabela(dataframe, name, engine):
+    '''
+    Cria a tabela (se ainda não existir) com os mesmos tipos que o to_sql
+    usaria, mas sem inserir registros. O COPY precisa da tabela pronta:
+    chamada uma vez por tabela, antes das partes, e só nas tabelas sem
+    DDL (as da Receita são criadas antes com preparar_tabela).
+    '''
+    dataframe.head(0).to_sql(name=name, con=engine, if_exists='append', index=False)
+
+
+def copy_dataframe(dataframe, name, conn, size=200000, commit=True):
+    '''
+    Grava o dataframe com COPY ... FROM STDIN, serializando em CSV num
+    buffer em memória. O buffer é montado em pedaços de "size" linhas para
+    não duplicar o dataframe inteiro na memória. Com commit=False quem
+    chama faz o commit (ex.: junto com o manifesto da carga).
+
+    Um dataframe lido com o pyarrow (READ_ENGINE=pyarrow) é serializado
+    pelo próprio Arrow (pyarrow.csv.write_csv, em C++), direto dos buffers
+    Arrow e sem converter os textos para objetos Python.
+    '''
+    if leitura.colunas_arrow(dataframe):
+        return _copy_arrow(dataframe, name, conn, size, commit)
+    sql = ('COPY "' + name + '" (' + colunas_sql(dataframe.columns) + ') '
+           "FROM STDIN WITH (FORMAT csv, DELIMITER ';', NULL '')")
+    with conn.cursor() as cur:
+        for i in range(0, len(dataframe), size):
+            buffer = io.StringIO()
+            dataframe[i:i + size].to_csv(buffer, sep=';', header=False, index=False, date_format='%Y-%m-%d')
+            buffer.seek(0)
+            cur.copy_expert(sql, buffer)
+    if commit:
+        conn.commit()
+    return len(dataframe)
+
+
+def _copy_arrow(dataframe, name, conn, size=200000, commit=True):
+    # Datas (timestamp) viram date32 e as categorias (dictionary) voltam a
+    # ser texto, que é o que o write_csv sabe escrever. Nulos saem como
+    # campo vazio sem aspas e textos sempre entre aspas, como no COPY.
+    table = pa.Table.from_pandas(dataframe, preserve_index=False)
+    campos = []
+    for f in table.schema:
+        if pa.types.is_timestamp(f.type):
+            f = f.with_type(pa.date32())
+        elif pa.types.is_dictionary(f.type):
+            f = f.with_type(f.type.value_type)
+        campos.append(f)
+    table = table.cast(pa.schema(campos))
+    opcoes = pa_csv.WriteOptions(include_header=False, delimiter=';')
+    sql = ('COPY "' + name + '" (' + colunas_sql(dataframe.columns) + ') '
+           "FROM STDIN WITH (FORMAT csv, DELIMITER ';', NULL '', ENCODING 'UTF8')")
+    with conn.cursor() as cur:
+        for i in range(0, table.num_rows, size):
+            buffer = io.BytesIO()
+            pa_csv.write_csv(table.slice(i, size), buffer, opcoes)
+            buffer.seek(0)
+            cur.copy_expert(sql, buffer)
+    if commit:
+        conn.commit()
+    return len(dataframe)
+
+
+def copy_csv(file_path, name, columns, conn, encoding='LATIN1', commit=True):
+    '''
+    Grava o arquivo extraído (ou o membro do .zip) direto no banco com
+    COPY ... FROM STDIN, sem passar pelo pandas. Os campos vazios entre
+    aspas ("") viram NULL, do mesmo jeito que acontece no pd.read_csv.
+    '''
+    colunas = colunas_sql(columns)
+    sql = ('COPY "' + name + '" (' + colunas + ') '
+           "FROM STDIN WITH (FORMAT csv, DELIMITER ';', QUOTE '\"', "
+           "ENCODING '" + encoding + "', FORCE_NULL (" + colunas + '))')
+    with conn.cursor() as cur:
+        with leitura.abrir_arquivo(file_path) as f:
+            cur.copy_expert(sql, f, size=1024 * 1024)
+        linhas = cur.rowcount
+    if commit:
+        conn.commit()
+    return linhas
+
+
+def gravar(dataframe, name, engine, conn, metodo=METODO_PADRAO, commit=True):
+    '''
+    Grava o dataframe no banco pelo método escolhido e retorna o número de
+    linhas gravadas. O to_sql grava pelo engine (outra conexão) e faz o
+    próprio commit, fora da transação do manifesto: por isso a carga com
+    to_sql não é retomada (ver RESUME em pipeline.py). O COPY precisa da tabela pronta, criada uma vez antes
+    das partes: preparar_tabela nas tabelas da Receita e criar_tabela nas
+    outras.
+    '''
+    if metodo == 'to_sql':
+        to_sql(dataframe, name=name, con=engine, if_exists='append', index=False)
+        return len(dataframe)
+
+    return copy_dataframe(dataframe, name, conn, commit=commit)
+
+
+#%%
+def conectar(db):
+    '''
+    Abre a conexão com o banco a partir do dicionário com os dados do ".env"
+    (user, passw, host, port, database). Retorna (engine, conn).
+    '''
+    engine = create_engine('postgresql://'+db['user']+':'+db['passw']+'@'+db['host']+':'+db['port']+'/'+db['database'])
+    conn = psycopg2.connect('dbname='+db['database']+' '+'user='+db['user']+' '+'host='+db['host']+' '+'port='+db['port']+' '+'password='+db['passw'])
+    return engine, conn
+
+
+def preparar_tabela(tabela, conn, sufixo='', unlogged=False):
+    '''
+    Cria a tabela (tabela + sufixo) com os tipos do esquema em tabelas.py,
+    antes de começar a carga. Assim os workers em paralelo não disputam a
+    criação da tabela. Com DENORMALIZE entram as colunas de descrição e
+    com SEARCH_INDEX as colunas de busca e com PARTITIONS as partições
+    (ver particoes.py).
+    '''
+    clausula, ddl_particoes = '', []
+    if particoes.chave(tabela):
+        clausula, ddl_particoes = particoes.ddl(tabela, tabela + sufixo, sufixo, unlogged)
+    with conn.cursor() as cur:
+        cur.execute(tabelas.ddl(tabela, tabela + sufixo, unlogged, dimensoes.desnormalizar(), busca.ativa(), clausula))
+        for sql in ddl_particoes:
+            cur.execute(sql)
+    conn.commit()
+    if clausula:
+        particoes.verificar(conn, tabela, tabela + sufixo)
+
+
+def _gravar_particoes(tabela, df, engine, conn, metodo, sufixo):
+    '''
+    Grava a parte em cada partição da tabela + sufixo (ou na própria
+    tabela, se ela não é particionada) e retorna o número de linhas
+    '''
+    linhas = 0
+    for destino, pedaco in particoes.rotear(tabela, tabela + sufixo, df, sufixo):
+        linhas += gravar(pedaco, destino, engine, conn, metodo, commit=False)
+    return linhas
+
+
+def _gravar_parte(tabela, df, parte, arquivo, engine, conn, metodo, sufixo):
+    '''
+    Grava a parte na tabela + sufixo e nas tabelas derivadas dela (ex.:
+    estabelecimento_cnae_secundaria), na mesma transação e sem commit. Com
+    PARTITIONS cada linha vai direto para a sua partição.
+    Retorna o número de linhas gravadas na tabela.
+    '''
+    with metricas.etapa('write', tabela, arquivo, parte) as m:
+        m['linhas'] = _gravar_particoes(tabela, df, engine, conn, metodo, sufixo)
+    for derivada in tabelas.derivadas(tabela):
+        with metricas.etapa('transform', derivada, arquivo, parte) as md:
+            filho = tratamentos.explodir(df, derivada)
+            md['linhas'] = len(filho)
+        with metricas.etapa('write', derivada, arquivo, parte) as md:
+            md['linhas'] = _gravar_particoes(derivada, filho, engine, conn, metodo, sufixo)
+        del filho
+    return m['linhas']
+
+
+def _confirmar(conn, destino, release, arquivo, partes, linhas, concluido=False):
+    '''
+    Registra as partes no manifesto (com "release") e faz o commit junto
+    com a parte gravada
+    '''
+    if release is not None:
+        manifesto.registrar_parte(conn, destino, release, arquivo, partes, linhas, concluido=concluido)
+    conn.commit()
+
+
+#%%
+class _Ordem:
+    '''
+    Vez de cada parte fazer o commit. Os escritores gravam as partes ao
+    mesmo tempo, cada um na sua conexão, mas o commit (junto com o
+    manifesto) segue a ordem do arquivo: as partes gravadas são sempre as
+    primeiras do arquivo e a carga continua podendo ser retomada.
+    Também guarda o primeiro erro, que interrompe a leitura e os escritores.
+    '''
+    def __init__(self, proxima):
+        self.proxima = proxima
+        self.erro = None
+        self.cond = threading.Condition()
+
+    def esperar(self, parte):
+        '''
+        Espera a vez da parte; retorna False se a carga foi interrompida
+        '''
+        with self.cond:
+            self.cond.wait_for(lambda: self.proxima == parte or self.erro is not None)
+            return self.erro is None
+
+    def passar(self):
+        with self.cond:
+            self.proxima += 1
+            self.cond.notify_all()
+
+    def falhar(self, erro):
+        with self.cond:
+            if self.erro is None:
+                self.erro = erro
+            self.cond.notify_all()
+
+
+def _colocar(fila, item, ordem):
+    # put com timeout para não ficar preso na fila cheia se a carga parou
+    while ordem.erro is None:
+        try:
+            fila.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _retirar(fila, ordem):
+    while ordem.erro is None:
+        try:
+            return fila.get(timeout=1)
+        except queue.Empty:
+            continue
+    return _FIM
+
+
+def _ler_em_fila(partes, fila, ordem):
+    '''
+    Thread de leitura: lê e trata as partes e coloca na fila. Com a fila
+    cheia a leitura espera os escritores.
+    '''
+    try:
+        for item in partes:
+            if not _colocar(fila, item, ordem):
+                return
+            del item
+    except BaseException as erro:
+        ordem.falhar(erro)
+        return
+    _colocar(fila, _FIM, ordem)
+
+
+def _escrever(fila, ordem, total, tabela, arquivo, engine, conn, metodo, sufixo, release):
+    '''
+    Thread de gravação: grava as partes da fila na sua conexão e faz o
+    commit de cada uma na vez dela
+    '''
+    destino = tabela + sufixo
+    try:
+        while True:
+            item = _retirar(fila, ordem)
+            if item is _FIM:
+                # Avisa os outros escritores que a leitura terminou
+                _colocar(fila, _FIM, ordem)
+                return
+            parte, df = item
+            del item
+            linhas = _gravar_parte(tabela, df, parte, arquivo, engine, conn, metodo, sufixo)
+            del df
+            if not ordem.esperar(parte):
+                conn.rollback()
+                return
+            total['linhas'] += linhas
+            total['partes'] = parte + 1
+            _confirmar(conn, destino, release, arquivo, total['partes'], total['linhas'])
+            print('Arquivo ' + arquivo + ' / ' + str(parte) + ' inserido com sucesso no banco de dados!')
+            ordem.passar()
+    except BaseException as erro:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+        ordem.falhar(erro)
+
+
+def carregar_arquivo(tabela, file_path, engine, conn, metodo=METODO_PADRAO, chunksize=None, sufixo='', release=None,
+                     db=None, escritores=1, fila=FILA_PARTES):
+    '''
+    Lê o arquivo extraído em partes de "chunksize" linhas e grava na
+    tabela (ou em tabela + sufixo, ex.: a tabela de stage da carga
+    incremental). Retorna o número de linhas gravadas nesta execução.
+
+    A leitura roda numa thread e coloca as partes numa fila de até "fila"
+    partes; "escritores" threads gravam as partes da fila, a primeira na
+    conexão "conn" e as outras em conexões abertas com "db". Assim a parte
+    N+1 é lida e tratada enquanto a parte N é gravada. Com escritores=0 a
+    leitura e a gravação se alternam na mesma thread.
+
+    Com "release", cada parte é registrada no manifesto (ver manifesto.py)
+    na mesma transação em que é gravada: um arquivo já concluído é pulado e
+    um arquivo interrompido continua da primeira linha ainda não gravada.
+    '''
+    destino = tabela + sufixo
+    arquivo = leitura.nome_arquivo(file_path)
+
+    gravado = {'partes': 0, 'linhas': 0, 'concluido': False}
+    if release is not None:
+        gravado = manifesto.partes_gravadas(conn, destino, release).get(arquivo, gravado)
+    if gravado['concluido']:
+        print('Arquivo ' + arquivo + ' já foi carregado (' + str(gravado['linhas']) + ' linhas), pulando.')
+        return 0
+    print('Trabalhando no arquivo: ' + arquivo + ' [...]')
+
+    if metodo == 'copy_csv' and tabelas.copia_direta(tabela):
+        # Um COPY só para o arquivo inteiro: ou ele todo está gravado, ou nada
+        with metricas.etapa('write', tabela, arquivo, 0) as m:
+            linhas = copy_csv(file_path, destino, tabelas.TABELAS[tabela]['colunas'], conn, commit=False)
+            _confirmar(conn, destino, release, arquivo, 1, linhas, concluido=True)
+            m['linhas'] = linhas
+            m['bytes'] = leitura.tamanho_arquivo(file_path)
+        print('Arquivo ' + arquivo + ' inserido com sucesso no banco de dados!')
+        return linhas
+
+    total = {'partes': gravado['partes'], 'linhas': gravado['linhas']}
+    if total['partes']:
+        print('Continuando o arquivo ' + arquivo + ' a partir da parte ' + str(total['partes']) +
+              ' (' + str(total['linhas']) + ' linhas já gravadas)')
+    partes = enumerate(leitura.ler_partes(tabela, file_path, chunksize, pular=total['linhas']), total['partes'])
+
+    if escritores <= 0:
+        for parte, df in partes:
+            total['linhas'] += _gravar_parte(tabela, df, parte, arquivo, engine, conn, metodo, sufixo)
+            total['partes'] = parte + 1
+            _confirmar(conn, destino, release, arquivo, total['partes'], total['linhas'])
+            print('Arquivo ' + arquivo + ' / ' + str(parte) + ' inserido com sucesso no banco de dados!')
+            del df
+    else:
+        # Sem os dados do banco não dá para abrir outras conexões
+        conexoes = [(engine, conn)] + [conectar(db) for _ in range(escritores - 1 if db is not None else 0)]
+        ordem = _Ordem(total['partes'])
+        fila_partes = queue.Queue(maxsize=max(fila, 1))
+        threads = [threading.Thread(target=_ler_em_fila, args=(partes, fila_partes, ordem), daemon=True)]
+        threads += [threading.Thread(target=_escrever, daemon=True,
+                                     args=(fila_partes, ordem, total, tabela, arquivo, e, c, metodo, sufixo, release))
+                    for e, c in conexoes]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            for e, c in conexoes[1:]:
+                c.close()
+                e.dispose()
+        if ordem.erro is not None:
+            raise ordem.erro
+
+    if release is not None:
+        _confirmar(conn, destino, release, arquivo, total['partes'], total['linhas'], concluido=True)
+    return total['linhas'] - gravado['linhas']
+
+
+#%%
+def velocidade(name, linhas, segundos):
+    '''
+    Imprime a velocidade de gravação (linhas por segundo) da tabela
+    '''
+    por_segundo = linhas / segundos if segundos > 0 else 0
+    print('Velocidade de carga de ' + name + ': ' + str(linhas) + ' linhas em ' +
+          str(round(segundos)) + ' segundos (' + str(round(por_segundo)) + ' linhas/s)')
+    return por_segundo
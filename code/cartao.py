@@ -0,0 +1,125 @@
+'''
+Tabela cartao_cnpj: uma linha por estabelecimento com os dados da
+empresa, do Simples/MEI, as descrições das tabelas de códigos e até 10
+CNAEs secundários em colunas (cnae_secundaria_1 ... cnae_secundaria_10,
+com as descrições), no formato de Outros/consulta_cnpj_receita_base_dos_dados.sql.
+Ler um CNPJ passa a ser a busca de uma linha pela primary key, sem os
+joins entre as tabelas de 48 milhões de linhas.
+
+A tabela é montada uma vez por release, depois da carga e dos índices
+(etapa "card"), com CREATE TABLE AS em paralelo (o PostgreSQL divide a
+leitura de estabelecimento entre max_parallel_workers_per_gather
+processos). Como na carga com troca (ver troca.py), ela é montada em
+cartao_cnpj__new, UNLOGGED, recebe os índices e troca de lugar com a
+tabela em uso numa única transação: as consultas continuam usando a
+tabela da release anterior até a nova estar pronta.
+
+Os CNAEs secundários são gravados em estabelecimento como array
+(cnae_fiscal_secundaria integer[]), então cada coluna é um item do array
+(cnae_fiscal_secundaria[1], ...), sem row_number()/CASE.
+'''
+import time
+
+import incremental
+import indices
+import troca
+
+TABELA = 'cartao_cnpj'
+CNAES_SECUNDARIAS = 10
+PARALELO_PADRAO = 4
+
+# (nome, colunas) dos índices, como em tabelas.py ("chave_primaria" e "indices")
+CHAVE_PRIMARIA = ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv']
+INDICES = [('cartao_cnpj_cnpj', ['cnpj']),
+           ('cartao_cnpj_cnae', ['cnae_fiscal_principal']),
+           ('cartao_cnpj_uf_municipio', ['uf', 'municipio'])]
+
+
+def sql_select():
+    '''
+    SELECT que monta as linhas da tabela cartao_cnpj
+    '''
+    secundarias = []
+    joins = []
+    for i in range(1, CNAES_SECUNDARIAS + 1):
+        secundarias.append('est.cnae_fiscal_secundaria[%i] AS cnae_secundaria_%i, '
+                           'c%i.descricao AS cnae_secundaria_%i_descricao' % (i, i, i, i))
+        joins.append('LEFT JOIN cnae c%i ON c%i.codigo = est.cnae_fiscal_secundaria[%i]' % (i, i, i))
+    return '''
+SELECT lpad(est.cnpj_basico::text, 8, '0') || lpad(est.cnpj_ordem::text, 4, '0') || lpad(est.cnpj_dv::text, 2, '0') AS cnpj,
+       est.cnpj_basico, est.cnpj_ordem, est.cnpj_dv,
+       emp.razao_social, est.nome_fantasia, est.identificador_matriz_filial,
+       est.situacao_cadastral, est.data_situacao_cadastral,
+       est.motivo_situacao_cadastral, moti.descricao AS motivo_situacao_cadastral_descricao,
+       est.data_inicio_atividade,
+       emp.natureza_juridica, natju.descricao AS natureza_juridica_descricao,
+       emp.qualificacao_responsavel, quals.descricao AS qualificacao_responsavel_descricao,
+       emp.capital_social, emp.porte_empresa, emp.ente_federativo_responsavel,
+       est.tipo_logradouro, est.logradouro, est.numero, est.complemento, est.bairro, est.cep,
+       est.uf, est.municipio, munic.descricao AS municipio_descricao,
+       est.nome_cidade_exterior, est.pais, pais.descricao AS pais_descricao,
+       est.ddd_1, est.telefone_1, est.ddd_2, est.telefone_2, est.ddd_fax, est.fax, est.correio_eletronico,
+       est.situacao_especial, est.data_situacao_especial,
+       est.cnae_fiscal_principal, cnae.descricao AS cnae_fiscal_principal_descricao,
+       ''' + ',\n       '.join(secundarias) + ''',
+       coalesce(cardinality(est.cnae_fiscal_secundaria), 0) AS quantidade_cnae_secundaria,
+       simp.opcao_pelo_simples, simp.data_opcao_simples, simp.data_exclusao_simples,
+       simp.opcao_mei, simp.data_opcao_mei, simp.data_exclusao_mei
+FROM estabelecimento est
+LEFT JOIN empresa emp ON emp.cnpj_basico = est.cnpj_basico
+LEFT JOIN simples simp ON simp.cnpj_basico = est.cnpj_basico
+LEFT JOIN moti ON moti.codigo = est.motivo_situacao_cadastral
+LEFT JOIN pais ON pais.codigo = est.pais
+LEFT JOIN cnae ON cnae.codigo = est.cnae_fiscal_principal
+LEFT JOIN munic ON munic.codigo = est.municipio
+LEFT JOIN natju ON natju.codigo = emp.natureza_juridica
+LEFT JOIN quals ON quals.codigo = emp.qualificacao_responsavel
+''' + '\n'.join(joins)
+
+
+def lista_indices(sufixo=''):
+    '''
+    Lista de (tabela, nome, sql) dos índices da tabela, no formato de
+    indices.lista_indices
+    '''
+    destino = TABELA + sufixo
+    colunas = ', '.join('"' + c + '"' for c in CHAVE_PRIMARIA)
+    lista = [(destino, TABELA + '_pkey' + sufixo,
+              'ALTER TABLE "' + destino + '" ADD CONSTRAINT "' + TABELA + '_pkey' + sufixo +
+              '" PRIMARY KEY (' + colunas + ');')]
+    for nome, colunas in INDICES:
+        colunas = ', '.join('"' + c + '"' for c in colunas)
+        lista.append((destino, nome + sufixo,
+                      'CREATE INDEX IF NOT EXISTS "' + nome + sufixo + '" ON "' + destino + '" (' + colunas + ');'))
+    return lista
+
+
+def montar(db, conn, paralelo=PARALELO_PADRAO, index_workers=4, maintenance_work_mem=None, paralelo_por_indice=None,
+           logged=True):
+    '''
+    Monta a tabela cartao_cnpj da release carregada e troca pela tabela em
+    uso (se todos os índices foram criados). Retorna o número de linhas
+    da tabela nova.
+    '''
+    nova = TABELA + troca.SUFIXO_NOVA
+    inicio = time.time()
+    with conn.cursor() as cur:
+        for tabela in ['estabelecimento', 'empresa', 'simples']:
+            if not incremental.existe_tabela(cur, tabela):
+                raise RuntimeError('A tabela ' + tabela + ' não existe: rode a carga antes da etapa card.')
+        cur.execute('DROP TABLE IF EXISTS "' + nova + '";')
+        cur.execute('SET max_parallel_workers_per_gather = %s;', (paralelo,))
+        cur.execute('CREATE UNLOGGED TABLE "' + nova + '" WITH (autovacuum_enabled = false) AS ' + sql_select() + ';')
+        linhas = cur.rowcount
+    conn.commit()
+    print('Tabela ' + nova + ' montada: ' + str(linhas) + ' linhas em ' + str(round(time.time() - inicio)) +
+          ' segundos')
+
+    indices_criados = indices.criar_indices(db, conn, index_workers, maintenance_work_mem, paralelo_por_indice,
+                                            lista=lista_indices(troca.SUFIXO_NOVA))
+    # Com erro num índice (ex.: CNPJ duplicado na primary key) a tabela em
+    # uso fica no lugar
+    trocar = troca.sem_erros([TABELA], indices_criados)
+    troca.finalizar(conn, trocar, logged)
+    troca.trocar(conn, trocar)
+    return linhas
@@ -0,0 +1,160 @@
+'''
+Catálogo dos .zip da Receita: o que foi publicado e o que já foi baixado.
+
+A listagem do site (página "Index of" do servidor) é lida uma vez só por
+execução, pelos links (href) dos .zip, com a data de modificação e o
+tamanho de cada arquivo mostrados na própria listagem. Se o site organiza
+as releases em pastas (AAAA-MM/), vale a pasta mais recente.
+
+O catálogo local ("catalogo.json" em OUTPUT_FILES_PATH) guarda de cada
+.zip baixado a release, a data e o tamanho da listagem, o tamanho em
+bytes, o ETag e o Last-Modified do servidor e o SHA-256 do arquivo. Um
+.zip com a mesma data e tamanho na listagem, e que continua no disco com o
+mesmo tamanho, não é baixado de novo nem consultado com HEAD: uma noite
+sem release nova termina só com a leitura da listagem.
+'''
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import urllib.parse
+
+import bs4 as bs
+
+ARQUIVO_CATALOGO = 'catalogo.json'
+TAMANHO_BLOCO = 1024 * 1024  # bytes lidos por vez no checksum
+
+_RE_PASTA = re.compile(r'^(\d{4}-\d{2})/$')
+_RE_DATA = re.compile(r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}|\d{2}-[A-Za-z]{3}-\d{4} \d{2}:\d{2}')
+_RE_TAMANHO = re.compile(r'(\d+(?:\.\d+)?[KMGT]?)\s*$')
+
+_lock = threading.Lock()
+
+
+def _data_iso(texto):
+    # As duas formas da listagem do Apache: 2023-05-14 10:20 e 14-May-2023 10:20
+    for formato in ('%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%d-%b-%Y %H:%M'):
+        try:
+            return datetime.datetime.strptime(texto, formato).isoformat(sep=' ', timespec='minutes')
+        except ValueError:
+            pass
+    return texto
+
+
+def _arquivos_da_pagina(html, url):
+    '''
+    {nome: {'url', 'modificado', 'tamanho_listagem'}} dos .zip e lista das
+    pastas de release de uma página de listagem
+    '''
+    pagina = bs.BeautifulSoup(html, 'lxml')
+    arquivos = {}
+    pastas = []
+    for link in pagina.find_all('a', href=True):
+        href = link['href']
+        pasta = _RE_PASTA.match(href)
+        if pasta:
+            pastas.append(pasta.group(1))
+            continue
+        if not urllib.parse.urlparse(href).path.lower().endswith('.zip'):
+            continue
+        nome = urllib.parse.unquote(href.rsplit('/', 1)[-1])
+        # Data e tamanho: nas células da mesma linha da tabela ou, na
+        # listagem em <pre>, no texto logo depois do link
+        linha = link.find_parent('tr')
+        if linha is not None:
+            texto = ' '.join(c.get_text(' ', strip=True) for c in linha.find_all('td'))
+        else:
+            texto = str(link.next_sibling or '')
+        data = _RE_DATA.search(texto)
+        tamanho = _RE_TAMANHO.search(texto)
+        arquivos[nome] = {'url': urllib.parse.urljoin(url, href),
+                          'modificado': _data_iso(data.group(0)) if data else None,
+                          'tamanho_listagem': tamanho.group(1) if tamanho else None}
+    return arquivos, sorted(pastas)
+
+
+def listar(sessao, dados_rf):
+    '''
+    Lê a listagem do site: (release, {nome do .zip: dados da listagem}).
+    A release é a pasta AAAA-MM mais recente ou, sem pastas, a data de
+    modificação mais recente dos arquivos.
+    '''
+    resposta = sessao.get(dados_rf)
+    resposta.raise_for_status()
+    arquivos, pastas = _arquivos_da_pagina(resposta.content, dados_rf)
+    if pastas:
+        release = pastas[-1]
+        url = urllib.parse.urljoin(dados_rf, release + '/')
+        resposta = sessao.get(url)
+        resposta.raise_for_status()
+        arquivos, _ = _arquivos_da_pagina(resposta.content, url)
+    else:
+        datas = [a['modificado'][:10] for a in arquivos.values() if a['modificado']]
+        release = max(datas) if datas else None
+    for dados in arquivos.values():
+        dados['release'] = release
+    return release, arquivos
+
+
+#%%
+def _caminho(output_files):
+    return os.path.join(output_files, ARQUIVO_CATALOGO)
+
+
+def ler(output_files):
+    '''
+    Dicionário {nome do .zip: dados} (vazio se não houver catálogo)
+    '''
+    caminho = _caminho(output_files)
+    if not os.path.isfile(caminho):
+        return {}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def checksum(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def atualizado(catalogo, nome, remoto, output_files):
+    '''
+    True se o .zip já baixado é o mesmo da listagem: mesma data e tamanho
+    na listagem e o arquivo continua no disco com o tamanho baixado. Sem
+    data na listagem não dá para saber (o download confere com HEAD).
+    '''
+    local = catalogo.get(nome)
+    caminho = os.path.join(output_files, nome)
+    if not local or not remoto or not remoto.get('modificado') or not os.path.isfile(caminho):
+        return False
+    return (local.get('modificado') == remoto['modificado'] and
+            local.get('tamanho_listagem') == remoto.get('tamanho_listagem') and
+            local.get('tamanho') == os.path.getsize(caminho))
+
+
+def registrar(output_files, baixados, workers=4):
+    '''
+    Grava no catálogo os .zip baixados: {nome: dados da listagem e do
+    servidor (etag, last_modified)}. O SHA-256 de cada arquivo é calculado
+    aqui, em "workers" threads (hashlib não segura o GIL).
+    '''
+    if not baixados:
+        return
+    nomes = list(baixados)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        somas = dict(zip(nomes, pool.map(lambda n: checksum(os.path.join(output_files, n)), nomes)))
+    with _lock:
+        catalogo = ler(output_files)
+        for nome, dados in baixados.items():
+            catalogo[nome] = dict(dados, tamanho=os.path.getsize(os.path.join(output_files, nome)),
+                                  sha256=somas[nome], em=datetime.datetime.now().isoformat(timespec='seconds'))
+        temporario = _caminho(output_files) + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(catalogo, f, indent=1, ensure_ascii=False)
+        os.replace(temporario, _caminho(output_files))
@@ -0,0 +1,281 @@
+'''
+Consulta do "cartão CNPJ": o registro completo de um estabelecimento pelo
+CNPJ de 14 dígitos, com os dados da empresa, do Simples/MEI, as descrições
+das tabelas de códigos, os CNAEs secundários e os sócios.
+
+Um lote de CNPJs é consultado numa ida só ao banco: os CNPJs vão como
+arrays (cnpj_basico, cnpj_ordem, cnpj_dv) para um prepared statement
+(PREPARE/EXECUTE, planejado uma vez por conexão), que usa o índice
+estabelecimento_cnpj e os índices de cnpj_basico das outras tabelas. As
+conexões vêm de um pool (psycopg2.pool.ThreadedConnectionPool), abertas
+todas de uma vez e reaproveitadas, então a mesma Consulta pode ser usada
+por várias threads (com mais threads que conexões, as outras esperam uma
+conexão livre).
+
+Os registros consultados ficam num cache LRU em memória com validade
+(TTL): os CNPJs mais consultados não voltam ao banco até expirar. CNPJs
+não encontrados também entram no cache (como None).
+
+Exemplo:
+    import consulta, pipeline
+    with consulta.abrir(pipeline.configuracao('.env')) as c:
+        c.buscar('00000000000191')
+        c.buscar_lote(['00000000000191', '33000167000101'])
+'''
+import collections
+import re
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+
+CONEXOES_PADRAO = 4
+TAMANHO_CACHE_PADRAO = 100000
+TTL_CACHE_PADRAO = 3600  # segundos
+
+# A posição de cada CNPJ no lote (WITH ORDINALITY) liga a linha ao CNPJ pedido
+SQL_CARTAO = '''
+PREPARE cartao_cnpj (integer[], smallint[], smallint[]) AS
+SELECT alvo.posicao,
+       est.cnpj_basico, est.cnpj_ordem, est.cnpj_dv,
+       est.identificador_matriz_filial, est.nome_fantasia,
+       est.situacao_cadastral, est.data_situacao_cadastral,
+       est.motivo_situacao_cadastral, moti.descricao AS motivo_situacao_cadastral_descricao,
+       est.nome_cidade_exterior, est.pais, pais.descricao AS pais_descricao,
+       est.data_inicio_atividade,
+       est.cnae_fiscal_principal, cnae.descricao AS cnae_fiscal_principal_descricao,
+       secundarias.cnaes AS cnae_fiscal_secundaria,
+       est.tipo_logradouro, est.logradouro, est.numero, est.complemento, est.bairro, est.cep, est.uf,
+       est.municipio, munic.descricao AS municipio_descricao,
+       est.ddd_1, est.telefone_1, est.ddd_2, est.telefone_2, est.ddd_fax, est.fax,
+       est.correio_eletronico, est.situacao_especial, est.data_situacao_especial,
+       emp.razao_social, emp.natureza_juridica, natju.descricao AS natureza_juridica_descricao,
+       emp.qualificacao_responsavel, quals.descricao AS qualificacao_responsavel_descricao,
+       emp.capital_social, emp.porte_empresa, emp.ente_federativo_responsavel,
+       simp.opcao_pelo_simples, simp.data_opcao_simples, simp.data_exclusao_simples,
+       simp.opcao_mei, simp.data_opcao_mei, simp.data_exclusao_mei,
+       soc.socios
+FROM unnest($1, $2, $3) WITH ORDINALITY AS alvo (cnpj_basico, cnpj_ordem, cnpj_dv, posicao)
+JOIN estabelecimento est
+  ON est.cnpj_basico = alvo.cnpj_basico AND est.cnpj_ordem = alvo.cnpj_ordem AND est.cnpj_dv = alvo.cnpj_dv
+LEFT JOIN empresa emp ON emp.cnpj_basico = est.cnpj_basico
+LEFT JOIN LATERAL (SELECT * FROM simples s WHERE s.cnpj_basico = est.cnpj_basico LIMIT 1) simp ON true
+LEFT JOIN moti ON moti.codigo = est.motivo_situacao_cadastral
+LEFT JOIN pais ON pais.codigo = est.pais
+LEFT JOIN cnae ON cnae.codigo = est.cnae_fiscal_principal
+LEFT JOIN munic ON munic.codigo = est.municipio
+LEFT JOIN natju ON natju.codigo = emp.natureza_juridica
+LEFT JOIN quals ON quals.codigo = emp.qualificacao_responsavel
+LEFT JOIN LATERAL (
+    SELECT json_agg(json_build_object('codigo', item.codigo, 'descricao', c.descricao) ORDER BY item.ordem) AS cnaes
+    FROM unnest(est.cnae_fiscal_secundaria) WITH ORDINALITY AS item (codigo, ordem)
+    LEFT JOIN cnae c ON c.codigo = item.codigo
+) secundarias ON true
+LEFT JOIN LATERAL (
+    SELECT json_agg(json_build_object(
+               'identificador_socio', s.identificador_socio,
+               'nome_socio_razao_social', s.nome_socio_razao_social,
+               'cpf_cnpj_socio', s.cpf_cnpj_socio,
+               'qualificacao_socio', s.qualificacao_socio,
+               'qualificacao_socio_descricao', q.descricao,
+               'data_entrada_sociedade', s.data_entrada_sociedade,
+               'pais', s.pais,
+               'representante_legal', s.representante_legal,
+               'nome_do_representante', s.nome_do_representante,
+               'qualificacao_representante_legal', s.qualificacao_representante_legal,
+               'faixa_etaria', s.faixa_etaria)
+           ORDER BY s.nome_socio_razao_social) AS socios
+    FROM socios s
+    LEFT JOIN quals q ON q.codigo = s.qualificacao_socio
+    WHERE s.cnpj_basico = est.cnpj_basico
+) soc ON true;
+'''
+EXECUTAR_CARTAO = 'EXECUTE cartao_cnpj (%s, %s, %s);'
+
+
+def normalizar_cnpj(cnpj):
+    '''
+    CNPJ com 14 dígitos, sem pontuação (aceita "00.000.000/0001-91", números
+    e CNPJs sem os zeros à esquerda). Erro (ValueError) se não for um CNPJ.
+    '''
+    digitos = re.sub(r'[.\-/\s]', '', str(cnpj))
+    if not digitos.isdigit() or len(digitos) > 14:
+        raise ValueError('CNPJ inválido: ' + str(cnpj))
+    return digitos.zfill(14)
+
+
+def partes_cnpj(cnpj):
+    '''
+    (cnpj_basico, cnpj_ordem, cnpj_dv) como gravados no banco (números)
+    '''
+    return int(cnpj[:8]), int(cnpj[8:12]), int(cnpj[12:])
+
+
+class CacheLRU:
+    '''
+    Cache LRU com validade: guarda até "tamanho" itens, descarta o usado há
+    mais tempo quando está cheio e trata como ausente o item guardado há
+    mais de "ttl" segundos. Pode ser usado por várias threads.
+    '''
+
+    def __init__(self, tamanho=TAMANHO_CACHE_PADRAO, ttl=TTL_CACHE_PADRAO):
+        self.tamanho = tamanho
+        self.ttl = ttl
+        self._itens = collections.OrderedDict()  # chave -> (validade, valor)
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def __len__(self):
+        return len(self._itens)
+
+    def buscar(self, chave):
+        '''
+        (True, valor) se a chave está no cache e não expirou, ou (False, None)
+        '''
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._itens[chave]
+                self.faltas += 1
+                return False, None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return True, item[1]
+
+    def guardar(self, chave, valor):
+        if self.tamanho <= 0:
+            return
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        '''
+        Esvazia o cache (ex.: depois de uma carga nova)
+        '''
+        with self._lock:
+            self._itens.clear()
+
+
+class _Conexao(psycopg2.extensions.connection):
+    # True depois do PREPARE de cartao_cnpj nesta conexão (uma conexão
+    # nova, aberta no lugar de uma com erro, começa sem o statement)
+    preparada = False
+
+
+class Consulta:
+    '''
+    Consulta de cartões CNPJ com um pool de até "conexoes" conexões e um
+    cache LRU de "tamanho_cache" registros válidos por "ttl" segundos
+    (tamanho_cache=0 desliga o cache)
+    '''
+
+    def __init__(self, db, conexoes=CONEXOES_PADRAO, tamanho_cache=TAMANHO_CACHE_PADRAO, ttl=TTL_CACHE_PADRAO):
+        # minconn = maxconn: o ThreadedConnectionPool fecha as conexões
+        # devolvidas acima de minconn, e cada conexão nova teria de preparar
+        # o statement de novo
+        self.pool = psycopg2.pool.ThreadedConnectionPool(conexoes, conexoes, dbname=db['database'], user=db['user'],
+                                                         host=db['host'], port=db['port'], password=db['passw'],
+                                                         connection_factory=_Conexao)
+        # O pool não espera por uma conexão livre (getconn falha com o pool
+        # esgotado): as threads além de "conexoes" esperam aqui
+        self._livres = threading.BoundedSemaphore(conexoes)
+        self.cache = CacheLRU(tamanho_cache, ttl)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.fechar()
+
+    def fechar(self):
+        self.pool.closeall()
+
+    def _conexao(self):
+        self._livres.acquire()
+        try:
+            conn = self.pool.getconn()
+        except Exception:
+            self._livres.release()
+            raise
+        if not conn.preparada:
+            try:
+                # Consultas só de leitura: autocommit evita deixar a conexão
+                # parada dentro de uma transação entre uma consulta e outra
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(SQL_CARTAO)
+                conn.preparada = True
+            except psycopg2.Error:
+                self._devolver(conn, fechar=True)
+                raise
+        return conn
+
+    def _devolver(self, conn, fechar=False):
+        self.pool.putconn(conn, close=fechar)
+        self._livres.release()
+
+    def _consultar(self, cnpjs):
+        '''
+        Registros dos CNPJs (já normalizados) no banco, numa consulta só.
+        Retorna {cnpj: registro}, sem os CNPJs não encontrados.
+        '''
+        partes = [partes_cnpj(c) for c in cnpjs]
+        conn = self._conexao()
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(EXECUTAR_CARTAO, ([p[0] for p in partes], [p[1] for p in partes],
+                                              [p[2] for p in partes]))
+                linhas = cur.fetchall()
+        except psycopg2.Error:
+            # A conexão com erro sai do pool (o prepared statement vai junto)
+            self._devolver(conn, fechar=True)
+            raise
+        self._devolver(conn)
+        registros = {}
+        for linha in linhas:
+            registro = dict(linha)
+            registros[cnpjs[registro.pop('posicao') - 1]] = registro
+        return registros
+
+    def buscar_lote(self, cnpjs):
+        '''
+        Cartões dos CNPJs: {cnpj de 14 dígitos: registro (dict) ou None, se
+        o CNPJ não existe}, na ordem recebida. Os CNPJs fora do cache são
+        consultados juntos, numa ida só ao banco.
+        '''
+        resultado = collections.OrderedDict((normalizar_cnpj(c), None) for c in cnpjs)
+        faltando = []
+        for cnpj in resultado:
+            achado, registro = self.cache.buscar(cnpj)
+            if achado:
+                resultado[cnpj] = registro
+            else:
+                faltando.append(cnpj)
+        if faltando:
+            registros = self._consultar(faltando)
+            for cnpj in faltando:
+                resultado[cnpj] = registros.get(cnpj)
+                self.cache.guardar(cnpj, resultado[cnpj])
+        return resultado
+
+    def buscar(self, cnpj):
+        '''
+        Cartão de um CNPJ (dict), ou None se o CNPJ não existe
+        '''
+        return self.buscar_lote([cnpj])[normalizar_cnpj(cnpj)]
+
+
+def abrir(config):
+    '''
+    Consulta com o banco e as opções LOOKUP_POOL_SIZE, LOOKUP_CACHE_SIZE e
+    LOOKUP_CACHE_TTL da configuração (ver pipeline.configuracao)
+    '''
+    return Consulta(config['db'], config['lookup_pool_size'], config['lookup_cache_size'], config['lookup_cache_ttl'])
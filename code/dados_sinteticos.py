@@ -0,0 +1,205 @@
+'''
+Gerador de dados sintéticos no formato dos arquivos da Receita: os mesmos
+nomes de arquivo (K3241.K03200Y0.D30513.EMPRECSV, ...), ";" como separador,
+todos os campos entre aspas, latin-1, sem cabeçalho, datas YYYYMMDD (com
+"0" e "00000000" de vez em quando), valores com vírgula decimal e CNAEs
+secundários separados por vírgula.
+
+As colunas são geradas a partir do esquema de tabelas.py, então um campo
+novo no esquema também aparece nos arquivos sintéticos. Os códigos das
+tabelas de fatos existem nas dimensões geradas junto (cnae, munic, ...) e
+os cnpj_basico de estabelecimento, socios e simples existem em empresa.
+
+Exemplo (gera os arquivos em /tmp/receita, com 1.000.000 de
+estabelecimentos e as outras tabelas na proporção da base real):
+    python dados_sinteticos.py /tmp/receita --linhas 1000000
+'''
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import tabelas
+
+# Quantidade de linhas de cada tabela em relação a estabelecimento, como
+# na base real (empresa = 45,8 mi, estabelecimento = 48,4 mi, socios =
+# 20,4 mi, simples = 27,9 mi). As dimensões têm tamanho fixo.
+PROPORCAO = {'empresa': 0.95, 'estabelecimento': 1.0, 'socios': 0.42, 'simples': 0.58}
+DIMENSOES = {'cnae': 1358, 'moti': 60, 'munic': 5571, 'natju': 90, 'pais': 255, 'quals': 68}
+
+# Nome dos arquivos como no site da Receita ({} = número do arquivo)
+NOMES = {'empresa': 'K3241.K03200Y{}.D30513.EMPRECSV',
+         'estabelecimento': 'K3241.K03200Y{}.D30513.ESTABELE',
+         'socios': 'K3241.K03200Y{}.D30513.SOCIOCSV',
+         'simples': 'F.K03200$W.SIMPLES.CSV.D30513',
+         'cnae': 'F.K03200$Z.D30513.CNAECSV',
+         'moti': 'F.K03200$Z.D30513.MOTICSV',
+         'munic': 'F.K03200$Z.D30513.MUNICCSV',
+         'natju': 'F.K03200$Z.D30513.NATJUCSV',
+         'pais': 'F.K03200$Z.D30513.PAISCSV',
+         'quals': 'F.K03200$Z.D30513.QUALSCSV'}
+
+UFS = ['SP', 'MG', 'RJ', 'RS', 'PR', 'BA', 'SC', 'GO', 'PE', 'CE', 'PA', 'ES', 'MA', 'MT', 'MS',
+       'DF', 'PB', 'RN', 'AL', 'PI', 'RO', 'TO', 'SE', 'AM', 'AP', 'AC', 'RR']
+# Valores das colunas "category" (códigos da Receita)
+CATEGORIAS = {'identificador_matriz_filial': ['1', '2'],
+              'porte_empresa': ['00', '01', '03', '05'],
+              'identificador_socio': ['1', '2', '3'],
+              'faixa_etaria': [str(i) for i in range(10)],
+              'opcao_pelo_simples': ['S', 'N', ''],
+              'opcao_mei': ['S', 'N', ''],
+              'uf': UFS}
+PALAVRAS = np.array(['COMERCIO', 'SERVICOS', 'INDUSTRIA', 'BRASIL', 'NACIONAL', 'ALIMENTOS', 'TRANSPORTES',
+                     'CONSTRUCOES', 'TECNOLOGIA', 'SAUDE', 'EDUCACAO', 'PARTICIPACOES', 'AGRICOLA', 'SÃO',
+                     'JOÃO', 'JOSÉ', 'CONCEIÇÃO', 'AÇÚCAR', 'MARIA', 'SILVA', 'SANTOS', 'OLIVEIRA'])
+
+
+def linhas_por_tabela(linhas_estabelecimento):
+    '''
+    Linhas de cada tabela para uma escala (linhas de estabelecimento)
+    '''
+    linhas = {t: max(int(linhas_estabelecimento * p), 1) for t, p in PROPORCAO.items()}
+    linhas.update(DIMENSOES)
+    return linhas
+
+
+def _codigos(tabela, rng):
+    # Códigos das dimensões: CNAE com 7 dígitos, os outros pequenos
+    if tabela == 'cnae':
+        return np.sort(rng.choice(np.arange(111301, 9900800), DIMENSOES['cnae'], replace=False))
+    if tabela == 'munic':
+        return np.sort(rng.choice(np.arange(1, 9999), DIMENSOES['munic'], replace=False))
+    return np.arange(DIMENSOES[tabela])
+
+
+def _texto(rng, linhas, palavras=3):
+    partes = [PALAVRAS[rng.integers(0, len(PALAVRAS), linhas)] for _ in range(palavras)]
+    return pd.Series(partes[0]).str.cat(partes[1:], sep=' ')
+
+
+def _datas(rng, linhas):
+    datas = (pd.Timestamp('1966-01-01') + pd.to_timedelta(rng.integers(0, 21000, linhas), 'D')).strftime('%Y%m%d')
+    datas = np.asarray(datas, dtype=object)
+    # A Receita usa "0" e "00000000" para datas sem valor
+    datas[rng.random(linhas) < 0.05] = '0'
+    datas[rng.random(linhas) < 0.05] = '00000000'
+    return datas
+
+
+def _coluna(tabela, coluna, dtype, tratamento, linhas, rng, codigos, cnpjs):
+    '''
+    Valores (texto, como no arquivo) de uma coluna do esquema
+    '''
+    dimensao = dict(tabelas.TABELAS[tabela].get('descricoes', [])).get(coluna)
+    if coluna == 'cnpj_basico':
+        return pd.Series(cnpjs).map('{:08d}'.format)
+    if coluna == 'cnpj_ordem':
+        # 0001, 0002, ... em cada cnpj_basico (os cnpjs vêm ordenados): o
+        # CNPJ completo não se repete, como na base real
+        return (pd.Series(cnpjs).groupby(cnpjs).cumcount() + 1).map('{:04d}'.format)
+    if coluna == 'cnpj_dv':
+        return pd.Series(rng.integers(0, 100, linhas)).map('{:02d}'.format)
+    if coluna == 'cep':
+        return pd.Series(rng.integers(1000000, 99999999, linhas)).map('{:08d}'.format)
+    if tratamento == 'data':
+        return _datas(rng, linhas)
+    if tratamento == 'decimal':
+        centavos = rng.integers(0, 10 ** 9, linhas)
+        return pd.Series(centavos // 100).astype(str) + ',' + pd.Series(centavos % 100).map('{:02d}'.format)
+    if tratamento == 'lista':
+        # 0 a 5 CNAEs secundários por linha, metade sem nenhum
+        itens = codigos['cnae'][rng.integers(0, len(codigos['cnae']), (linhas, 5))].astype(str)
+        quantidade = np.where(rng.random(linhas) < 0.5, 0, rng.integers(1, 6, linhas))
+        return [','.join(i[:q]) for i, q in zip(itens, quantidade)]
+    if dimensao is not None or coluna == 'cnae_fiscal_principal':
+        valores = codigos[dimensao or 'cnae']
+        return valores[rng.integers(0, len(valores), linhas)].astype(str)
+    if str(dtype) == 'category':
+        valores = np.array(CATEGORIAS.get(coluna, ['1', '2']))
+        return valores[rng.integers(0, len(valores), linhas)]
+    if str(dtype) in ('Int16', 'Int32'):
+        return rng.integers(0, 100, linhas).astype(str)
+    if coluna.startswith(('ddd', 'telefone', 'fax', 'numero')):
+        numeros = pd.Series(rng.integers(1, 10 ** (2 if coluna.startswith('ddd') else 8), linhas)).astype(str)
+        numeros[rng.random(linhas) < 0.3] = ''
+        return numeros
+    if coluna == 'cpf_cnpj_socio':
+        return '***' + pd.Series(rng.integers(0, 10 ** 6, linhas)).map('{:06d}'.format) + '**'
+    if coluna == 'correio_eletronico':
+        return pd.Series(rng.integers(0, 10 ** 6, linhas)).map('contato{}@exemplo.com.br'.format)
+    # Texto: metade vazia nos campos opcionais, nomes com acentos (latin-1)
+    texto = _texto(rng, linhas)
+    if coluna in ('razao_social', 'nome_socio_razao_social'):
+        return texto + ' LTDA'
+    texto[rng.random(linhas) < 0.5] = ''
+    return texto
+
+
+def gerar_tabela(tabela, caminho, linhas, seed=0, codigos=None, cnpjs=None):
+    '''
+    Grava um arquivo sintético da tabela com "linhas" linhas
+    '''
+    rng = np.random.default_rng(seed)
+    if codigos is None:
+        codigos = {d: _codigos(d, np.random.default_rng(seed)) for d in DIMENSOES}
+    if tabela in DIMENSOES:
+        codigo = pd.Series(codigos[tabela][:linhas])
+        df = pd.DataFrame({'codigo': codigo.map(('{:07d}' if tabela == 'cnae' else '{:04d}').format),
+                           'descricao': _texto(rng, len(codigo), 4)})
+    else:
+        if cnpjs is None:
+            cnpjs = np.arange(linhas)
+        cnpjs = np.sort(rng.choice(cnpjs, linhas, replace=len(cnpjs) < linhas))
+        df = pd.DataFrame({c[0]: _coluna(tabela, c[0], c[1], c[3] if len(c) > 3 else None, linhas, rng, codigos, cnpjs)
+                           for c in tabelas.TABELAS[tabela]['esquema']})
+    df.to_csv(caminho, sep=';', header=False, index=False, quoting=1, encoding='latin-1')
+    return caminho
+
+
+def gerar(pasta, linhas=None, arquivos=1, seed=0, nomes_tabelas=None):
+    '''
+    Gera os arquivos de todas as tabelas (ou só das informadas) em "pasta".
+    "linhas" é um dicionário {tabela: linhas} (padrão: linhas_por_tabela
+    de 100.000 estabelecimentos) e as tabelas de fatos são divididas em
+    "arquivos" arquivos, como os 10 arquivos de cada tabela da Receita.
+    Retorna a lista de arquivos gerados.
+    '''
+    linhas = linhas or linhas_por_tabela(100000)
+    nomes_tabelas = nomes_tabelas or list(NOMES)
+    os.makedirs(pasta, exist_ok=True)
+    codigos = {d: _codigos(d, np.random.default_rng(seed)) for d in DIMENSOES}
+    # cnpj_basico das empresas: as outras tabelas usam os mesmos
+    empresas = np.arange(linhas.get('empresa') or linhas_por_tabela(100000)['empresa']) * 7 + 1000
+
+    gerados = []
+    for tabela in nomes_tabelas:
+        if tabela not in NOMES or not linhas.get(tabela):
+            continue
+        if tabela in DIMENSOES:
+            gerados.append(gerar_tabela(tabela, os.path.join(pasta, NOMES[tabela]), linhas[tabela], seed, codigos))
+            continue
+        partes = np.array_split(np.arange(linhas[tabela]), arquivos if tabela != 'simples' else 1)
+        grupos = np.array_split(empresas, len(partes))
+        for i, (parte, grupo) in enumerate(zip(partes, grupos)):
+            nome = NOMES[tabela].format(i) if '{}' in NOMES[tabela] else NOMES[tabela]
+            gerados.append(gerar_tabela(tabela, os.path.join(pasta, nome), len(parte), seed + i, codigos, grupo))
+    return gerados
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera arquivos sintéticos no formato da Receita')
+    parser.add_argument('pasta', help='pasta onde os arquivos são gravados')
+    parser.add_argument('--linhas', type=int, default=100000, help='linhas de estabelecimento (as outras na proporção)')
+    parser.add_argument('--arquivos', type=int, default=1, help='arquivos por tabela de fatos')
+    parser.add_argument('--tabelas', help='tabelas separadas por vírgula (padrão: todas)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    gerados = gerar(args.pasta, linhas_por_tabela(args.linhas), args.arquivos, args.seed,
+                    args.tabelas.split(',') if args.tabelas else None)
+    for arquivo in gerados:
+        print(arquivo + ' (' + str(round(os.path.getsize(arquivo) / 1024 ** 2, 1)) + ' MB)')
+
+
+if __name__ == '__main__':
+    main()
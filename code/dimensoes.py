@@ -0,0 +1,122 @@
+'''
+Dimensões: as tabelas pequenas de códigos e descrições (cnae, moti, munic,
+natju, pais, quals). São lidas uma vez só, antes das tabelas de fatos, e
+ficam num cache em memória indexado pelo hash do conteúdo dos arquivos.
+Os workers em processos (fork) herdam o cache do processo principal.
+
+O hash da última carga de cada dimensão fica em controle_dimensoes: se o
+arquivo da release nova tem o mesmo conteúdo, a tabela não é recarregada.
+
+Com DENORMALIZE as tabelas de fatos recebem também as descrições (ex.:
+municipio -> municipio_descricao, cnae_fiscal_principal ->
+cnae_fiscal_principal_descricao), resolvidas na leitura de cada parte com
+Series.map (um hash join vetorizado), sem join no banco depois.
+'''
+import pandas as pd
+
+import tabelas
+
+_cache = {}   # hash do conteúdo -> DataFrame da dimensão
+_mapas = {}   # hash do conteúdo -> Series codigo -> descricao
+_atuais = {}  # dimensão -> hash do conteúdo da release sendo carregada
+
+# Os workers em processos (fork) herdam estes valores do processo principal
+_config = {'desnormalizar': False}
+
+
+def configurar(desnormalizar=False):
+    _config['desnormalizar'] = bool(desnormalizar)
+    return _config['desnormalizar']
+
+
+def desnormalizar():
+    return _config['desnormalizar']
+
+
+def em_cache(hash_dimensao):
+    '''
+    DataFrame já lido com esse conteúdo (ou None)
+    '''
+    return _cache.get(hash_dimensao)
+
+
+def guardar(tabela, hash_dimensao, df):
+    '''
+    Guarda a dimensão lida no cache e marca o hash como o da release atual
+    '''
+    _cache[hash_dimensao] = df
+    _atuais[tabela] = hash_dimensao
+
+
+def atual(tabela):
+    '''
+    (hash, DataFrame) da dimensão na release atual, ou (None, None)
+    '''
+    hash_dimensao = _atuais.get(tabela)
+    return hash_dimensao, _cache.get(hash_dimensao)
+
+
+def mapa(tabela):
+    '''
+    Series codigo -> descricao da dimensão na release atual (vazia se o
+    arquivo da dimensão não está entre os arquivos da carga)
+    '''
+    hash_dimensao, df = atual(tabela)
+    if df is None:
+        return pd.Series(dtype=object)
+    if hash_dimensao not in _mapas:
+        df = df.dropna(subset=['codigo']).drop_duplicates('codigo')
+        _mapas[hash_dimensao] = pd.Series(df['descricao'].to_numpy(), index=df['codigo'].astype('int64'))
+    return _mapas[hash_dimensao]
+
+
+def resolver(tabela, df):
+    '''
+    Com DENORMALIZE, acrescenta ao dataframe as colunas de descrição da
+    tabela (ver "descricoes" em tabelas.py)
+    '''
+    if not _config['desnormalizar']:
+        return df
+    for coluna, dimensao, nome in tabelas.colunas_descricao(tabela):
+        descricoes = mapa(dimensao)
+        # Sem a dimensão a coluna fica toda nula, mas continua texto
+        df[nome] = df[coluna].astype('Int64').map(descricoes).astype(descricoes.dtype)
+    return df
+
+
+#%%
+def criar_controle(conn):
+    '''
+    Tabela com o hash do conteúdo da última carga de cada dimensão
+    '''
+    with conn.cursor() as cur:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS controle_dimensoes (
+            tabela text PRIMARY KEY,
+            hash text NOT NULL,
+            linhas bigint,
+            atualizado_em timestamp NOT NULL DEFAULT now()
+        );
+        ''')
+    conn.commit()
+
+
+def inalterada(conn, tabela, hash_dimensao):
+    '''
+    True se a tabela existe e foi carregada com o mesmo conteúdo
+    '''
+    with conn.cursor() as cur:
+        cur.execute('SELECT to_regclass(%s) IS NOT NULL;', ('"' + tabela + '"',))
+        if not cur.fetchone()[0]:
+            return False
+        cur.execute('SELECT hash FROM controle_dimensoes WHERE tabela = %s;', (tabela,))
+        linha = cur.fetchone()
+    return linha is not None and linha[0] == hash_dimensao
+
+
+def registrar(conn, tabela, hash_dimensao, linhas):
+    with conn.cursor() as cur:
+        cur.execute('INSERT INTO controle_dimensoes (tabela, hash, linhas) VALUES (%s, %s, %s) '
+                    'ON CONFLICT (tabela) DO UPDATE SET hash = EXCLUDED.hash, linhas = EXCLUDED.linhas, '
+                    'atualizado_em = now();', (tabela, hash_dimensao, linhas))
+    conn.commit()
@@ -0,0 +1,200 @@
+'''
+Download dos arquivos da Receita: vários arquivos ao mesmo tempo numa
+requests.Session com pool de conexões, retomando downloads interrompidos
+com o cabeçalho HTTP Range.
+
+O arquivo é baixado em "<nome>.part" e só é renomeado para o nome final
+quando chega ao tamanho informado pelo servidor.
+'''
+import concurrent.futures
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metricas
+
+TAMANHO_BLOCO = 1024 * 1024  # bytes gravados por vez
+SUFIXO_PARCIAL = '.part'
+
+
+def criar_sessao(workers):
+    '''
+    Session com um pool de conexões do tamanho do número de workers
+    '''
+    sessao = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=3)
+    sessao.mount('http://', adapter)
+    sessao.mount('https://', adapter)
+    return sessao
+
+
+class Progresso:
+    '''
+    Bytes baixados por arquivo, compartilhado entre as threads. Guarda o
+    início de cada arquivo para calcular a vazão (MB/s) individual e total.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arquivos = {}
+        self.inicio = time.time()
+
+    def iniciar(self, nome, total, ja_baixado):
+        with self.lock:
+            self.arquivos[nome] = {'total': total, 'baixado': ja_baixado, 'retomado': ja_baixado,
+                                   'inicio': time.time(), 'fim': None}
+
+    def somar(self, nome, n):
+        with self.lock:
+            self.arquivos[nome]['baixado'] += n
+
+    def finalizar(self, nome):
+        with self.lock:
+            self.arquivos[nome]['fim'] = time.time()
+
+    def baixado_agora(self, nome):
+        '''
+        Bytes do arquivo baixados nesta execução
+        '''
+        with self.lock:
+            a = self.arquivos.get(nome)
+            return a['baixado'] - a['retomado'] if a else 0
+
+    def vazao(self, nome):
+        '''
+        MB/s do arquivo (só conta o que foi baixado nesta execução)
+        '''
+        with self.lock:
+            a = self.arquivos[nome]
+            segundos = (a['fim'] or time.time()) - a['inicio']
+            return (a['baixado'] - a['retomado']) / 1024 / 1024 / segundos if segundos > 0 else 0
+
+    def resumo(self):
+        '''
+        Bytes no disco, bytes baixados nesta execução, total e MB/s agregado
+        '''
+        with self.lock:
+            no_disco = sum(a['baixado'] for a in self.arquivos.values())
+            baixado = sum(a['baixado'] - a['retomado'] for a in self.arquivos.values())
+            total = sum(a['total'] for a in self.arquivos.values())
+        segundos = time.time() - self.inicio
+        return {'no_disco': no_disco, 'baixado': baixado, 'total': total,
+                'mb_s': baixado / 1024 / 1024 / segundos if segundos > 0 else 0}
+
+
+def cabecalhos_remotos(sessao, url):
+    '''
+    Tamanho, ETag e Last-Modified do arquivo no servidor (HEAD)
+    '''
+    response = sessao.head(url, allow_redirects=True)
+    response.raise_for_status()
+    return {'tamanho': int(response.headers.get('content-length', 0)), 'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified')}
+
+
+def baixar_arquivo(sessao, url, file_name, progresso=None):
+    '''
+    Baixa "url" em "file_name", retomando o ".part" se ele existir.
+    Retorna (baixado, cabeçalhos do servidor), com baixado False se o
+    arquivo já estava completo no disco.
+    '''
+    nome = os.path.basename(file_name)
+    remoto = cabecalhos_remotos(sessao, url)
+    total = remoto['tamanho']
+
+    # Arquivo completo já baixado (mesmo tamanho do servidor)
+    if os.path.isfile(file_name) and os.path.getsize(file_name) == total:
+        return False, remoto
+
+    parcial = file_name + SUFIXO_PARCIAL
+    ja_baixado = os.path.getsize(parcial) if os.path.isfile(parcial) else 0
+    if ja_baixado > total:
+        ja_baixado = 0
+
+    if ja_baixado < total or total == 0:
+        headers = {}
+        if ja_baixado > 0:
+            headers['Range'] = 'bytes=%d-' % ja_baixado
+
+        with sessao.get(url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                # Servidor não aceitou o Range: começa do zero
+                ja_baixado = 0
+            if progresso is not None:
+                progresso.iniciar(nome, total, ja_baixado)
+            with open(parcial, 'ab' if ja_baixado > 0 else 'wb') as f:
+                for bloco in response.iter_content(chunk_size=TAMANHO_BLOCO):
+                    f.write(bloco)
+                    if progresso is not None:
+                        progresso.somar(nome, len(bloco))
+    elif progresso is not None:
+        # ".part" já completo (a execução anterior parou antes de renomear)
+        progresso.iniciar(nome, total, ja_baixado)
+
+    tamanho = os.path.getsize(parcial)
+    if total and tamanho != total:
+        raise IOError('Download incompleto de ' + nome + ': ' + str(tamanho) + ' de ' + str(total) + ' bytes')
+    os.replace(parcial, file_name)
+    if progresso is not None:
+        progresso.finalizar(nome)
+    return True, remoto
+
+
+def _relatorio(progresso, parar, intervalo):
+    # Uma linha por intervalo (sem "\r"), para não poluir logs
+    while not parar.wait(intervalo):
+        r = progresso.resumo()
+        if r['total']:
+            print('Download: %.1f%% [%d / %d] bytes - %.2f MB/s' % (r['no_disco'] * 100 / r['total'],
+                                                                     r['no_disco'], r['total'], r['mb_s']))
+
+
+def baixar_arquivos(urls, output_files, workers=4, intervalo=10):
+    '''
+    Baixa a lista de urls em "output_files" com "workers" downloads ao
+    mesmo tempo. Retorna um dicionário com o resultado de cada arquivo
+    (baixado, MB/s, ETag e Last-Modified do servidor, ou o erro) e a vazão
+    agregada.
+    '''
+    sessao = criar_sessao(workers)
+    progresso = Progresso()
+    resultado = {}
+
+    parar = threading.Event()
+    relatorio = threading.Thread(target=_relatorio, args=(progresso, parar, intervalo), daemon=True)
+    relatorio.start()
+
+    def baixar(url):
+        nome = url.rsplit('/', 1)[-1]
+        with metricas.etapa('download', arquivo=nome) as m:
+            baixado, remoto = baixar_arquivo(sessao, url, os.path.join(output_files, nome), progresso)
+            m['bytes'] = progresso.baixado_agora(nome)
+        return baixado, remoto
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futuros = {pool.submit(baixar, url): url for url in urls}
+        for futuro in concurrent.futures.as_completed(futuros):
+            nome = futuros[futuro].rsplit('/', 1)[-1]
+            try:
+                baixado, remoto = futuro.result()
+                cabecalhos = {'etag': remoto['etag'], 'last_modified': remoto['last_modified']}
+                if baixado:
+                    resultado[nome] = dict(cabecalhos, baixado=True, mb_s=progresso.vazao(nome))
+                    print('Arquivo ' + nome + ' baixado (%.2f MB/s)' % resultado[nome]['mb_s'])
+                else:
+                    resultado[nome] = dict(cabecalhos, baixado=False, mb_s=0)
+                    print('Arquivo ' + nome + ' já está atualizado')
+            except Exception as erro:
+                resultado[nome] = {'baixado': False, 'erro': str(erro)}
+                print('Erro no download de ' + nome + ': ' + str(erro))
+
+    parar.set()
+    relatorio.join()
+    sessao.close()
+
+    r = progresso.resumo()
+    print('Download finalizado: %d bytes baixados (%.2f MB/s no total)' % (r['baixado'], r['mb_s']))
+    return resultado, r['mb_s']
@@ -0,0 +1,135 @@
+'''
+Carga incremental: em vez de apagar e recarregar as tabelas, cada release
+mensal é carregada em tabelas de stage (<tabela>__stage) e comparada com a
+tabela em uso por um hash do conteúdo de cada registro, agrupado pela chave
+da tabela (cnpj_basico; cnpj_basico + cnpj_ordem + cnpj_dv em
+estabelecimento). Só as inclusões, alterações e exclusões são aplicadas.
+
+Os hashes da última release aplicada ficam em <tabela>__hash, para não
+recalcular os da tabela em uso a cada mês, e a release aplicada de cada
+tabela fica registrada em controle_carga.
+'''
+import datetime
+import re
+
+import leitura
+import tabelas
+
+SUFIXO_STAGE = '__stage'
+SUFIXO_HASH = '__hash'
+
+
+def data_release(arquivos):
+    '''
+    Data da release a partir do nome dos arquivos da Receita
+    (ex.: K3241.K03200Y0.D30513.EMPRECSV -> D + último dígito do ano + mês +
+    dia = 2023-05-13). Sem data no nome, usa a data de hoje.
+    '''
+    hoje = datetime.date.today()
+    for arquivo in arquivos:
+        m = re.search(r'\.D(\d)(\d{2})(\d{2})\.', leitura.nome_arquivo(arquivo))
+        if m:
+            ano = hoje.year - ((hoje.year - int(m.group(1))) % 10)
+            return datetime.date(ano, int(m.group(2)), int(m.group(3)))
+    return hoje
+
+
+def existe_tabela(cur, nome):
+    cur.execute('SELECT to_regclass(%s) IS NOT NULL;', ('"' + nome + '"',))
+    return cur.fetchone()[0]
+
+
+def criar_controle(conn):
+    '''
+    Tabela com as releases aplicadas em cada tabela
+    '''
+    with conn.cursor() as cur:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS controle_carga (
+            tabela text NOT NULL,
+            data_release date NOT NULL,
+            aplicado_em timestamp NOT NULL DEFAULT now(),
+            inseridos bigint,
+            atualizados bigint,
+            removidos bigint
+        );
+        ''')
+    conn.commit()
+
+
+def release_aplicada(conn, tabela, release):
+    '''
+    True se a release já foi aplicada na tabela
+    '''
+    with conn.cursor() as cur:
+        cur.execute('SELECT 1 FROM controle_carga WHERE tabela = %s AND data_release = %s;', (tabela, release))
+        return cur.fetchone() is not None
+
+
+def sql_hash(origem, chave):
+    '''
+    SELECT com um hash por chave: md5 dos md5 de cada linha do grupo, em
+    ordem, para não depender da ordem física das linhas.
+    '''
+    colunas = ', '.join('"' + c + '"' for c in chave)
+    return ('SELECT ' + colunas + ', '
+            "md5(string_agg(md5(t::text), '' ORDER BY md5(t::text))) AS hash "
+            'FROM "' + origem + '" t GROUP BY ' + colunas)
+
+
+def aplicar(conn, tabela, release):
+    '''
+    Aplica as diferenças entre <tabela>__stage e <tabela> numa única
+    transação e registra a release em controle_carga. Retorna a quantidade
+    de chaves inseridas, atualizadas e removidas.
+    '''
+    chave = tabelas.TABELAS[tabela]['chave']
+    stage = tabela + SUFIXO_STAGE
+    hashes = tabela + SUFIXO_HASH
+    igual = ' AND '.join('t."' + c + '" = d."' + c + '"' for c in chave)
+    igual_stage = ' AND '.join('s."' + c + '" = d."' + c + '"' for c in chave)
+    colunas = ', '.join('"' + c + '"' for c in chave)
+
+    cur = conn.cursor()
+    cur.execute('DROP TABLE IF EXISTS "' + hashes + '_novo";')
+    cur.execute('CREATE TABLE "' + hashes + '_novo" AS ' + sql_hash(stage, chave) + ';')
+
+    if not existe_tabela(cur, tabela):
+        # Primeira carga: o stage vira a tabela
+        cur.execute('SELECT count(*) FROM "' + hashes + '_novo";')
+        contagem = {'I': cur.fetchone()[0], 'U': 0, 'D': 0}
+        cur.execute('ALTER TABLE "' + stage + '" RENAME TO "' + tabela + '";')
+    else:
+        if not existe_tabela(cur, hashes):
+            # Tabela carregada pela carga completa: calcula os hashes atuais
+            cur.execute('CREATE TABLE "' + hashes + '" AS ' + sql_hash(tabela, chave) + ';')
+
+        cur.execute('DROP TABLE IF EXISTS diferencas;')
+        cur.execute('CREATE TEMP TABLE diferencas AS '
+                    'SELECT ' + colunas + ', '
+                    "CASE WHEN a.hash IS NULL THEN 'I' WHEN n.hash IS NULL THEN 'D' ELSE 'U' END AS operacao "
+                    'FROM "' + hashes + '_novo" n FULL JOIN "' + hashes + '" a USING (' + colunas + ') '
+                    'WHERE n.hash IS DISTINCT FROM a.hash;')
+        cur.execute('SELECT operacao, count(*) FROM diferencas GROUP BY operacao;')
+        contagem = {'I': 0, 'U': 0, 'D': 0}
+        contagem.update(dict(cur.fetchall()))
+
+        # Alteração = remove o registro antigo e insere o novo
+        cur.execute('DELETE FROM "' + tabela + '" t USING diferencas d '
+                    'WHERE ' + igual + " AND d.operacao IN ('U', 'D');")
+        cur.execute('INSERT INTO "' + tabela + '" SELECT s.* FROM "' + stage + '" s '
+                    'JOIN diferencas d ON ' + igual_stage + " WHERE d.operacao IN ('I', 'U');")
+        cur.execute('DROP TABLE diferencas;')
+        cur.execute('DROP TABLE "' + stage + '";')
+
+    cur.execute('DROP TABLE IF EXISTS "' + hashes + '";')
+    cur.execute('ALTER TABLE "' + hashes + '_novo" RENAME TO "' + hashes + '";')
+    cur.execute('INSERT INTO controle_carga (tabela, data_release, inseridos, atualizados, removidos) '
+                'VALUES (%s, %s, %s, %s, %s);', (tabela, release, contagem['I'], contagem['U'], contagem['D']))
+    conn.commit()
+    cur.close()
+
+    print('Carga incremental de ' + tabela + ' (release ' + str(release) + '): ' +
+          str(contagem['I']) + ' inseridos, ' + str(contagem['U']) + ' atualizados, ' +
+          str(contagem['D']) + ' removidos')
+    return contagem
@@ -0,0 +1,125 @@
+'''
+Índices e primary keys, criados só depois da carga (criar os índices antes
+obrigaria o banco a atualizá-los a cada linha inserida).
+
+Os índices de cada tabela estão em tabelas.py ("indices" e
+"chave_primaria"). Cada um é criado numa conexão separada, vários ao mesmo
+tempo: CREATE INDEX em tabelas diferentes (ou na mesma tabela) não
+bloqueiam um ao outro. Em cada conexão são ajustados maintenance_work_mem
+(memória para ordenar o índice) e max_parallel_maintenance_workers
+(processos do PostgreSQL ajudando a criar cada índice).
+'''
+import concurrent.futures
+import time
+
+import psycopg2
+
+import busca
+import carga
+import metricas
+import tabelas
+
+MAINTENANCE_WORK_MEM_PADRAO = '1GB'
+PARALELO_POR_INDICE_PADRAO = 2
+
+
+def lista_indices(nomes_tabelas=None, sufixo=''):
+    '''
+    Lista de (tabela, nome, sql) com as primary keys e os índices
+    declarados em tabelas.py (e, com SEARCH_INDEX, os índices de busca). Com "sufixo" os índices são das tabelas
+    tabela + sufixo e os nomes também recebem o sufixo (ex.: as tabelas
+    novas da carga com troca, ver troca.py).
+    '''
+    lista = []
+    for tabela, spec in tabelas.TABELAS.items():
+        if nomes_tabelas is not None and tabela not in nomes_tabelas:
+            continue
+        destino = tabela + sufixo
+        if spec.get('chave_primaria'):
+            colunas = ', '.join('"' + c + '"' for c in spec['chave_primaria'])
+            nome = tabela + '_pkey' + sufixo
+            lista.append((destino, nome,
+                          'ALTER TABLE "' + destino + '" ADD CONSTRAINT "' + nome + '" PRIMARY KEY (' + colunas + ');'))
+        for nome, colunas in spec.get('indices', []):
+            colunas = ', '.join('"' + c + '"' for c in colunas)
+            lista.append((destino, nome + sufixo,
+                          'CREATE INDEX IF NOT EXISTS "' + nome + sufixo + '" ON "' + destino + '" (' + colunas + ');'))
+        # Índices de trigramas das colunas de busca (SEARCH_INDEX, ver busca.py)
+        for coluna in (tabelas.colunas_busca(tabela) if busca.ativa() else []):
+            nome = tabela + '_' + coluna[1]
+            lista.append((destino, nome + sufixo,
+                          'CREATE INDEX IF NOT EXISTS "' + nome + sufixo + '" ON "' + destino + '" USING gin ("' +
+                          coluna[1] + '" gin_trgm_ops);'))
+    return lista
+
+
+def ordenar_indices(conn, lista):
+    '''
+    Ordena pelo tamanho da tabela, do maior para o menor, como na carga
+    (ver paralelo.ordenar_tarefas): os índices de estabelecimento começam
+    primeiro e os das tabelas pequenas preenchem as conexões no final.
+    '''
+    tamanhos = {}
+    with conn.cursor() as cur:
+        for tabela in set(t[0] for t in lista):
+            # Tabela particionada: a soma das partições (PARTITIONS, ver particoes.py)
+            cur.execute('SELECT sum(pg_relation_size(relid)) FROM pg_partition_tree(to_regclass(%s));',
+                        ('"' + tabela + '"',))
+            tamanhos[tabela] = cur.fetchone()[0] or 0
+    return sorted(lista, key=lambda t: -tamanhos[t[0]])
+
+
+def _criar(db, tabela, nome, sql, maintenance_work_mem, paralelo_por_indice):
+    engine, conn = carga.conectar(db)
+    inicio = time.time()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SET maintenance_work_mem = %s;', (maintenance_work_mem,))
+            cur.execute('SET max_parallel_maintenance_workers = %s;', (paralelo_por_indice,))
+            # A primary key não tem "IF NOT EXISTS" (carga incremental: a
+            # tabela em uso já tem os índices da carga anterior)
+            cur.execute('SELECT to_regclass(%s) IS NOT NULL;', ('"' + nome + '"',))
+            if cur.fetchone()[0]:
+                return tabela, nome, None, None
+            with metricas.etapa('index', tabela, nome):
+                cur.execute(sql)
+                conn.commit()
+        return tabela, nome, None, time.time() - inicio
+    except psycopg2.Error as erro:
+        conn.rollback()
+        return tabela, nome, str(erro).strip(), time.time() - inicio
+    finally:
+        conn.close()
+        engine.dispose()
+
+
+def criar_indices(db, conn, workers=4, maintenance_work_mem=None, paralelo_por_indice=None, nomes_tabelas=None,
+                  sufixo='', lista=None):
+    '''
+    Cria as primary keys e os índices das tabelas com "workers" conexões ao
+    mesmo tempo. A memória usada no banco chega a workers x
+    maintenance_work_mem. Um índice com erro (ex.: código duplicado numa
+    primary key) é informado e não impede a criação dos outros.
+    Retorna um dicionário {nome: {'tabela', 'segundos', 'erro'}}, com
+    segundos None para os índices que já existiam. "lista" troca os índices
+    de tabelas.py por outros (tabela, nome, sql), ex.: os de cartao.py.
+    '''
+    maintenance_work_mem = maintenance_work_mem or MAINTENANCE_WORK_MEM_PADRAO
+    if paralelo_por_indice is None:
+        paralelo_por_indice = PARALELO_POR_INDICE_PADRAO
+    lista = ordenar_indices(conn, lista if lista is not None else lista_indices(nomes_tabelas, sufixo))
+
+    resultado = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futuros = [pool.submit(_criar, db, tabela, nome, sql, maintenance_work_mem, paralelo_por_indice)
+                   for tabela, nome, sql in lista]
+        for futuro in concurrent.futures.as_completed(futuros):
+            tabela, nome, erro, segundos = futuro.result()
+            resultado[nome] = {'tabela': tabela, 'segundos': segundos, 'erro': erro}
+            if erro:
+                print('Erro ao criar o índice ' + nome + ' em ' + tabela + ': ' + erro)
+            elif segundos is None:
+                print('Índice ' + nome + ' já existe em ' + tabela)
+            else:
+                print('Índice ' + nome + ' criado em ' + tabela + ' (' + str(round(segundos, 1)) + ' segundos)')
+    return resultado
@@ -0,0 +1,290 @@
+'''
+Leitura dos arquivos extraídos da Receita (CSV separado por ";" em latin-1).
+
+O leitor de CSV é escolhido na variável READ_ENGINE do ".env":
+ - pandas: pd.read_csv (motor C do pandas, numa thread só; cada texto vira
+   um objeto Python)
+ - pyarrow: pyarrow.csv, que lê blocos do arquivo em várias threads. Os
+   textos continuam em buffers Arrow (dtype "string[pyarrow]") até o COPY
+   (ver carga.copy_dataframe) ou o Parquet, sem colunas "object".
+'''
+import contextlib
+import hashlib
+import os
+import zipfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+import busca
+import dimensoes
+import memoria
+import metricas
+import tabelas
+import tratamentos
+
+
+MOTORES_LEITURA = ['pandas', 'pyarrow']
+MOTOR_PADRAO = 'pandas'
+BLOCO_ARROW = 16 * 1024 * 1024  # bytes lidos por vez por cada thread do pyarrow
+
+# Leitor escolhido para a execução. Os workers em processos (fork) herdam
+# este valor do processo principal.
+_config = {'motor': MOTOR_PADRAO}
+
+
+def configurar(motor=None):
+    '''
+    Define o leitor de CSV da execução (pandas ou pyarrow)
+    '''
+    _config['motor'] = motor or MOTOR_PADRAO
+    return _config['motor']
+
+
+# Um arquivo de entrada pode ser o caminho do CSV extraído ou, na leitura
+# direta dos .zip (STREAM_ZIP), a tupla (caminho do .zip, nome do membro).
+def nome_arquivo(file_path):
+    '''
+    Nome do arquivo para as mensagens (o membro, no caso do .zip)
+    '''
+    if isinstance(file_path, tuple):
+        return file_path[1]
+    return os.path.basename(file_path)
+
+
+def tamanho_arquivo(file_path):
+    '''
+    Tamanho em bytes do CSV (descompactado, no caso do .zip)
+    '''
+    if isinstance(file_path, tuple):
+        with zipfile.ZipFile(file_path[0], 'r') as zip_ref:
+            return zip_ref.getinfo(file_path[1]).file_size
+    return os.path.getsize(file_path)
+
+
+@contextlib.contextmanager
+def abrir_arquivo(file_path):
+    '''
+    Abre o arquivo em modo binário. O membro do .zip é descompactado aos
+    poucos, conforme é lido, sem gravar nada no disco.
+    '''
+    if isinstance(file_path, tuple):
+        with zipfile.ZipFile(file_path[0], 'r') as zip_ref:
+            with zip_ref.open(file_path[1], 'r') as f:
+                yield f
+    else:
+        with open(file_path, 'rb') as f:
+            yield f
+
+
+def hash_conteudo(arquivos):
+    '''
+    sha256 do conteúdo dos arquivos (em ordem), inclusive de dentro dos .zip
+    '''
+    h = hashlib.sha256()
+    for file_path in sorted(arquivos, key=str):
+        with abrir_arquivo(file_path) as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(bloco)
+    return h.hexdigest()
+
+
+def arquivos_zip(output_files):
+    '''
+    Lista os membros de todos os .zip do diretório, no formato
+    (caminho do .zip, nome do membro), para ler sem extrair.
+    '''
+    membros = []
+    for l in sorted(os.listdir(output_files)):
+        if not l.endswith('.zip'):
+            continue
+        full_path = os.path.join(output_files, l)
+        with zipfile.ZipFile(full_path, 'r') as zip_ref:
+            for membro in zip_ref.namelist():
+                if not membro.endswith('/'):
+                    membros.append((full_path, membro))
+    return membros
+
+
+def tratar(tabela, df):
+    '''
+    Renomeia as colunas e aplica os tratamentos declarados no esquema da
+    tabela (ver tratamentos.py) antes da gravação. Com DENORMALIZE
+    acrescenta as descrições das dimensões (ver dimensoes.py) e com
+    SEARCH_INDEX os nomes normalizados para a busca (ver busca.py).
+    '''
+    spec = tabelas.TABELAS[tabela]
+
+    # Renomear colunas
+    df.columns = spec['colunas']
+
+    df = tratamentos.aplicar(df, spec['tratamentos'])
+    df = dimensoes.resolver(tabela, df)
+    return busca.resolver(tabela, df)
+
+
+def _tipo_arrow(dtype):
+    '''
+    dtype da leitura em tabelas.py -> tipo da coluna no pyarrow.csv
+    '''
+    return {'Int16': pa.int16(), 'Int32': pa.int32(), 'Int64': pa.int64(),
+            'category': pa.dictionary(pa.int32(), pa.string())}.get(str(dtype), pa.string())
+
+
+def _tipo_pandas(tipo):
+    # Arrow -> pandas: textos continuam em Arrow e inteiros viram os
+    # inteiros com NA do pandas (os mesmos do pd.read_csv)
+    if tipo in (pa.string(), pa.large_string()):
+        return pd.StringDtype('pyarrow')
+    return {pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(), pa.int64(): pd.Int64Dtype()}.get(tipo)
+
+
+class LeitorArrow:
+    '''
+    Leitor de CSV do pyarrow com a mesma interface do leitor do read_csv
+    (get_chunk(linhas)). Segue as regras do pd.read_csv para os arquivos
+    da Receita: ";" como separador, aspas duplas, latin-1, sem cabeçalho e
+    campo vazio como nulo.
+    '''
+    def __init__(self, f, tabela, pular=0):
+        spec = tabelas.TABELAS[tabela]
+        self.reader = pa_csv.open_csv(
+            f,
+            read_options=pa_csv.ReadOptions(encoding='latin-1', column_names=spec['colunas'],
+                                            block_size=BLOCO_ARROW),
+            parse_options=pa_csv.ParseOptions(delimiter=';', quote_char='"'),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={c: _tipo_arrow(spec['dtypes'][i]) for i, c in enumerate(spec['colunas'])},
+                strings_can_be_null=True, quoted_strings_can_be_null=True))
+        self.lidos = []  # blocos lidos e ainda não entregues
+        self.linhas_lidas = 0
+        # O skip_rows do pyarrow só pula linhas do primeiro bloco, então as
+        # linhas já gravadas são descartadas aqui, bloco a bloco
+        self.pular = pular
+
+    def get_chunk(self, linhas=None):
+        while linhas is None or self.linhas_lidas < linhas:
+            try:
+                bloco = self.reader.read_next_batch()
+            except StopIteration:
+                break
+            if self.pular:
+                descartar = min(self.pular, bloco.num_rows)
+                bloco, self.pular = bloco.slice(descartar), self.pular - descartar
+            self.lidos.append(bloco)
+            self.linhas_lidas += bloco.num_rows
+        if not self.linhas_lidas:
+            raise StopIteration
+        table = pa.Table.from_batches(self.lidos)
+        if linhas is not None:
+            table, resto = table.slice(0, linhas), table.slice(linhas)
+            self.lidos, self.linhas_lidas = resto.to_batches(), resto.num_rows
+        else:
+            self.lidos, self.linhas_lidas = [], 0
+        return table.to_pandas(types_mapper=_tipo_pandas)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.reader.close()
+
+
+def leitor(f, tabela, chunksize=None, pular=0):
+    '''
+    Leitor das partes do arquivo aberto "f" com o motor da execução
+    (READ_ENGINE); as partes são lidas com get_chunk(linhas)
+    '''
+    if _config['motor'] == 'pyarrow':
+        return LeitorArrow(f, tabela, pular)
+    return pd.read_csv(filepath_or_buffer=f,
+                       sep=';',
+                       chunksize=chunksize,
+                       skiprows=pular or None,
+                       header=None,
+                       dtype=tabelas.TABELAS[tabela]['dtypes'],
+                       encoding='latin-1',
+    )
+
+
+def colunas_arrow(df):
+    '''
+    True se o dataframe tem colunas de texto em Arrow (leitura com pyarrow)
+    '''
+    return any(isinstance(t, pd.ArrowDtype) or (isinstance(t, pd.StringDtype) and t.storage == 'pyarrow')
+               for t in df.dtypes)
+
+
+def ler_csv(tabela, file_path, nrows=None):
+    '''
+    Lê o arquivo inteiro (ou as primeiras "nrows" linhas) já tratado
+    '''
+    with abrir_arquivo(file_path) as f:
+        if _config['motor'] == 'pyarrow':
+            with LeitorArrow(f, tabela) as reader:
+                df = reader.get_chunk(nrows)
+        else:
+            df = pd.read_csv(filepath_or_buffer=f,
+                             sep=';',
+                             nrows=nrows,
+                             header=None,
+                             dtype=tabelas.TABELAS[tabela]['dtypes'],
+                             encoding='latin-1',
+            )
+    return tratar(tabela, df)
+
+
+def ler_partes(tabela, file_path, chunksize=None, pular=0):
+    '''
+    Gerador com as partes do arquivo, de no máximo "chunksize" linhas (se
+    não informado, usa o tamanho definido para a tabela). As primeiras
+    "pular" linhas (já gravadas numa execução anterior) são descartadas
+    pelo leitor de CSV, sem montar DataFrames.
+
+    O arquivo é aberto uma vez só e lido em sequência (read_csv com
+    chunksize, ou o leitor do pyarrow), então cada linha é lida
+    exatamente uma vez e a memória fica limitada ao tamanho de uma parte.
+    Antes cada parte era lida com nrows/skiprows, o que obrigava o pandas
+    a percorrer o arquivo desde o início a cada parte.
+
+    Com o orçamento de memória (MAX_MEMORY, ver memoria.py) o tamanho de
+    cada parte é calculado pelos bytes por linha observados, e "chunksize"
+    passa a ser só o limite máximo.
+    '''
+    dimensionador = memoria.dimensionador(chunksize)
+    if not chunksize:
+        chunksize = tabelas.TABELAS[tabela]['partes']
+    arquivo = nome_arquivo(file_path)
+    with abrir_arquivo(file_path) as f:
+        posicao = f.tell()
+        reader = leitor(f, tabela, dimensionador.proxima() if dimensionador else chunksize, pular)
+        with reader:
+            parte = 0
+            while True:
+                # parse (leitura do CSV) e transform (tratar) medidos em
+                # separado; "bytes" é o quanto o leitor avançou no arquivo
+                with metricas.etapa('parse', tabela, arquivo, parte) as m:
+                    try:
+                        df = reader.get_chunk(dimensionador.proxima() if dimensionador else chunksize)
+                    except StopIteration:
+                        df = None
+                    m['bytes'] = f.tell() - posicao
+                    posicao = f.tell()
+                    if df is None:
+                        m['ignorar'] = True
+                    else:
+                        m['linhas'] = len(df)
+                if df is None:
+                    break
+                with metricas.etapa('transform', tabela, arquivo, parte) as m:
+                    df = tratar(tabela, df)
+                    m['linhas'] = len(df)
+                if dimensionador:
+                    dimensionador.observar(df)
+                yield df
+                # A próxima parte só é lida depois que esta foi gravada
+                del df
+                if dimensionador:
+                    dimensionador.contrapressao()
+                parte += 1
@@ -0,0 +1,125 @@
+'''
+Manifesto da execução, para continuar uma carga interrompida em vez de
+começar tudo de novo.
+
+- Download e extração: "manifesto.json" em OUTPUT_FILES_PATH, com o
+  tamanho e a data de cada .zip baixado e os arquivos extraídos dele. Um
+  .zip já extraído (e que não mudou desde então) não é extraído de novo.
+- Carga no banco: tabela controle_partes, com as partes já gravadas de
+  cada arquivo (por tabela de destino e release). A linha do manifesto é
+  gravada na mesma transação da parte, então o que está no manifesto está
+  no banco e vice-versa. Ao reiniciar, as tabelas com partes gravadas não
+  são apagadas, os arquivos concluídos são pulados e os demais continuam
+  da primeira linha ainda não gravada.
+'''
+import datetime
+import json
+import os
+import threading
+
+ARQUIVO_MANIFESTO = 'manifesto.json'
+TABELA_PARTES = 'controle_partes'
+
+_lock = threading.Lock()
+
+
+#%%
+# Download e extração (arquivo JSON)
+def _caminho(output_files):
+    return os.path.join(output_files, ARQUIVO_MANIFESTO)
+
+
+def ler(output_files):
+    '''
+    Dicionário {nome do .zip: {etapa: dados}} (vazio se não houver manifesto)
+    '''
+    caminho = _caminho(output_files)
+    if not os.path.isfile(caminho):
+        return {}
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def marcar(output_files, nome, etapa, **dados):
+    '''
+    Registra a etapa ("baixado", "extraido") do .zip com o tamanho e a data
+    de modificação atuais do arquivo. O JSON é gravado num arquivo
+    temporário e renomeado, para não ficar pela metade se o processo parar.
+    '''
+    zip_path = os.path.join(output_files, nome)
+    dados['tamanho'] = os.path.getsize(zip_path)
+    dados['modificado'] = os.path.getmtime(zip_path)
+    dados['em'] = datetime.datetime.now().isoformat(timespec='seconds')
+    with _lock:
+        manifesto = ler(output_files)
+        manifesto.setdefault(nome, {})[etapa] = dados
+        temporario = _caminho(output_files) + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, indent=1, ensure_ascii=False)
+        os.replace(temporario, _caminho(output_files))
+
+
+def concluido(output_files, nome, etapa):
+    '''
+    True se a etapa do .zip foi registrada e o arquivo não mudou desde então
+    (um .zip baixado de novo tem outra data de modificação)
+    '''
+    dados = ler(output_files).get(nome, {}).get(etapa)
+    zip_path = os.path.join(output_files, nome)
+    if not dados or not os.path.isfile(zip_path):
+        return False
+    return (dados['tamanho'] == os.path.getsize(zip_path) and
+            dados['modificado'] == os.path.getmtime(zip_path))
+
+
+#%%
+# Carga no banco (tabela controle_partes)
+def criar(conn):
+    with conn.cursor() as cur:
+        cur.execute('''
+        CREATE TABLE IF NOT EXISTS ''' + TABELA_PARTES + ''' (
+            destino text NOT NULL,
+            data_release date NOT NULL,
+            arquivo text NOT NULL,
+            partes integer NOT NULL,
+            linhas bigint NOT NULL,
+            concluido boolean NOT NULL DEFAULT false,
+            atualizado_em timestamp NOT NULL DEFAULT now(),
+            PRIMARY KEY (destino, data_release, arquivo)
+        );
+        ''')
+    conn.commit()
+
+
+def partes_gravadas(conn, destino, release):
+    '''
+    Dicionário {arquivo: {'partes', 'linhas', 'concluido'}} da tabela de
+    destino na release
+    '''
+    with conn.cursor() as cur:
+        cur.execute('SELECT arquivo, partes, linhas, concluido FROM ' + TABELA_PARTES +
+                    ' WHERE destino = %s AND data_release = %s;', (destino, release))
+        return {a: {'partes': p, 'linhas': l, 'concluido': c} for a, p, l, c in cur.fetchall()}
+
+
+def registrar_parte(conn, destino, release, arquivo, partes, linhas, concluido=False):
+    '''
+    Registra as partes e linhas gravadas do arquivo até agora. Não faz
+    commit: quem chama faz o commit junto com a gravação da parte.
+    '''
+    with conn.cursor() as cur:
+        cur.execute('INSERT INTO ' + TABELA_PARTES + ' (destino, data_release, arquivo, partes, linhas, concluido) '
+                    'VALUES (%s, %s, %s, %s, %s, %s) '
+                    'ON CONFLICT (destino, data_release, arquivo) DO UPDATE SET '
+                    'partes = EXCLUDED.partes, linhas = EXCLUDED.linhas, '
+                    'concluido = EXCLUDED.concluido, atualizado_em = now();',
+                    (destino, release, arquivo, partes, linhas, concluido))
+
+
+def limpar(conn, destino):
+    '''
+    Apaga o manifesto da tabela de destino (a tabela foi apagada/recriada)
+    '''
+    with conn.cursor() as cur:
+        cur.execute('DELETE FROM ' + TABELA_PARTES + ' WHERE destino = %s;', (destino,))
+    conn.commit()
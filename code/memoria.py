@@ -0,0 +1,128 @@
+'''
+Orçamento de memória (MAX_MEMORY): em vez de um número fixo de linhas por
+parte, o tamanho de cada parte é calculado pelos bytes por linha
+observados na leitura, para o pico de memória (RSS) de cada worker ficar
+dentro da sua fatia do orçamento, qualquer que seja o tamanho do arquivo.
+
+A leitura é um gerador: a parte seguinte só é lida depois que a anterior
+entrou na fila de gravação (limitada, ver carga.FILA_PARTES). Nesse ponto
+o RSS é conferido e, se passou do orçamento, as próximas partes ficam
+menores (contrapressão). O orçamento de cada worker é dividido pelas
+partes que podem estar na memória ao mesmo tempo (a que está sendo lida,
+as da fila e as que estão sendo gravadas).
+
+Com os workers em threads (Windows, ver paralelo.executor) o RSS é o do
+processo inteiro, com todos os workers: a contrapressão compara o RSS com
+o orçamento total, e não com a fatia de cada worker.
+'''
+import gc
+import os
+import re
+
+# Quantas vezes o tamanho da parte lida cabe no pico de memória: a parte,
+# as cópias do tratamento, o buffer CSV do COPY e as tabelas derivadas
+FATOR_PICO = 4
+LINHAS_AMOSTRA = 10000  # primeira parte, para medir os bytes por linha
+MINIMO_LINHAS = 1000
+
+# Orçamento de cada worker e limite do RSS medido (o orçamento do worker
+# nos processos, o total nas threads). Os workers em processos (fork)
+# herdam estes valores do processo principal.
+_config = {'orcamento': None, 'limite': None, 'partes': 1}
+
+
+def tamanho_bytes(texto):
+    '''
+    "16GB", "512MB", "2G" ou um número de bytes -> bytes
+    '''
+    m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', str(texto).upper())
+    if not m:
+        raise ValueError('Tamanho de memória inválido: ' + str(texto))
+    return int(float(m.group(1)) * 1024 ** ' KMGT'.index(m.group(2) or ' '))
+
+
+def configurar(max_memory, workers=1, partes=1, threads=False):
+    '''
+    Divide o orçamento total entre os workers (cada um lê e grava um
+    arquivo por vez, com até "partes" partes na memória). Sem max_memory
+    vale o tamanho fixo das partes. Com "threads" os workers dividem o
+    mesmo processo, então o RSS é comparado com o orçamento total.
+    Retorna o orçamento de cada worker em bytes (ou None).
+    '''
+    total = tamanho_bytes(max_memory) if max_memory else None
+    _config['orcamento'] = total // max(workers, 1) if total else None
+    _config['limite'] = total if threads else _config['orcamento']
+    _config['partes'] = max(partes, 1)
+    return _config['orcamento']
+
+
+def rss_atual():
+    '''
+    Memória (RSS) atual do processo em bytes, pelo /proc (None fora do Linux)
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Dimensionador:
+    '''
+    Calcula o número de linhas de cada parte de um arquivo dentro do
+    orçamento (em bytes), limitado a "maximo" linhas se informado.
+    "limite" é o teto do RSS medido (padrão: o próprio orçamento; com os
+    workers em threads, o orçamento total do processo).
+    '''
+    def __init__(self, orcamento, maximo=None, partes=1, limite=None):
+        self.orcamento = orcamento
+        self.limite = limite or orcamento
+        self.maximo = maximo
+        self.partes = partes  # partes na memória ao mesmo tempo
+        self.base = rss_atual() or 0  # memória do processo antes da leitura
+        self.bytes_por_linha = None
+        self.divisor = 1
+
+    def proxima(self):
+        if self.bytes_por_linha is None:
+            linhas = LINHAS_AMOSTRA
+        else:
+            # A parte do worker no que sobra do limite (nas threads a
+            # memória base é a do processo, dividida entre os workers)
+            disponivel = max(self.limite - self.base, 0) * self.orcamento / self.limite
+            linhas = int(disponivel / (self.bytes_por_linha * FATOR_PICO * self.partes * self.divisor))
+        linhas = max(linhas, MINIMO_LINHAS)
+        return min(linhas, self.maximo) if self.maximo else linhas
+
+    def observar(self, df):
+        '''
+        Atualiza os bytes por linha com a parte já tratada (vale o maior
+        valor visto, para não subestimar partes com textos maiores)
+        '''
+        if len(df):
+            por_linha = df.memory_usage(index=True, deep=True).sum() / len(df)
+            self.bytes_por_linha = max(self.bytes_por_linha or 0, por_linha)
+
+    def contrapressao(self):
+        '''
+        Chamado depois que a parte foi entregue para a gravação: se o RSS passou
+        do orçamento, libera o que sobrou e reduz as próximas partes.
+        '''
+        rss = rss_atual()
+        if rss is None or rss <= self.limite:
+            return
+        gc.collect()
+        rss = rss_atual()
+        if rss > self.limite:
+            self.divisor *= 2
+            print('Memória acima do orçamento (%d MB de %d MB): partes reduzidas para %d linhas' %
+                  (rss // 1024 ** 2, self.limite // 1024 ** 2, self.proxima()))
+
+
+def dimensionador(maximo=None):
+    '''
+    Dimensionador com o orçamento do worker, ou None sem MAX_MEMORY
+    '''
+    if _config['orcamento'] is None:
+        return None
+    return Dimensionador(_config['orcamento'], maximo, _config['partes'], _config['limite'])
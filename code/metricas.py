@@ -0,0 +1,254 @@
+'''
+Métricas de cada etapa da carga (download, unzip, parse, transform, write,
+index), por arquivo e por parte: linhas, bytes, tempo de relógio, tempo
+de CPU e memória (RSS) do processo no início e no fim da etapa.
+
+O tempo de CPU é medido de duas formas: cpu_segundos é o do processo
+inteiro (inclui as threads do leitor do pyarrow e a serialização do
+COPY, mas também as outras threads que estavam rodando ao mesmo tempo,
+como os escritores e os workers em threads) e cpu_thread_segundos só o
+da thread que executou a etapa. O CPU do servidor PostgreSQL (COPY,
+índices) não entra em nenhum dos dois. A memória de cada etapa é a
+diferença do RSS atual entre o fim e o início (rss_delta_mb);
+pico_rss_processo_mb é o maior RSS do processo desde que ele começou, e
+não diz qual etapa usou a memória.
+
+Cada medição vira uma linha JSON em METRICS_FILE (uma linha por etapa,
+gravada com um único write em modo append, então os workers em processos
+ou threads podem gravar no mesmo arquivo). No final, os totais da execução
+podem ser exportados num arquivo texto no formato do Prometheus
+(node_exporter textfile collector) e são impressos por etapa.
+
+Opcionalmente uma etapa (PROFILE_STAGE) é medida com cProfile ou
+tracemalloc (PROFILE_MODE); o resultado de cada medição fica em
+PROFILE_PATH. O tracemalloc vale para o processo inteiro, então com
+threads (Windows) use WORKERS=1.
+
+Sem METRICS_FILE as etapas não são gravadas e o custo é só o de medir o
+tempo.
+'''
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+import memoria
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ETAPAS = ['download', 'unzip', 'parse', 'transform', 'write', 'index']
+MODOS_PERFIL = ['cprofile', 'tracemalloc']
+
+# Configuração da execução. Os workers em processos (fork) herdam estes
+# valores do processo principal.
+_config = {'arquivo': None, 'execucao': None, 'perfil': None, 'modo_perfil': 'cprofile', 'pasta_perfil': None}
+_lock = threading.Lock()
+
+
+def configurar(arquivo=None, perfil=None, modo_perfil=None, pasta_perfil=None):
+    '''
+    Define o arquivo JSON lines das métricas e a etapa medida com profiler.
+    Retorna o identificador da execução (gravado em cada linha).
+    '''
+    _config['arquivo'] = arquivo
+    _config['execucao'] = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    _config['perfil'] = perfil
+    _config['modo_perfil'] = modo_perfil if modo_perfil in MODOS_PERFIL else 'cprofile'
+    _config['pasta_perfil'] = pasta_perfil or (os.path.dirname(arquivo) if arquivo else None) or '.'
+    return _config['execucao']
+
+
+def rss_mb():
+    '''
+    Memória (RSS) atual do processo, em MB (None fora do Linux)
+    '''
+    rss = memoria.rss_atual()
+    return None if rss is None else round(rss / 1024 / 1024, 1)
+
+
+def pico_rss_processo_mb():
+    '''
+    Pico de memória (RSS) do processo desde o início, em MB (None no Windows)
+    '''
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB e macOS em bytes
+    return round(pico / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+def _nome_perfil(medicao, extensao):
+    partes = [medicao['etapa'], medicao.get('tabela'), medicao.get('arquivo'), medicao.get('parte'), str(os.getpid())]
+    nome = '-'.join(str(p) for p in partes if p is not None)
+    return os.path.join(_config['pasta_perfil'], 'perfil-' + re.sub(r'[^\w.\-]', '_', nome) + extensao)
+
+
+@contextlib.contextmanager
+def _perfil(medicao):
+    if _config['perfil'] != medicao['etapa']:
+        yield
+        return
+    os.makedirs(_config['pasta_perfil'], exist_ok=True)
+    if _config['modo_perfil'] == 'tracemalloc':
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            medicao['tracemalloc_pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            tracemalloc.stop()
+            if not medicao.get('ignorar'):
+                with open(_nome_perfil(medicao, '.txt'), 'w', encoding='utf-8') as f:
+                    for estatistica in snapshot.statistics('lineno')[:50]:
+                        f.write(str(estatistica) + '\n')
+    else:
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            if not medicao.get('ignorar'):
+                perfil.dump_stats(_nome_perfil(medicao, '.prof'))
+
+
+@contextlib.contextmanager
+def etapa(nome, tabela=None, arquivo=None, parte=None):
+    '''
+    Mede o bloco como a etapa "nome". O dicionário retornado recebe do
+    bloco as "linhas" e os "bytes" processados; com "ignorar" = True a
+    medição não é gravada (ex.: a leitura que só detecta o fim do arquivo).
+
+        with metricas.etapa('write', tabela, arquivo, parte) as m:
+            m['linhas'] = gravar(...)
+    '''
+    medicao = {'etapa': nome, 'tabela': tabela, 'arquivo': arquivo, 'parte': parte, 'linhas': None, 'bytes': None}
+    inicio = time.time()
+    relogio = time.perf_counter()
+    cpu = time.process_time()
+    cpu_thread = time.thread_time()
+    rss_inicio = rss_mb()
+    try:
+        with _perfil(medicao):
+            yield medicao
+    except BaseException as erro:
+        medicao['erro'] = repr(erro)
+        raise
+    finally:
+        medicao['segundos'] = round(time.perf_counter() - relogio, 4)
+        medicao['cpu_segundos'] = round(time.process_time() - cpu, 4)
+        medicao['cpu_thread_segundos'] = round(time.thread_time() - cpu_thread, 4)
+        medicao['rss_inicio_mb'] = rss_inicio
+        medicao['rss_fim_mb'] = rss_mb()
+        if rss_inicio is not None and medicao['rss_fim_mb'] is not None:
+            medicao['rss_delta_mb'] = round(medicao['rss_fim_mb'] - rss_inicio, 1)
+        medicao['inicio'] = round(inicio, 3)
+        if not medicao.pop('ignorar', False):
+            registrar(medicao)
+
+
+def registrar(medicao):
+    '''
+    Grava a medição como uma linha JSON em METRICS_FILE
+    '''
+    if not _config['arquivo']:
+        return
+    medicao['execucao'] = _config['execucao']
+    medicao['pid'] = os.getpid()
+    medicao['pico_rss_processo_mb'] = pico_rss_processo_mb()
+    linha = json.dumps(medicao, ensure_ascii=False, default=str) + '\n'
+    with _lock:
+        with open(_config['arquivo'], 'a', encoding='utf-8') as f:
+            f.write(linha)
+
+
+def ler(arquivo, execucao=None):
+    '''
+    Medições gravadas no arquivo (só as da execução, se informada)
+    '''
+    if not arquivo or not os.path.isfile(arquivo):
+        return []
+    with open(arquivo, 'r', encoding='utf-8') as f:
+        medicoes = [json.loads(l) for l in f if l.strip()]
+    return [m for m in medicoes if execucao is None or m.get('execucao') == execucao]
+
+
+def totais(medicoes):
+    '''
+    Totais por (etapa, tabela): quantidade, linhas, bytes, segundos,
+    segundos de CPU (do processo e da thread), maior aumento do RSS numa
+    medição e maior pico de RSS dos processos
+    '''
+    resultado = {}
+    for m in medicoes:
+        t = resultado.setdefault((m['etapa'], m.get('tabela') or ''),
+                                 {'quantidade': 0, 'linhas': 0, 'bytes': 0, 'segundos': 0.0,
+                                  'cpu_segundos': 0.0, 'cpu_thread_segundos': 0.0, 'rss_delta_max_mb': 0.0,
+                                  'pico_rss_processo_mb': 0.0})
+        t['quantidade'] += 1
+        t['linhas'] += m.get('linhas') or 0
+        t['bytes'] += m.get('bytes') or 0
+        t['segundos'] += m['segundos']
+        t['cpu_segundos'] += m['cpu_segundos']
+        t['cpu_thread_segundos'] += m.get('cpu_thread_segundos') or 0
+        t['rss_delta_max_mb'] = max(t['rss_delta_max_mb'], m.get('rss_delta_mb') or 0)
+        t['pico_rss_processo_mb'] = max(t['pico_rss_processo_mb'], m.get('pico_rss_processo_mb') or 0)
+    return resultado
+
+
+def exportar_prometheus(caminho, medicoes):
+    '''
+    Grava os totais no formato texto do Prometheus (arquivo temporário
+    renomeado no final, como pede o textfile collector)
+    '''
+    metricas = [('cnpj_etapa_execucoes_total', 'quantidade', 'Medições da etapa'),
+                ('cnpj_etapa_linhas_total', 'linhas', 'Linhas processadas'),
+                ('cnpj_etapa_bytes_total', 'bytes', 'Bytes processados'),
+                ('cnpj_etapa_segundos_total', 'segundos', 'Tempo de relógio'),
+                ('cnpj_etapa_cpu_segundos_total', 'cpu_segundos', 'Tempo de CPU do processo'),
+                ('cnpj_etapa_cpu_thread_segundos_total', 'cpu_thread_segundos', 'Tempo de CPU da thread da etapa'),
+                ('cnpj_etapa_rss_delta_max_mb', 'rss_delta_max_mb', 'Maior aumento do RSS numa medição (MB)'),
+                ('cnpj_etapa_pico_rss_processo_mb', 'pico_rss_processo_mb',
+                 'Maior pico de RSS dos processos desde o início (MB)')]
+    medidores = ('rss_delta_max_mb', 'pico_rss_processo_mb')
+    soma = totais(medicoes)
+    linhas = []
+    for nome, campo, ajuda in metricas:
+        linhas.append('# HELP ' + nome + ' ' + ajuda)
+        linhas.append('# TYPE ' + nome + (' gauge' if campo in medidores else ' counter'))
+        for (nome_etapa, tabela), t in sorted(soma.items()):
+            linhas.append('%s{etapa="%s",tabela="%s"} %s' % (nome, nome_etapa, tabela, t[campo]))
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(linhas) + '\n')
+    os.replace(temporario, caminho)
+
+
+def imprimir_resumo(medicoes):
+    '''
+    Tempo por etapa (somado entre os workers), para ver onde foi gasto o
+    tempo, e o maior aumento do RSS numa medição de cada etapa
+    '''
+    soma = {}
+    for (nome_etapa, _), t in totais(medicoes).items():
+        s = soma.setdefault(nome_etapa, {'segundos': 0.0, 'cpu_segundos': 0.0, 'linhas': 0, 'bytes': 0,
+                                         'rss_delta_max_mb': 0.0})
+        for campo in s:
+            s[campo] = max(s[campo], t[campo]) if campo == 'rss_delta_max_mb' else s[campo] + t[campo]
+    print('Etapa'.ljust(10) + 'segundos'.rjust(12) + 'CPU (s)'.rjust(12) + 'linhas'.rjust(14) + 'MB'.rjust(12) +
+          '+RSS MB'.rjust(10))
+    for nome_etapa in ETAPAS + sorted(set(soma) - set(ETAPAS)):
+        if nome_etapa in soma:
+            s = soma[nome_etapa]
+            print(nome_etapa.ljust(10) + ('%.1f' % s['segundos']).rjust(12) + ('%.1f' % s['cpu_segundos']).rjust(12) +
+                  str(s['linhas']).rjust(14) + ('%.1f' % (s['bytes'] / 1024 / 1024)).rjust(12) +
+                  ('%.1f' % s['rss_delta_max_mb']).rjust(10))
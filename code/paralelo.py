@@ -0,0 +1,117 @@
+'''
+Carga dos arquivos extraídos em paralelo: cada worker tem a sua própria
+conexão com o banco e carrega um arquivo inteiro por vez.
+'''
+import concurrent.futures
+import multiprocessing
+import threading
+import time
+
+import carga
+import leitura
+import saida_parquet
+import tabelas
+
+# Conexão de cada worker. Nos processos o initializer e as tarefas rodam
+# na mesma thread, então o threading.local serve para os dois casos.
+_local = threading.local()
+
+
+def ordenar_tarefas(tarefas):
+    '''
+    Ordena os arquivos do maior para o menor (escalonamento "longest
+    processing time first"). Assim os arquivos grandes de estabelecimento e
+    empresa começam primeiro e as tabelas pequenas (cnae, munic, pais, ...)
+    preenchem os workers no final, e o tempo total fica próximo do tempo do
+    arquivo mais lento. Em caso de empate vale a ordem de TABELAS.
+    '''
+    ordem = list(tabelas.TABELAS)
+    return sorted(tarefas, key=lambda t: (-leitura.tamanho_arquivo(t[1]), ordem.index(t[0])))
+
+
+def _iniciar_worker(db):
+    # Sem banco (saída em Parquet) o worker não abre conexão. Os dados do
+    # banco ficam para as conexões dos outros escritores de cada arquivo.
+    _local.db = db
+    _local.conexao = carga.conectar(db) if db is not None else None
+
+
+def _carregar(tabela, file_path, metodo, chunksize, sufixo, parquet, release, escritores):
+    inicio = time.time()
+    if metodo == 'parquet':
+        linhas = saida_parquet.carregar_arquivo(tabela, file_path, parquet, chunksize)
+    else:
+        engine, conn = _local.conexao
+        linhas = carga.carregar_arquivo(tabela, file_path, engine, conn, metodo, chunksize, sufixo, release,
+                                        _local.db, escritores)
+    return tabela, file_path, linhas, inicio, time.time()
+
+
+def usa_processos():
+    '''
+    True se os workers são processos (sistemas com "fork"); no Windows são
+    threads
+    '''
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def executor(workers, db):
+    '''
+    Pool de workers, cada um com a sua conexão. Usa processos quando o
+    sistema tem "fork"; no Windows (só "spawn") o script seria executado de
+    novo em cada processo, então usa threads.
+    '''
+    if usa_processos():
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                      mp_context=multiprocessing.get_context('fork'),
+                                                      initializer=_iniciar_worker,
+                                                      initargs=(db,))
+    return concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                 initializer=_iniciar_worker,
+                                                 initargs=(db,))
+
+
+def carregar_arquivos(tarefas, db, metodo=carga.METODO_PADRAO, workers=1, chunksize=None, sufixo='', parquet=None,
+                      release=None, escritores=1):
+    '''
+    Carrega a lista de tarefas (tabela, arquivo) com "workers"
+    em paralelo, lendo cada arquivo em partes de "chunksize" linhas e
+    gravando em tabela + sufixo. As tabelas já devem existir (ver
+    carga.preparar_tabela). Com metodo "parquet" os arquivos são gravados
+    em Parquet conforme a configuração "parquet" (ver saida_parquet) e o
+    banco não é usado (db = None). Com "release", as partes gravadas ficam
+    no manifesto e a carga continua de onde parou (ver manifesto.py).
+    Cada arquivo é gravado por "escritores" threads, cada uma com a sua
+    conexão, enquanto a parte seguinte é lida (ver carga.carregar_arquivo).
+    Retorna um dicionário por tabela com linhas, início e fim da carga.
+    '''
+    resultado = {}
+
+    def registrar(tabela, linhas, inicio, fim):
+        r = resultado.setdefault(tabela, {'linhas': 0, 'inicio': inicio, 'fim': fim})
+        r['linhas'] += linhas
+        r['inicio'] = min(r['inicio'], inicio)
+        r['fim'] = max(r['fim'], fim)
+
+    tarefas = ordenar_tarefas(tarefas)
+
+    if workers <= 1:
+        _iniciar_worker(db)
+        for tabela, file_path in tarefas:
+            tabela, file_path, linhas, inicio, fim = _carregar(tabela, file_path, metodo, chunksize, sufixo, parquet, release, escritores)
+            registrar(tabela, linhas, inicio, fim)
+        if _local.conexao is not None:
+            engine, conn = _local.conexao
+            conn.close()
+            engine.dispose()
+        return resultado
+
+    with executor(workers, db) as pool:
+        futuros = [pool.submit(_carregar, tabela, file_path, metodo, chunksize, sufixo, parquet, release,
+                              escritores) for tabela, file_path in tarefas]
+        for futuro in concurrent.futures.as_completed(futuros):
+            tabela, file_path, linhas, inicio, fim = futuro.result()
+            print('Arquivo ' + leitura.nome_arquivo(file_path) + ' (' + tabela + ') finalizado: ' +
+                  str(linhas) + ' linhas em ' + str(round(fim - inicio)) + ' segundos')
+            registrar(tabela, linhas, inicio, fim)
+    return resultado
@@ -0,0 +1,181 @@
+'''
+Particionamento das tabelas grandes (empresa, estabelecimento,
+estabelecimento_cnae_secundaria, socios, simples) com PARTITIONS: cada
+tabela vira uma tabela particionada por HASH de cnpj_basico com
+PARTITIONS partições (<tabela>_p0, <tabela>_p1, ...), ou, com
+PARTITION_BY_UF, estabelecimento é particionada por LIST de uf (uma
+partição por UF, <tabela>_sp, ..., e <tabela>_outras para o resto).
+
+Carga, VACUUM e índices passam a trabalhar em tabelas menores, e as
+consultas e joins por cnpj_basico leem só a partição certa (partition
+pruning). Todas as tabelas com o mesmo número de partições permitem o
+join partição a partição (enable_partitionwise_join).
+
+Na carga cada parte lida é separada por partição e gravada direto em cada
+partição, sem o roteamento linha a linha do PostgreSQL. Para isso a
+partição de cada cnpj_basico é calculada aqui com a mesma função de hash
+do PostgreSQL (hashint4extended, a "lookup3" de Bob Jenkins, com a
+semente das partições por hash); verificar() confere o cálculo com o
+banco antes da carga e, se não bater, as partes vão para a tabela
+particionada e o PostgreSQL roteia.
+'''
+import numpy as np
+import pandas as pd
+
+import tabelas
+
+# Semente e combinação do hash das partições (partbounds.c e hashfn.h do PostgreSQL)
+SEMENTE_HASH = 0x7A5B22367996DCFD
+COMBINAR_HASH = 0x49a0f4dd15e5a8e3
+
+UFS = ['AC', 'AL', 'AM', 'AP', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MG', 'MS', 'MT', 'PA', 'PB',
+       'PE', 'PI', 'PR', 'RJ', 'RN', 'RO', 'RR', 'RS', 'SC', 'SE', 'SP', 'TO']
+PARTICAO_OUTRAS = 'outras'
+
+# Os workers em processos (fork) herdam estes valores do processo principal
+_config = {'particoes': 0, 'por_uf': False, 'roteamento': {}}
+
+
+def configurar(particoes=0, por_uf=False):
+    _config['particoes'] = int(particoes or 0)
+    _config['por_uf'] = bool(por_uf) and _config['particoes'] > 0
+    _config['roteamento'] = {}
+    return _config['particoes']
+
+
+def chave(tabela):
+    '''
+    Coluna de particionamento da tabela (None se a tabela não é
+    particionada)
+    '''
+    if not _config['particoes'] or not tabelas.TABELAS[tabela].get('particionar'):
+        return None
+    if _config['por_uf'] and 'uf' in tabelas.TABELAS[tabela]['colunas']:
+        return 'uf'
+    return 'cnpj_basico'
+
+
+def nomes(tabela, sufixo=''):
+    '''
+    Nomes das partições da tabela (o sufixo vai no fim, como nos índices,
+    para a troca das tabelas, ver troca.py)
+    '''
+    if chave(tabela) == 'uf':
+        return [tabela + '_' + p.lower() + sufixo for p in UFS + [PARTICAO_OUTRAS]]
+    return [tabela + '_p' + str(i) + sufixo for i in range(_config['particoes'])]
+
+
+def ddl(tabela, nome, sufixo='', unlogged=False):
+    '''
+    Cláusula PARTITION BY da tabela e CREATE TABLE das partições. Na carga
+    com troca as partições são UNLOGGED e sem autovacuum (a tabela
+    particionada não tem dados e não pode ser UNLOGGED).
+    '''
+    coluna = chave(tabela)
+    opcoes = ' WITH (autovacuum_enabled = false)' if unlogged else ''
+    tipo = 'CREATE UNLOGGED TABLE' if unlogged else 'CREATE TABLE'
+    particoes = []
+    for i, particao in enumerate(nomes(tabela, sufixo)):
+        if coluna == 'uf':
+            limites = 'DEFAULT' if i == len(UFS) else "FOR VALUES IN ('" + UFS[i] + "')"
+        else:
+            limites = 'FOR VALUES WITH (MODULUS %i, REMAINDER %i)' % (_config['particoes'], i)
+        particoes.append(tipo + ' IF NOT EXISTS "' + particao + '" PARTITION OF "' + nome + '" ' + limites + opcoes + ';')
+    if coluna == 'uf':
+        return ' PARTITION BY LIST ("uf")', particoes
+    return ' PARTITION BY HASH ("' + coluna + '")', particoes
+
+
+#%%
+def _rot(x, k):
+    return (x << np.uint32(k)) | (x >> np.uint32(32 - k))
+
+
+def hash_int4(valores):
+    '''
+    hashint4extended(valor, SEMENTE_HASH) do PostgreSQL (hash_uint32_extended,
+    em hashfn.c), vetorizado: uint64 de cada valor
+    '''
+    with np.errstate(over='ignore'):
+        inicial = np.uint32((0x9e3779b9 + 4 + 3923095) & 0xFFFFFFFF)
+        a = np.full(len(valores), inicial, dtype=np.uint32)
+        b = a.copy()
+        c = a.copy()
+        # Semente (mix)
+        a += np.uint32(SEMENTE_HASH >> 32)
+        b += np.uint32(SEMENTE_HASH & 0xFFFFFFFF)
+        a -= c; a ^= _rot(c, 4); c += b
+        b -= a; b ^= _rot(a, 6); a += c
+        c -= b; c ^= _rot(b, 8); b += a
+        a -= c; a ^= _rot(c, 16); c += b
+        b -= a; b ^= _rot(a, 19); a += c
+        c -= b; c ^= _rot(b, 4); b += a
+        # Valor (final)
+        a += np.asarray(valores, dtype=np.int64).astype(np.uint32)
+        c ^= b; c -= _rot(b, 14)
+        a ^= c; a -= _rot(c, 11)
+        b ^= a; b -= _rot(a, 25)
+        c ^= b; c -= _rot(b, 16)
+        a ^= c; a -= _rot(c, 4)
+        b ^= a; b -= _rot(a, 14)
+        c ^= b; c -= _rot(b, 24)
+        return (b.astype(np.uint64) << np.uint64(32)) | c.astype(np.uint64)
+
+
+def particao_hash(valores, particoes):
+    '''
+    Resto (REMAINDER) da partição de cada valor (série ou array de
+    inteiros), como no compute_partition_hash_value do PostgreSQL. Nulos
+    vão para o resto 0.
+    '''
+    valores = pd.Series(valores, copy=False)
+    nulos = valores.isna().to_numpy()
+    with np.errstate(over='ignore'):
+        linha = hash_int4(valores.fillna(0).to_numpy(dtype=np.int64)) + np.uint64(COMBINAR_HASH)
+    restos = (linha % np.uint64(particoes)).astype(np.int64)
+    restos[nulos] = 0
+    return restos
+
+
+def verificar(conn, tabela, nome):
+    '''
+    Confere o cálculo das partições por hash com o banco
+    (satisfies_hash_partition) para uma amostra de cnpj_basico. Se não
+    bater, as partes da tabela vão para a tabela particionada (o
+    PostgreSQL roteia cada linha). Retorna True se o roteamento direto
+    vale para a tabela.
+    '''
+    if chave(tabela) != 'cnpj_basico':
+        _config['roteamento'][nome] = chave(tabela) is not None
+        return _config['roteamento'][nome]
+    amostra = np.concatenate([np.arange(1000), np.random.default_rng(0).integers(0, 10 ** 8, 1000)])
+    restos = particao_hash(amostra, _config['particoes'])
+    with conn.cursor() as cur:
+        cur.execute('SELECT bool_and(satisfies_hash_partition(to_regclass(%s)::oid, %s, r, v)) '
+                    'FROM unnest(%s::integer[], %s::integer[]) AS a (v, r);',
+                    ('"' + nome + '"', _config['particoes'], amostra.tolist(), restos.tolist()))
+        confere = bool(cur.fetchone()[0])
+    conn.commit()
+    if not confere:
+        print('O cálculo das partições de ' + nome + ' não confere com o banco: '
+              'as partes vão para a tabela particionada.')
+    _config['roteamento'][nome] = confere
+    return confere
+
+
+def rotear(tabela, nome, df, sufixo=''):
+    '''
+    Separa a parte por partição: lista de (partição, dataframe). Sem
+    particionamento (ou sem roteamento direto), a parte inteira vai para a
+    própria tabela.
+    '''
+    coluna = chave(tabela)
+    if coluna is None or not _config['roteamento'].get(nome):
+        return [(nome, df)]
+    particoes = nomes(tabela, sufixo)
+    if coluna == 'uf':
+        posicao = {uf: i for i, uf in enumerate(UFS)}
+        indices = df['uf'].astype(object).map(posicao).fillna(len(UFS)).astype(int).to_numpy()
+    else:
+        indices = particao_hash(df['cnpj_basico'], _config['particoes'])
+    return [(particoes[i], df[indices == i]) for i in np.unique(indices)]
@@ -0,0 +1,708 @@
+'''
+Etapas da carga dos dados públicos de CNPJ da Receita como funções, para
+rodar só a etapa ou as tabelas que mudaram e para usar (ou medir) cada
+parte sem rede:
+
+    download  lista os .zip no site da Receita e baixa
+    extract   descompacta os .zip (não se aplica com STREAM_ZIP)
+    load      lê os CSVs e grava no banco (ou em Parquet)
+    index     cria os índices e as primary keys
+    card      monta a tabela cartao_cnpj (opcional, ver cartao.py)
+
+Importar este módulo não faz nada: a configuração vem do ".env" em
+configuracao() e as etapas rodam em executar() (ou pela linha de comando,
+ver main()).
+
+Exemplo:
+    python ETL_coletar_dados_e_gravar_BD.py --stages load,index --tables empresa,socios
+'''
+import argparse
+import os
+import pathlib
+import time
+import zipfile
+
+import pandas as pd
+from dotenv import load_dotenv
+
+import busca
+import carga
+import cartao
+import catalogo
+import consulta
+import dimensoes
+import download
+import incremental
+import indices
+import leitura
+import manifesto
+import memoria
+import metricas
+import paralelo
+import particoes
+import saida_parquet
+import tabelas
+import troca
+
+ETAPAS = ['download', 'extract', 'load', 'index', 'card']
+DADOS_RF = 'http://200.152.38.155/CNPJ/'
+
+
+def makedirs(path):
+    '''
+    cria path caso seja necessario
+    '''
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+
+def _sim(valor, padrao=False):
+    if not valor:
+        return padrao
+    return valor.lower() in ('1', 'true', 'sim')
+
+
+#%%
+def configuracao(dotenv_path=None):
+    '''
+    Lê o ".env" (se informado) e as variáveis de ambiente e retorna um
+    dicionário com a configuração de todas as etapas
+    '''
+    # https://dev.to/jakewitcher/using-env-files-for-environment-variables-in-python-applications-55a1
+    if dotenv_path:
+        load_dotenv(dotenv_path=dotenv_path)
+    getEnv = os.getenv
+
+    config = {
+        'dados_rf': getEnv('DADOS_RF') or DADOS_RF,
+        'output_files': getEnv('OUTPUT_FILES_PATH'),
+        # Ler os CSVs direto de dentro dos .zip, sem extrair para EXTRACTED_FILES_PATH
+        'stream_zip': _sim(getEnv('STREAM_ZIP')),
+        'extracted_files': getEnv('EXTRACTED_FILES_PATH'),
+        'download_workers': int(getEnv('DOWNLOAD_WORKERS') or 4),
+        # Saída dos dados: postgres (padrão) ou parquet
+        'output_format': getEnv('OUTPUT_FORMAT') or 'postgres',
+        'db': {'user': getEnv('DB_USER'), 'passw': getEnv('DB_PASSWORD'), 'host': getEnv('DB_HOST'),
+               'port': getEnv('DB_PORT'), 'database': getEnv('DB_NAME')},
+        'write_method': getEnv('WRITE_METHOD') or carga.METODO_PADRAO,
+        # Leitor de CSV: pandas (padrão) ou pyarrow (várias threads, textos em Arrow)
+        'read_engine': getEnv('READ_ENGINE') or leitura.MOTOR_PADRAO,
+        'parquet': None,
+        # Quantidade de arquivos carregados ao mesmo tempo (cada worker com sua conexão)
+        'workers': int(getEnv('WORKERS') or 1),
+        # Threads gravando cada arquivo enquanto a próxima parte é lida (0 = sem fila)
+        'writers': int(getEnv('WRITERS') or 1),
+        # Linhas lidas por vez de cada arquivo (vazio = tamanho padrão de cada tabela)
+        'chunksize': int(getEnv('CHUNK_SIZE') or 0) or None,
+        'max_memory': getEnv('MAX_MEMORY'),
+        'load_mode': getEnv('LOAD_MODE') or 'full',
+        # Descrições das dimensões (município, CNAE, ...) gravadas nas tabelas de fatos
+        'denormalize': _sim(getEnv('DENORMALIZE')),
+        # Carga com troca: as tabelas novas voltam a ser LOGGED antes da troca
+        'swap_logged': _sim(getEnv('SWAP_LOGGED'), True),
+        'resume': _sim(getEnv('RESUME'), True),
+        'index_workers': int(getEnv('INDEX_WORKERS') or 4),
+        'index_maintenance_work_mem': getEnv('INDEX_MAINTENANCE_WORK_MEM'),
+        'index_parallel_workers': int(getEnv('INDEX_PARALLEL_WORKERS') or indices.PARALELO_POR_INDICE_PADRAO),
+        'metrics_file': getEnv('METRICS_FILE'),
+        'metrics_prometheus': getEnv('METRICS_PROMETHEUS'),
+        'profile_stage': getEnv('PROFILE_STAGE'),
+        'profile_mode': getEnv('PROFILE_MODE'),
+        'profile_path': getEnv('PROFILE_PATH'),
+        # Nomes normalizados e índices de trigramas para a busca por nome
+        'search_index': _sim(getEnv('SEARCH_INDEX')),
+        # Tabela cartao_cnpj montada depois dos índices (etapa card)
+        'card_table': _sim(getEnv('CARD_TABLE')),
+        'card_parallel_workers': int(getEnv('CARD_PARALLEL_WORKERS') or cartao.PARALELO_PADRAO),
+        # Tabelas grandes particionadas por cnpj_basico (ou uf, em estabelecimento)
+        'partitions': int(getEnv('PARTITIONS') or 0),
+        'partition_by_uf': _sim(getEnv('PARTITION_BY_UF')),
+        # Consulta de cartões CNPJ (consulta.py): conexões do pool e cache LRU
+        'lookup_pool_size': int(getEnv('LOOKUP_POOL_SIZE') or consulta.CONEXOES_PADRAO),
+        'lookup_cache_size': int(getEnv('LOOKUP_CACHE_SIZE') or consulta.TAMANHO_CACHE_PADRAO),
+        'lookup_cache_ttl': int(getEnv('LOOKUP_CACHE_TTL') or consulta.TTL_CACHE_PADRAO),
+    }
+
+    if config['output_format'] == 'parquet':
+        config['parquet'] = saida_parquet.configuracao(getEnv('PARQUET_PATH'),
+                                                       getEnv('PARQUET_COMPRESSION'),
+                                                       int(getEnv('PARQUET_ROW_GROUP_SIZE') or 0) or None)
+        config['write_method'] = 'parquet'
+    elif config['write_method'] not in carga.METODOS_GRAVACAO:
+        print('WRITE_METHOD inválido: ' + config['write_method'] + '. Usando ' + carga.METODO_PADRAO + '.')
+        config['write_method'] = carga.METODO_PADRAO
+    if config['read_engine'] not in leitura.MOTORES_LEITURA:
+        print('READ_ENGINE inválido: ' + config['read_engine'] + '. Usando ' + leitura.MOTOR_PADRAO + '.')
+        config['read_engine'] = leitura.MOTOR_PADRAO
+
+    if config['load_mode'] in ('incremental', 'swap') and config['output_format'] == 'parquet':
+        print('A carga ' + config['load_mode'] + ' só vale para o banco de dados; a saída em Parquet é sempre completa.')
+        config['load_mode'] = 'full'
+    if config['partitions'] and (config['output_format'] == 'parquet' or config['load_mode'] == 'incremental'):
+        # A carga incremental renomeia a tabela de stage para a tabela em
+        # uso, o que deixaria as partições com os nomes do stage
+        print('PARTITIONS só vale para o banco de dados com LOAD_MODE full ou swap; tabelas sem partições.')
+        config['partitions'] = 0
+    return config
+
+
+def selecionar_tabelas(nomes=None):
+    '''
+    Tabelas de origem (com arquivos) a carregar. Uma tabela derivada (ex.:
+    estabelecimento_cnae_secundaria) só é gerada junto com a de origem,
+    então pedir a derivada carrega a de origem.
+    '''
+    if not nomes:
+        return [t for t, spec in tabelas.TABELAS.items() if not spec.get('origem')]
+    desconhecidas = [t for t in nomes if t not in tabelas.TABELAS]
+    if desconhecidas:
+        raise ValueError('Tabelas desconhecidas: ' + ', '.join(desconhecidas))
+    selecao = set(tabelas.TABELAS[t].get('origem') or t for t in nomes)
+    return [t for t in tabelas.TABELAS if t in selecao]
+
+
+#%%
+def listar_remotos(dados_rf=DADOS_RF):
+    '''
+    Lê a listagem do site da Receita uma vez: (release, {nome do .zip:
+    url, data e tamanho da listagem}), ver catalogo.py
+    '''
+    sessao = download.criar_sessao(1)
+    try:
+        return catalogo.listar(sessao, dados_rf)
+    finally:
+        sessao.close()
+
+
+def listar_arquivos(dados_rf=DADOS_RF, nomes_tabelas=None):
+    '''
+    Nomes dos .zip publicados no site da Receita (só os das tabelas
+    informadas, se houver)
+    '''
+    return filtrar_zips(list(listar_remotos(dados_rf)[1]), nomes_tabelas)
+
+
+def filtrar_zips(nomes_zip, nomes_tabelas=None):
+    '''
+    Mantém só os .zip das tabelas informadas
+    '''
+    if nomes_tabelas is None:
+        return list(nomes_zip)
+    return [z for z in nomes_zip if tabelas.tabela_do_zip(z) in nomes_tabelas]
+
+
+def zips_locais(output_files, nomes_tabelas=None):
+    '''
+    .zip já baixados em OUTPUT_FILES_PATH (para as etapas sem download)
+    '''
+    return filtrar_zips(sorted(f for f in os.listdir(output_files) if f.endswith('.zip')), nomes_tabelas)
+
+
+#%%
+def baixar(config, Files, remotos=None):
+    '''
+    Vários arquivos ao mesmo tempo; downloads interrompidos continuam de
+    onde pararam (arquivos ".part" em OUTPUT_FILES_PATH). Com os dados da
+    listagem ("remotos", ver listar_remotos), os .zip que não mudaram desde
+    o último download (catalogo.json) não são baixados nem consultados.
+    '''
+    output_files = config['output_files']
+    makedirs(output_files)
+    remotos = remotos or {}
+
+    indice = catalogo.ler(output_files)
+    novos = [f for f in Files if not catalogo.atualizado(indice, f, remotos.get(f), output_files)]
+    if len(novos) < len(Files):
+        print(str(len(Files) - len(novos)) + ' arquivos sem alteração desde o último download')
+    if not novos:
+        print('Nenhum arquivo novo para baixar.')
+        return {}
+
+    print('Arquivos que serão baixados:')
+    i_f = 0
+    for f in novos:
+        i_f += 1
+        print(str(i_f) + ' - ' + f)
+
+    urls = [remotos[f]['url'] if f in remotos else config['dados_rf'] + f for f in novos]
+    resultado_download, _ = download.baixar_arquivos(urls, output_files, config['download_workers'])
+    baixados = {}
+    for nome, r in resultado_download.items():
+        if 'erro' not in r:
+            manifesto.marcar(output_files, nome, 'baixado')
+            baixados[nome] = dict(remotos.get(nome, {}), etag=r['etag'], last_modified=r['last_modified'])
+    # Release, dados da listagem, ETag e SHA-256 de cada .zip baixado
+    catalogo.registrar(output_files, baixados, config['download_workers'])
+
+    # Download layout:
+    # FIXME está pedindo login gov.br
+    # Layout = 'https://www.gov.br/receitafederal/pt-br/assuntos/orientacao-tributaria/cadastros/consultas/arquivos/NOVOLAYOUTDOSDADOSABERTOSDOCNPJ.pdf'
+    # print('Baixando layout:')
+    # wget.download(Layout, out=output_files, bar=bar_progress)
+    return resultado_download
+
+
+def tabelas_pendentes(config, Files, nomes_tabelas=None):
+    '''
+    Tabelas (entre as informadas) com algum .zip que mudou ou ainda não
+    foi carregado: só elas seguem para extract, load, index e card. Com
+    DENORMALIZE, uma dimensão nova leva junto as tabelas que usam as
+    descrições dela.
+    '''
+    pendentes = [f for f in Files if not manifesto.concluido(config['output_files'], f, 'carregado')]
+    afetadas = set(tabelas.tabela_do_zip(f) for f in pendentes)
+    if config['denormalize']:
+        afetadas |= set(t for t, spec in tabelas.TABELAS.items()
+                        if any(d in afetadas for _, d in spec.get('descricoes', [])))
+    return [t for t in selecionar_tabelas(nomes_tabelas) if t in afetadas]
+
+
+def marcar_carregados(config, Files, nomes_tabelas=None):
+    '''
+    Registra no manifesto os .zip das tabelas carregadas (ver
+    tabelas_pendentes)
+    '''
+    carregadas = selecionar_tabelas(nomes_tabelas)
+    for f in Files:
+        if tabelas.tabela_do_zip(f) in carregadas and os.path.isfile(os.path.join(config['output_files'], f)):
+            manifesto.marcar(config['output_files'], f, 'carregado')
+
+
+def extrair(config, Files):
+    '''
+    Descompacta os .zip em EXTRACTED_FILES_PATH. Os .zip já extraídos numa
+    execução anterior, e que não mudaram desde então, são pulados.
+    '''
+    if config['stream_zip']:
+        return  # os arquivos são lidos direto dos .zip na carga
+    output_files = config['output_files']
+    extracted_files = config['extracted_files']
+    makedirs(extracted_files)
+
+    i_l = 0
+    for l in Files:
+        i_l += 1
+        if manifesto.concluido(output_files, l, 'extraido'):
+            print(str(i_l) + ' - ' + l + ' já foi descompactado')
+            continue
+        try:
+            print('Descompactando arquivo:')
+            print(str(i_l) + ' - ' + l)
+            full_path = os.path.join(output_files, l)
+            with metricas.etapa('unzip', arquivo=l) as m, zipfile.ZipFile(full_path, 'r') as zip_ref:
+                zip_ref.extractall(extracted_files)
+                membros = zip_ref.namelist()
+                m['bytes'] = sum(i.file_size for i in zip_ref.infolist())
+            manifesto.marcar(output_files, l, 'extraido', arquivos=membros)
+        except Exception as erro:
+            print('Erro ao descompactar ' + l + ': ' + str(erro))
+
+
+def arquivos_entrada(config):
+    '''
+    Arquivos a carregar: os CSVs extraídos ou, com STREAM_ZIP, as tuplas
+    (caminho do .zip, nome do CSV dentro do .zip)
+    '''
+    if config['stream_zip']:
+        return leitura.arquivos_zip(config['output_files'])
+    extracted_files = config['extracted_files']
+    return [os.path.join(extracted_files, name) for name in os.listdir(extracted_files)]
+
+
+#%%
+def gravar_dimensao(tabela, df, engine, conn, metodo, destino, resultado):
+    '''
+    Grava a dimensão que já está no cache: no banco (destino = sufixo da
+    tabela) ou em Parquet (metodo "parquet", destino = configuração)
+    '''
+    inicio = time.time()
+    with metricas.etapa('write', tabela) as m:
+        if metodo == 'parquet':
+            m['linhas'] = saida_parquet.gravar(df, tabela, tabela, destino)
+        else:
+            m['linhas'] = carga.gravar(df, tabela + destino, engine, conn, metodo)
+    resultado[tabela] = {'linhas': m['linhas'], 'inicio': inicio, 'fim': time.time()}
+    print('Dimensão ' + tabela + ' gravada (' + str(m['linhas']) + ' linhas)')
+
+
+#%%
+def carregar(config, nomes_tabelas=None, Items=None):
+    '''
+    Lê os arquivos e grava as tabelas (todas ou só as informadas) no banco
+    ou em Parquet. Retorna um dicionário por tabela com linhas, início e
+    fim da carga.
+    '''
+    insert_start = time.time()
+    nomes_tabelas = selecionar_tabelas(nomes_tabelas)
+
+    if Items is None:
+        Items = arquivos_entrada(config)
+    # Separar arquivos por tabela (empresa, estabelecimento, socios, simples, cnae, ...):
+    arquivos = tabelas.separar_arquivos(Items)
+
+    output_format = config['output_format']
+    print('Saída dos dados: ' + output_format)
+    db = None
+    parquet = config['parquet']
+    if output_format == 'parquet':
+        print('Diretório dos arquivos Parquet: ' + str(parquet['path']) + ' (compressão ' + parquet['compressao'] + ')')
+    else:
+        db = config['db']
+        engine, conn = carga.conectar(db)
+        cur = conn.cursor()
+        print('Método de gravação no banco: ' + config['write_method'])
+
+    # Leitor de CSV da execução (os workers herdam a escolha)
+    print('Leitor de CSV: ' + leitura.configurar(config['read_engine']))
+
+    workers = config['workers']
+    print('Arquivos carregados em paralelo: ' + str(workers))
+
+    # Orçamento de memória de toda a carga (ex.: 12GB), dividido entre os
+    # workers: o tamanho das partes passa a ser calculado pelos bytes por
+    # linha de cada tabela, e CHUNK_SIZE vira só o limite máximo. Com a
+    # fila de gravação cada worker tem na memória a parte sendo lida, as da
+    # fila e as dos escritores.
+    writers = config['writers']
+    if output_format == 'postgres' and writers > 0:
+        print('Escritores por arquivo: ' + str(writers) + ' (fila de ' + str(carga.FILA_PARTES) + ' partes)')
+    partes_memoria = 1 + carga.FILA_PARTES + writers if output_format == 'postgres' and writers > 0 else 1
+    # Workers em threads (Windows): o RSS medido é o do processo inteiro
+    orcamento = memoria.configurar(config['max_memory'], workers, partes_memoria,
+                                   threads=workers > 1 and not paralelo.usa_processos())
+    if orcamento:
+        print('Orçamento de memória: ' + config['max_memory'] + ' (' + str(orcamento // 1024 ** 2) + ' MB por worker)')
+
+    # Tipo de carga: full (apaga e recarrega as tabelas), incremental
+    # (carrega em <tabela>__stage e aplica só as diferenças nas tabelas em
+    # uso) ou swap (carrega em <tabela>__new UNLOGGED e troca com as
+    # tabelas em uso no final, ver troca.py)
+    load_mode = config['load_mode']
+    release = incremental.data_release(Items)
+    print('Tipo de carga: ' + load_mode + ' (release ' + str(release) + ')')
+    sufixo = ''
+    if load_mode == 'incremental':
+        sufixo = incremental.SUFIXO_STAGE
+        incremental.criar_controle(conn)
+    elif load_mode == 'swap':
+        sufixo = troca.SUFIXO_NOVA
+
+    # Continuar uma carga interrompida da mesma release (manifesto.py): as
+    # tabelas com partes já gravadas não são apagadas e os arquivos
+    # concluídos são pulados. RESUME=false recarrega tudo do zero. O
+    # to_sql faz os commits pelo engine, em outra conexão, e não grava a
+    # parte na mesma transação do manifesto: com ele não há retomada.
+    resume = output_format == 'postgres' and config['resume'] and config['write_method'] != 'to_sql'
+    if output_format == 'postgres' and config['resume'] and not resume:
+        print('WRITE_METHOD=to_sql não registra as partes gravadas: a carga não será retomada (RESUME).')
+    if output_format == 'postgres':
+        manifesto.criar(conn)
+        dimensoes.criar_controle(conn)
+
+    # Dimensões (cnae, munic, ...): lidas uma vez só, antes das tabelas de
+    # fatos, e guardadas no cache pelo hash do conteúdo (os workers herdam
+    # o cache). São lidas mesmo fora das tabelas escolhidas, para as
+    # descrições do DENORMALIZE.
+    if dimensoes.configurar(config['denormalize']):
+        print('Descrições das dimensões nas tabelas de fatos (DENORMALIZE)')
+    if busca.configurar(config['search_index']):
+        print('Nomes normalizados para a busca em razao_social_busca e nome_fantasia_busca (SEARCH_INDEX)')
+    if particoes.configurar(config['partitions'], config['partition_by_uf']):
+        print('Tabelas particionadas: %i partições por cnpj_basico%s (PARTITIONS)' %
+              (config['partitions'], ', estabelecimento por uf' if config['partition_by_uf'] else ''))
+    for tabela in tabelas.dimensoes():
+        if not arquivos[tabela]:
+            continue
+        hash_dimensao = leitura.hash_conteudo(arquivos[tabela])
+        df = dimensoes.em_cache(hash_dimensao)
+        if df is None:
+            df = pd.concat([leitura.ler_csv(tabela, arquivo) for arquivo in arquivos[tabela]], ignore_index=True)
+        dimensoes.guardar(tabela, hash_dimensao, df)
+
+    # Drop table antes do insert e criar as tabelas de novo com os tipos do
+    # esquema de tabelas.py (antes de iniciar os workers). Na carga
+    # incremental quem é recriada é a tabela de stage e na carga com troca
+    # a tabela nova, sem mexer na tabela em uso. Se a carga anterior
+    # da mesma release parou no meio, a tabela é mantida e só os arquivos
+    # não concluídos entram.
+    tarefas = []
+    resultado_dimensoes = {}
+    tabelas_carga = []  # tabelas com arquivos nesta release (aplicadas na carga incremental)
+    for tabela in nomes_tabelas:
+        # A tabela e as tabelas geradas a partir dela (ex.: estabelecimento
+        # e estabelecimento_cnae_secundaria) são gravadas na mesma transação
+        grupo = [tabela] + tabelas.derivadas(tabela)
+        if output_format == 'parquet':
+            for nome in grupo:
+                saida_parquet.limpar(nome, parquet)
+            hash_dimensao, df_dimensao = dimensoes.atual(tabela)
+            if df_dimensao is not None:
+                gravar_dimensao(tabela, df_dimensao, None, None, 'parquet', parquet, resultado_dimensoes)
+                continue
+            for arquivo in arquivos[tabela]:
+                tarefas.append((tabela, arquivo))
+            continue
+        if load_mode == 'incremental' and all(incremental.release_aplicada(conn, nome, release) for nome in grupo):
+            print('Release ' + str(release) + ' já aplicada em ' + tabela + ', nada a fazer.')
+            continue
+        hash_dimensao, df_dimensao = dimensoes.atual(tabela)
+        if df_dimensao is not None and dimensoes.inalterada(conn, tabela, hash_dimensao):
+            print('Dimensão ' + tabela + ' sem alterações nesta release, pulando.')
+            continue
+        gravados = {}
+        if resume and df_dimensao is None and incremental.existe_tabela(cur, tabela + sufixo):
+            gravados = manifesto.partes_gravadas(conn, tabela + sufixo, release)
+        if gravados:
+            concluidos = sum(1 for g in gravados.values() if g['concluido'])
+            print('Continuando a carga de %s: %i de %i arquivos já concluídos' % (tabela, concluidos, len(arquivos[tabela])))
+        else:
+            for nome in grupo:
+                cur.execute('DROP TABLE IF EXISTS "' + nome + sufixo + '";')
+                if load_mode != 'incremental':
+                    # Os hashes da carga incremental não valem mais para a tabela nova
+                    cur.execute('DROP TABLE IF EXISTS "' + nome + incremental.SUFIXO_HASH + '";')
+            conn.commit()
+            manifesto.limpar(conn, tabela + sufixo)
+            print('Tem %i arquivos de %s!' % (len(arquivos[tabela]), tabela))
+        for nome in grupo:
+            carga.preparar_tabela(nome, conn, sufixo, unlogged=load_mode == 'swap')
+        if arquivos[tabela]:
+            tabelas_carga.extend(grupo)
+        if df_dimensao is not None and config['write_method'] != 'copy_csv':
+            # A dimensão já está no cache: gravada daqui mesmo, sem os
+            # workers (com copy_csv o arquivo vai direto para o COPY)
+            gravar_dimensao(tabela, df_dimensao, engine, conn, config['write_method'], sufixo, resultado_dimensoes)
+            continue
+        for arquivo in arquivos[tabela]:
+            if not gravados.get(leitura.nome_arquivo(arquivo), {}).get('concluido'):
+                tarefas.append((tabela, arquivo))
+
+    # Carga dos arquivos (os maiores primeiro):
+    resultado = paralelo.carregar_arquivos(tarefas, db, config['write_method'], workers, config['chunksize'],
+                                           sufixo, parquet, release if resume else None, writers)
+    resultado.update(resultado_dimensoes)
+
+    for tabela in tabelas.TABELAS:
+        if tabela not in resultado:
+            continue
+        r = resultado[tabela]
+        print('Tempo de execução do processo de ' + tabela + ' (em segundos): ' + str(round(r['fim'] - r['inicio'])))
+        carga.velocidade(tabela, r['linhas'], r['fim'] - r['inicio'])
+
+    # Tabelas em que os dados da release já estão em uso (com commit): na
+    # carga completa as gravadas, na incremental as aplicadas e na carga
+    # com troca as trocadas
+    em_uso = list(resultado) if load_mode == 'full' else []
+
+    # Carga incremental: aplicar as diferenças do stage nas tabelas em uso
+    if load_mode == 'incremental':
+        for tabela in tabelas_carga:
+            incremental.aplicar(conn, tabela, release)
+            manifesto.limpar(conn, tabela + sufixo)
+            em_uso.append(tabela)
+
+    # Carga com troca: índices e ANALYZE nas tabelas novas e troca com as
+    # tabelas em uso numa única transação
+    if load_mode == 'swap' and tabelas_carga:
+        # Uma tabela com erro num índice (ex.: primary key com código
+        # duplicado) não é trocada: a tabela em uso continua no lugar
+        trocar = troca.sem_erros(tabelas_carga, criar_indices(config, tabelas_carga, sufixo), sufixo)
+        troca.finalizar(conn, trocar, config['swap_logged'])
+        em_uso = troca.trocar(conn, trocar)
+        for tabela in trocar:
+            manifesto.limpar(conn, tabela + sufixo)
+
+    # Hash das dimensões em uso, para não recarregar na próxima release se
+    # o conteúdo não mudar. Uma dimensão que não foi trocada (ex.: erro na
+    # primary key) continua com a release anterior e fica sem registro,
+    # para ser carregada de novo.
+    if output_format == 'postgres':
+        for tabela in tabelas.dimensoes():
+            hash_dimensao, df_dimensao = dimensoes.atual(tabela)
+            if tabela in resultado and tabela in em_uso and df_dimensao is not None:
+                dimensoes.registrar(conn, tabela, hash_dimensao, resultado[tabela]['linhas'])
+
+    if db is not None:
+        cur.close()
+        conn.close()
+        engine.dispose()
+
+    insert_end = time.time()
+    Tempo_insert = round((insert_end - insert_start))
+
+    print("""
+#############################################
+## Processo de carga dos arquivos finalizado!
+#############################################
+""")
+
+    print('Tempo total de execução do processo de carga (em segundos): ' + str(Tempo_insert)) # Tempo de execução do processo (em segundos): 17.770 (4hrs e 57 min)
+
+    # ###############################
+    # Tamanho dos arquivos:
+    # empresa = 45.811.638
+    # estabelecimento = 48.421.619
+    # socios = 20.426.417
+    # simples = 27.893.923
+    # ###############################
+    return resultado
+
+
+#%%
+def criar_indices(config, nomes_tabelas=None, sufixo=''):
+    '''
+    Cria os índices na base de dados (não se aplica à saída em Parquet).
+    Com "sufixo" cria nas tabelas tabela + sufixo (ex.: as tabelas novas
+    da carga com troca).
+    '''
+    if config['output_format'] != 'postgres':
+        return {}
+    index_start = time.time()
+    print("""
+#######################################
+## Criar índices na base de dados [...]
+#######################################
+""")
+    if nomes_tabelas:
+        nomes_tabelas = [n for t in selecionar_tabelas(nomes_tabelas) for n in [t] + tabelas.derivadas(t)]
+    engine, conn = carga.conectar(config['db'])
+    if busca.configurar(config['search_index']):
+        busca.criar_extensao(conn)
+    indices_criados = indices.criar_indices(config['db'], conn, config['index_workers'],
+                                            config['index_maintenance_work_mem'],
+                                            config['index_parallel_workers'], nomes_tabelas, sufixo)
+    conn.close()
+    engine.dispose()
+    print("""
+############################################################
+## Índices criados nas tabelas:
+############################################################
+""")
+    for nome, r in indices_criados.items():
+        situacao = 'erro' if r['erro'] else ('já existia' if r['segundos'] is None else str(round(r['segundos'])) + ' s')
+        print('   - ' + r['tabela'] + '.' + nome + ': ' + situacao)
+    index_end = time.time()
+    index_time = round(index_end - index_start)
+    print('Tempo para criar os índices (em segundos): ' + str(index_time))
+    return indices_criados
+
+
+def montar_cartao(config):
+    '''
+    Monta a tabela cartao_cnpj a partir das tabelas carregadas (não se
+    aplica à saída em Parquet)
+    '''
+    if config['output_format'] != 'postgres':
+        print('A tabela cartao_cnpj só é montada no banco de dados.')
+        return None
+    print("""
+#######################################
+## Montar a tabela cartao_cnpj [...]
+#######################################
+""")
+    inicio = time.time()
+    engine, conn = carga.conectar(config['db'])
+    try:
+        linhas = cartao.montar(config['db'], conn, config['card_parallel_workers'], config['index_workers'],
+                               config['index_maintenance_work_mem'], config['index_parallel_workers'],
+                               config['swap_logged'])
+    finally:
+        conn.close()
+        engine.dispose()
+    print('Tempo para montar a tabela cartao_cnpj (em segundos): ' + str(round(time.time() - inicio)))
+    return linhas
+
+
+#%%
+def executar(config, etapas=None, nomes_tabelas=None):
+    '''
+    Executa as etapas (todas, por padrão; card só com CARD_TABLE) para as
+    tabelas informadas (todas, por padrão), na ordem download, extract,
+    load, index, card
+    '''
+    etapas = etapas or [e for e in ETAPAS if e != 'card' or config['card_table']]
+    invalidas = [e for e in etapas if e not in ETAPAS]
+    if invalidas:
+        raise ValueError('Etapas desconhecidas: ' + ', '.join(invalidas))
+    if nomes_tabelas:
+        nomes_tabelas = selecionar_tabelas(nomes_tabelas)
+
+    # Métricas por etapa (download, unzip, parse, transform, write, index)
+    # em JSON lines e, opcionalmente, no formato do Prometheus.
+    # PROFILE_STAGE mede uma das etapas com cProfile ou tracemalloc.
+    execucao = metricas.configurar(config['metrics_file'], config['profile_stage'],
+                                   config['profile_mode'], config['profile_path'])
+    if config['metrics_file']:
+        print('Métricas da execução ' + execucao + ' em: ' + config['metrics_file'])
+
+    print('Diretórios definidos: \n' +
+          'output_files: ' + str(config['output_files'])  + '\n' +
+          'extracted_files: ' + str(None if config['stream_zip'] else config['extracted_files']))
+
+    if 'download' in etapas:
+        # Uma leitura da listagem decide o que mudou (ver catalogo.py)
+        release, remotos = listar_remotos(config['dados_rf'])
+        print('Release publicada no site: ' + str(release))
+        Files = filtrar_zips(list(remotos), nomes_tabelas)
+        baixar(config, Files, remotos)
+        nomes_tabelas = tabelas_pendentes(config, Files, nomes_tabelas)
+        if not nomes_tabelas:
+            print('Nenhum arquivo novo desde a última carga: nada a fazer.')
+            etapas = ['download']
+        elif len(nomes_tabelas) < len(selecionar_tabelas()):
+            print('Tabelas com arquivos novos: ' + ', '.join(nomes_tabelas))
+    else:
+        Files = zips_locais(config['output_files'], nomes_tabelas)
+
+    if 'extract' in etapas:
+        extrair(config, Files)
+
+    if 'load' in etapas:
+        carregar(config, nomes_tabelas)
+        marcar_carregados(config, Files, nomes_tabelas)
+
+    if 'index' in etapas:
+        criar_indices(config, nomes_tabelas)
+
+    if 'card' in etapas:
+        montar_cartao(config)
+
+    # Tempo de cada etapa, para saber se o tempo foi de rede, leitura,
+    # tratamento, gravação ou índices
+    if config['metrics_file']:
+        medicoes = metricas.ler(config['metrics_file'], execucao)
+        metricas.imprimir_resumo(medicoes)
+        if config['metrics_prometheus']:
+            metricas.exportar_prometheus(config['metrics_prometheus'], medicoes)
+
+
+def _lista(texto):
+    return [t.strip() for t in texto.split(',') if t.strip()] if texto else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Carga dos dados públicos de CNPJ da Receita Federal')
+    parser.add_argument('--env', help='caminho do arquivo .env (padrão: .env no diretório atual)')
+    parser.add_argument('--stages', type=_lista, default=None,
+                        help='etapas separadas por vírgula: ' + ','.join(ETAPAS) + ' (padrão: todas; card só com CARD_TABLE)')
+    parser.add_argument('--tables', type=_lista, default=None,
+                        help='tabelas separadas por vírgula, ex.: empresa,socios (padrão: todas)')
+    args = parser.parse_args(argv)
+
+    # Ler arquivo de configuração de ambiente
+    dotenv_path = args.env or os.path.join(pathlib.Path().resolve(), '.env')
+    if not os.path.isfile(dotenv_path):
+        print('Especifique o local do seu arquivo de configuração ".env". Por exemplo: C:\\...\\Receita_Federal_do_Brasil_-_Dados_Publicos_CNPJ\\code')
+        # C:\Aphonso_C\Git\Receita_Federal_do_Brasil_-_Dados_Publicos_CNPJ\code
+        local_env = input()
+        dotenv_path = os.path.join(local_env, '.env')
+    print(dotenv_path)
+
+    config = configuracao(dotenv_path)
+    executar(config, args.stages, args.tables)
+
+    print("""Processo 100% finalizado! Você já pode usar seus dados no BD!
+ - Desenvolvido por: Aphonso Henrique do Amaral Rafael
+ - Contribua com esse projeto aqui: https://github.com/aphonsoar/Receita_Federal_do_Brasil_-_Dados_Publicos_CNPJ
+""")
+    return 0
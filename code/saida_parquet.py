@@ -0,0 +1,129 @@
+'''
+Saída em Parquet: grava cada tabela como um conjunto de arquivos Parquet
+(colunar), sem precisar do banco de dados.
+
+Estrutura gerada em PARQUET_PATH:
+    <tabela>/<arquivo de origem>-<parte>.parquet          (um por parte lida)
+    <tabela>/<coluna>=<valor>/<arquivo>-<parte>.parquet   (tabelas particionadas)
+
+As tabelas com "particao_parquet" em tabelas.py (ex.: estabelecimento por
+uf) são particionadas no estilo Hive; as demais são particionadas pelo
+arquivo de origem (shard). Os dois formatos são lidos direto por
+pyarrow.dataset, DuckDB, Spark, etc.
+'''
+import os
+import re
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import leitura
+import metricas
+import tabelas
+import tratamentos
+
+COMPRESSAO_PADRAO = 'snappy'
+ROW_GROUP_PADRAO = 500000
+PARTICAO_VAZIA = '__HIVE_DEFAULT_PARTITION__'
+
+
+def configuracao(path, compressao=None, row_group_size=None):
+    '''
+    Dicionário com as opções de gravação (passado para os workers)
+    '''
+    return {'path': path,
+            'compressao': compressao or COMPRESSAO_PADRAO,
+            'row_group_size': row_group_size or ROW_GROUP_PADRAO}
+
+
+def limpar(tabela, config):
+    '''
+    Apaga os arquivos da tabela antes da carga (equivale ao DROP TABLE)
+    '''
+    destino = os.path.join(config['path'], tabela)
+    if os.path.exists(destino):
+        shutil.rmtree(destino)
+    os.makedirs(destino)
+
+
+def para_arrow(df, tabela):
+    '''
+    Converte a parte lida para Arrow. Os tipos vêm do esquema da leitura
+    (Int16 -> int16, category -> dictionary, datas -> date32, ...); uma
+    coluna de texto toda vazia na parte viraria tipo "null", então é
+    convertida para string para o schema ser o mesmo em todos os arquivos.
+    As colunas "decimal" viram decimal128 exato e as "lista" viram
+    list<int32> (ver tratamentos.py), com as funções do próprio Arrow.
+    '''
+    spec_tratamentos = tabelas.TABELAS[tabela]['tratamentos']
+    tipos_pg = {c[0]: c[2] for c in tabelas.TABELAS[tabela]['esquema']}
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    campos = []
+    for i, f in enumerate(table.schema):
+        tratamento = spec_tratamentos.get(f.name)
+        if tratamento == 'lista':
+            coluna = pc.split_pattern(pc.utf8_trim(table.column(i).cast(pa.string()), '{}'), ',')
+            table = table.set_column(i, f.name, coluna)
+            f = pa.field(f.name, pa.list_(pa.int32()))
+        elif tratamento == 'decimal':
+            precisao, escala = re.findall(r'\d+', tipos_pg[f.name])
+            f = pa.field(f.name, pa.decimal128(int(precisao), int(escala)))
+        elif pa.types.is_null(f.type):
+            f = pa.field(f.name, pa.string())
+        elif pa.types.is_timestamp(f.type):
+            f = pa.field(f.name, pa.date32())
+        elif pa.types.is_large_string(f.type):
+            # Leitura com pyarrow: mesmo tipo da leitura com pandas
+            f = pa.field(f.name, pa.string())
+        elif pa.types.is_dictionary(f.type) and pa.types.is_large_string(f.type.value_type):
+            f = pa.field(f.name, pa.dictionary(f.type.index_type, pa.string()))
+        campos.append(f)
+    return table.cast(pa.schema(campos).remove_metadata())
+
+
+def gravar(df, tabela, nome_base, config):
+    '''
+    Grava a parte lida em Parquet. Retorna o número de linhas.
+    '''
+    destino = os.path.join(config['path'], tabela)
+    particao = tabelas.TABELAS[tabela].get('particao_parquet')
+    opcoes = {'compression': config['compressao'], 'row_group_size': config['row_group_size']}
+
+    if not particao:
+        pq.write_table(para_arrow(df, tabela), os.path.join(destino, nome_base + '.parquet'), **opcoes)
+        return len(df)
+
+    for valor, grupo in df.groupby(particao, dropna=False, sort=False, observed=True):
+        valor = valor[0] if isinstance(valor, tuple) else valor
+        pasta = os.path.join(destino, particao + '=' + (PARTICAO_VAZIA if pd.isna(valor) else str(valor)))
+        os.makedirs(pasta, exist_ok=True)
+        pq.write_table(para_arrow(grupo.drop(columns=[particao]), tabela), os.path.join(pasta, nome_base + '.parquet'), **opcoes)
+    return len(df)
+
+
+def carregar_arquivo(tabela, file_path, config, chunksize=None):
+    '''
+    Lê o arquivo em partes de "chunksize" linhas e grava em Parquet.
+    Retorna o número de linhas.
+    '''
+    arquivo = leitura.nome_arquivo(file_path)
+    print('Trabalhando no arquivo: ' + arquivo + ' [...]')
+
+    linhas = 0
+    for part, df in enumerate(leitura.ler_partes(tabela, file_path, chunksize)):
+        with metricas.etapa('write', tabela, arquivo, part) as m:
+            m['linhas'] = gravar(df, tabela, arquivo + '-' + str(part), config)
+        linhas += m['linhas']
+        for derivada in tabelas.derivadas(tabela):
+            with metricas.etapa('transform', derivada, arquivo, part) as m:
+                filho = tratamentos.explodir(df, derivada)
+                m['linhas'] = len(filho)
+            with metricas.etapa('write', derivada, arquivo, part) as m:
+                m['linhas'] = gravar(filho, derivada, arquivo + '-' + str(part), config)
+            del filho
+        del df
+        print('Arquivo ' + arquivo + ' / ' + str(part) + ' gravado em Parquet!')
+    return linhas
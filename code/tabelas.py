@@ -0,0 +1,315 @@
+'''
+Definição das tabelas carregadas no banco: prefixo do arquivo da Receita,
+esquema das colunas (nome, dtype na leitura, tipo no PostgreSQL e
+tratamento antes da gravação) e índices.
+'''
+import os
+
+
+# Esquema compacto: cada coluna é (nome, dtype do pandas, tipo no PostgreSQL)
+# ou (nome, dtype, tipo, tratamento), com o tratamento de tratamentos.py:
+#  - partes do CNPJ são números de tamanho fixo (integer/smallint), sem os
+#    zeros à esquerda (lpad(cnpj_basico::text, 8, '0') para exibir);
+#  - colunas "data" vêm no formato YYYYMMDD e são convertidas na leitura
+#    ("0"/"00000000" viram NULL);
+#  - capital_social ("decimal") vem com vírgula e é gravado exato, sem float;
+#  - cnae_fiscal_secundaria ("lista") vira um array de códigos;
+#  - campos com poucos valores (uf, porte_empresa, ...) são "category" no
+#    pandas, que guarda cada valor distinto uma vez só por parte lida.
+CNPJ_BASICO = ('cnpj_basico', 'Int32', 'integer')
+CODIGO_DESCRICAO = [('codigo', 'Int16', 'smallint'), ('descricao', object, 'text')]
+
+# A ordem das tabelas é a mesma em que eram carregadas no script original.
+# "partes": quantidade de linhas lidas por vez (pode ser trocada por
+# CHUNK_SIZE no ".env").
+# "zip": início do nome dos .zip da tabela no site da Receita (ex.:
+# Empresas0.zip ... Empresas9.zip).
+# "chave": colunas que identificam o registro na carga incremental (em
+# socios há vários sócios por cnpj_basico, então o grupo inteiro é a unidade).
+# "particao_parquet": coluna usada para particionar a saída em Parquet (sem
+# ela, os arquivos Parquet são separados só pelo arquivo de origem).
+# "indices": (nome, colunas) dos índices criados depois da carga e
+# "chave_primaria": colunas da primary key (ver indices.py).
+# "dimensao": tabelas de códigos e descrições, lidas antes das outras e
+# recarregadas só quando o conteúdo muda (ver dimensoes.py).
+# "descricoes": (coluna, dimensão) resolvidas na leitura com DENORMALIZE,
+# em colunas <coluna>_descricao.
+# "particionar": tabelas particionadas com PARTITIONS (ver particoes.py).
+# "busca": colunas de nome normalizadas na leitura com SEARCH_INDEX, em
+# colunas <coluna>_busca com índice de trigramas (ver busca.py).
+# Tabelas com "origem" não vêm de arquivo: são geradas na mesma leitura da
+# tabela de origem, explodindo a coluna de lista "explodir" em uma linha
+# por item (ver tratamentos.explodir).
+TABELAS = {
+    'empresa': {
+        'prefixo': 'EMPRE',
+        'zip': 'Empresas',
+        'esquema': [CNPJ_BASICO,
+                    ('razao_social', object, 'text'),
+                    ('natureza_juridica', 'Int16', 'smallint'),
+                    ('qualificacao_responsavel', 'Int16', 'smallint'),
+                    ('capital_social', object, 'numeric(20,2)', 'decimal'),
+                    ('porte_empresa', 'category', 'smallint'),
+                    ('ente_federativo_responsavel', object, 'text')],
+        'partes': 1000000,
+        'chave': ['cnpj_basico'],
+        'particionar': True,
+        'descricoes': [('natureza_juridica', 'natju'), ('qualificacao_responsavel', 'quals')],
+        'busca': ['razao_social'],
+        'indices': [('empresa_cnpj', ['cnpj_basico'])],
+    },
+    'estabelecimento': {
+        'prefixo': 'ESTABELE',
+        'zip': 'Estabelecimentos',
+        'esquema': [CNPJ_BASICO,
+                    ('cnpj_ordem', 'Int16', 'smallint'),
+                    ('cnpj_dv', 'Int16', 'smallint'),
+                    ('identificador_matriz_filial', 'category', 'smallint'),
+                    ('nome_fantasia', object, 'text'),
+                    ('situacao_cadastral', 'Int16', 'smallint'),
+                    ('data_situacao_cadastral', object, 'date', 'data'),
+                    ('motivo_situacao_cadastral', 'Int16', 'smallint'),
+                    ('nome_cidade_exterior', object, 'text'),
+                    ('pais', 'Int16', 'smallint'),
+                    ('data_inicio_atividade', object, 'date', 'data'),
+                    ('cnae_fiscal_principal', 'Int32', 'integer'),
+                    ('cnae_fiscal_secundaria', object, 'integer[]', 'lista'),
+                    ('tipo_logradouro', object, 'text'),
+                    ('logradouro', object, 'text'),
+                    ('numero', object, 'text'),
+                    ('complemento', object, 'text'),
+                    ('bairro', object, 'text'),
+                    ('cep', 'Int32', 'integer'),
+                    ('uf', 'category', 'varchar(2)'),
+                    ('municipio', 'Int16', 'smallint'),
+                    ('ddd_1', object, 'text'),
+                    ('telefone_1', object, 'text'),
+                    ('ddd_2', object, 'text'),
+                    ('telefone_2', object, 'text'),
+                    ('ddd_fax', object, 'text'),
+                    ('fax', object, 'text'),
+                    ('correio_eletronico', object, 'text'),
+                    ('situacao_especial', object, 'text'),
+                    ('data_situacao_especial', object, 'date', 'data')],
+        'partes': 2000000,
+        'chave': ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv'],
+        'particionar': True,
+        'particao_parquet': 'uf',
+        'descricoes': [('motivo_situacao_cadastral', 'moti'), ('pais', 'pais'),
+                       ('cnae_fiscal_principal', 'cnae'), ('municipio', 'munic')],
+        'busca': ['nome_fantasia'],
+        'indices': [('estabelecimento_cnpj', ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv']),
+                    ('estabelecimento_cnae', ['cnae_fiscal_principal']),
+                    ('estabelecimento_municipio', ['municipio']),
+                    ('estabelecimento_uf', ['uf'])],
+    },
+    'estabelecimento_cnae_secundaria': {
+        'prefixo': None,
+        'origem': 'estabelecimento',
+        'explodir': 'cnae_fiscal_secundaria',
+        'esquema': [CNPJ_BASICO,
+                    ('cnpj_ordem', 'Int16', 'smallint'),
+                    ('cnpj_dv', 'Int16', 'smallint'),
+                    ('cnae', 'Int32', 'integer')],
+        'partes': None,
+        'chave': ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv'],
+        'particionar': True,
+        'indices': [('estabelecimento_cnae_secundaria_cnae', ['cnae']),
+                    ('estabelecimento_cnae_secundaria_cnpj', ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv'])],
+    },
+    'socios': {
+        'prefixo': 'SOCIO',
+        'zip': 'Socios',
+        'esquema': [CNPJ_BASICO,
+                    ('identificador_socio', 'category', 'smallint'),
+                    ('nome_socio_razao_social', object, 'text'),
+                    ('cpf_cnpj_socio', object, 'text'),
+                    ('qualificacao_socio', 'Int16', 'smallint'),
+                    ('data_entrada_sociedade', object, 'date', 'data'),
+                    ('pais', 'Int16', 'smallint'),
+                    ('representante_legal', object, 'text'),
+                    ('nome_do_representante', object, 'text'),
+                    ('qualificacao_representante_legal', 'Int16', 'smallint'),
+                    ('faixa_etaria', 'category', 'smallint')],
+        'partes': 1000000,
+        'chave': ['cnpj_basico'],
+        'particionar': True,
+        'descricoes': [('qualificacao_socio', 'quals'), ('pais', 'pais'),
+                       ('qualificacao_representante_legal', 'quals')],
+        'indices': [('socios_cnpj', ['cnpj_basico'])],
+    },
+    'simples': {
+        'prefixo': 'SIMPLES',
+        'zip': 'Simples',
+        'esquema': [CNPJ_BASICO,
+                    ('opcao_pelo_simples', 'category', 'varchar(1)'),
+                    ('data_opcao_simples', object, 'date', 'data'),
+                    ('data_exclusao_simples', object, 'date', 'data'),
+                    ('opcao_mei', 'category', 'varchar(1)'),
+                    ('data_opcao_mei', object, 'date', 'data'),
+                    ('data_exclusao_mei', object, 'date', 'data')],
+        'partes': 1000000,
+        'chave': ['cnpj_basico'],
+        'particionar': True,
+        'indices': [('simples_cnpj', ['cnpj_basico'])],
+    },
+    'cnae': {
+        'prefixo': 'CNAE',
+        'zip': 'Cnaes',
+        'esquema': [('codigo', 'Int32', 'integer'), ('descricao', object, 'text')],
+        'partes': 1000000,
+        'chave': ['codigo'],
+        'chave_primaria': ['codigo'],
+        'dimensao': True,
+    },
+    'moti': {
+        'prefixo': 'MOTI',
+        'zip': 'Motivos',
+        'esquema': CODIGO_DESCRICAO,
+        'partes': 1000000,
+        'chave': ['codigo'],
+        'chave_primaria': ['codigo'],
+        'dimensao': True,
+    },
+    'munic': {
+        'prefixo': 'MUNIC',
+        'zip': 'Municipios',
+        'esquema': CODIGO_DESCRICAO,
+        'partes': 1000000,
+        'chave': ['codigo'],
+        'chave_primaria': ['codigo'],
+        'dimensao': True,
+    },
+    'natju': {
+        'prefixo': 'NATJU',
+        'zip': 'Naturezas',
+        'esquema': CODIGO_DESCRICAO,
+        'partes': 1000000,
+        'chave': ['codigo'],
+        'chave_primaria': ['codigo'],
+        'dimensao': True,
+    },
+    'pais': {
+        'prefixo': 'PAIS',
+        'zip': 'Paises',
+        'esquema': CODIGO_DESCRICAO,
+        'partes': 1000000,
+        'chave': ['codigo'],
+        'chave_primaria': ['codigo'],
+        'dimensao': True,
+    },
+    'quals': {
+        'prefixo': 'QUALS',
+        'zip': 'Qualificacoes',
+        'esquema': CODIGO_DESCRICAO,
+        'partes': 1000000,
+        'chave': ['codigo'],
+        'chave_primaria': ['codigo'],
+        'dimensao': True,
+    },
+}
+
+# Nomes das colunas, dtypes da leitura (por posição, como no pd.read_csv com
+# header=None) e tratamentos {coluna: tratamento}, derivados do esquema
+for _spec in TABELAS.values():
+    _spec['colunas'] = [c[0] for c in _spec['esquema']]
+    _spec['dtypes'] = {i: c[1] for i, c in enumerate(_spec['esquema'])}
+    _spec['tratamentos'] = {c[0]: c[3] for c in _spec['esquema'] if len(c) > 3}
+
+
+def dimensoes():
+    '''
+    Tabelas de códigos e descrições (cnae, moti, munic, natju, pais, quals)
+    '''
+    return [nome for nome, spec in TABELAS.items() if spec.get('dimensao')]
+
+
+def colunas_descricao(tabela):
+    '''
+    Lista de (coluna, dimensão, coluna da descrição) da tabela
+    '''
+    return [(coluna, dimensao, coluna + '_descricao') for coluna, dimensao in TABELAS[tabela].get('descricoes', [])]
+
+
+def colunas_busca(tabela):
+    '''
+    Lista de (coluna, coluna normalizada para a busca) da tabela
+    '''
+    return [(coluna, coluna + '_busca') for coluna in TABELAS[tabela].get('busca', [])]
+
+
+def ddl(tabela, nome=None, unlogged=False, descricoes=False, busca=False, particao=''):
+    '''
+    CREATE TABLE da tabela com os tipos do esquema (nome = tabela, por
+    padrão). Com "unlogged" a tabela é UNLOGGED e sem autovacuum (tabelas
+    novas da carga com troca, ver troca.py). Com "descricoes" a tabela tem
+    também as colunas de descrição (DENORMALIZE, ver dimensoes.py) e com
+    "busca" as colunas de nome normalizadas (SEARCH_INDEX, ver busca.py).
+    "particao" é a cláusula PARTITION BY da tabela particionada (ver
+    particoes.py): ela não tem dados, então não é UNLOGGED (as partições é
+    que são).
+    '''
+    esquema = TABELAS[tabela]['esquema']
+    if descricoes:
+        esquema = esquema + [(c[2], object, 'text') for c in colunas_descricao(tabela)]
+    if busca:
+        esquema = esquema + [(c[1], object, 'text') for c in colunas_busca(tabela)]
+    colunas = ',\n'.join('    "' + c[0] + '" ' + c[2] for c in esquema)
+    if particao:
+        return 'CREATE TABLE IF NOT EXISTS "' + (nome or tabela) + '" (\n' + colunas + '\n)' + particao + ';'
+    if unlogged:
+        return ('CREATE UNLOGGED TABLE IF NOT EXISTS "' + (nome or tabela) + '" (\n' + colunas + '\n) '
+                'WITH (autovacuum_enabled = false);')
+    return 'CREATE TABLE IF NOT EXISTS "' + (nome or tabela) + '" (\n' + colunas + '\n);'
+
+
+def copia_direta(tabela):
+    '''
+    True se o arquivo pode ir direto para o banco (COPY do CSV, sem pandas):
+    nenhuma coluna precisa de tratamento e nenhuma tabela é gerada a partir
+    dela.
+    '''
+    return not TABELAS[tabela]['tratamentos'] and not derivadas(tabela)
+
+
+def derivadas(tabela):
+    '''
+    Tabelas geradas a partir da leitura da tabela (com "origem" = tabela)
+    '''
+    return [nome for nome, spec in TABELAS.items() if spec.get('origem') == tabela]
+
+
+def tabela_do_arquivo(nome_arquivo):
+    '''
+    Retorna a tabela de destino de um arquivo extraído (pelo prefixo no
+    nome do arquivo), ou None se o arquivo não for de nenhuma tabela.
+    '''
+    for tabela, spec in TABELAS.items():
+        if spec['prefixo'] and nome_arquivo.find(spec['prefixo']) > -1:
+            return tabela
+    return None
+
+
+def tabela_do_zip(nome_zip):
+    '''
+    Tabela de um .zip da Receita (ex.: Estabelecimentos3.zip ->
+    estabelecimento), ou None
+    '''
+    for tabela, spec in TABELAS.items():
+        if spec.get('zip') and nome_zip.startswith(spec['zip']):
+            return tabela
+    return None
+
+
+def separar_arquivos(lista_arquivos):
+    '''
+    Separa os arquivos por tabela. Cada item é o caminho do arquivo extraído
+    ou a tupla (caminho do .zip, nome do membro); vale o nome do CSV.
+    '''
+    arquivos = {tabela: [] for tabela in TABELAS}
+    for arquivo in lista_arquivos:
+        nome = arquivo[1] if isinstance(arquivo, tuple) else os.path.basename(arquivo)
+        tabela = tabela_do_arquivo(nome)
+        if tabela is not None:
+            arquivos[tabela].append(arquivo)
+    return arquivos
@@ -0,0 +1,30 @@
+'''
+Os módulos ficam soltos em code/ (import carga, import pipeline, ...),
+como quando os scripts são executados de dentro da pasta.
+
+Os testes que usam o PostgreSQL só rodam com TEST_DB_NAME: um banco
+descartável, já criado, cujas tabelas são apagadas e recriadas. A conexão
+usa DB_HOST, DB_PORT, DB_USER e DB_PASSWORD (padrão localhost, 5432,
+postgres, postgres).
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def banco(monkeypatch):
+    '''
+    Variáveis DB_* do banco de teste (pula o teste sem TEST_DB_NAME)
+    '''
+    if not os.getenv('TEST_DB_NAME'):
+        pytest.skip('TEST_DB_NAME não definido (banco de teste do PostgreSQL)')
+    db = {'DB_HOST': os.getenv('DB_HOST') or 'localhost', 'DB_PORT': os.getenv('DB_PORT') or '5432',
+          'DB_USER': os.getenv('DB_USER') or 'postgres', 'DB_PASSWORD': os.getenv('DB_PASSWORD') or 'postgres',
+          'DB_NAME': os.getenv('TEST_DB_NAME')}
+    for variavel, valor in db.items():
+        monkeypatch.setenv(variavel, valor)
+    return db
@@ -0,0 +1,176 @@
+'''
+Download (download.py) contra um servidor HTTP local (http.server) com
+.zip falsos: retomada do ".part" com Range (206), servidor que ignora o
+Range (200, recomeça do zero), renomeação no final, tamanho diferente do
+informado pelo servidor e vários arquivos ao mesmo tempo.
+'''
+import http.server
+import io
+import os
+import threading
+import time
+import zipfile
+
+import numpy as np
+import pytest
+
+import download
+
+
+def zip_falso(nome, tamanho, seed):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as z:
+        z.writestr(nome + '.CSV', np.random.default_rng(seed).bytes(tamanho))
+    return buffer.getvalue()
+
+
+class Servidor(http.server.BaseHTTPRequestHandler):
+    '''
+    Serve os arquivos de "arquivos" ({caminho: bytes}). Com aceita_range
+    False ignora o cabeçalho Range (responde 200 com o arquivo inteiro);
+    tamanho_head troca o Content-Length do HEAD de um arquivo. Cada GET
+    fica em "pedidos" e "simultaneos" guarda o máximo de GETs ao mesmo
+    tempo.
+    '''
+    arquivos = {}
+    aceita_range = True
+    tamanho_head = {}
+    pausa = 0
+    pedidos = []
+    ativos = 0
+    simultaneos = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _arquivo(self):
+        conteudo = self.arquivos.get(self.path)
+        if conteudo is None:
+            self.send_error(404)
+        return conteudo
+
+    def do_HEAD(self):
+        conteudo = self._arquivo()
+        if conteudo is None:
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(self.tamanho_head.get(self.path, len(conteudo))))
+        self.send_header('ETag', '"' + str(len(conteudo)) + '"')
+        self.send_header('Accept-Ranges', 'bytes' if self.aceita_range else 'none')
+        self.end_headers()
+
+    def do_GET(self):
+        conteudo = self._arquivo()
+        if conteudo is None:
+            return
+        faixa = self.headers.get('Range')
+        inicio = 0
+        if faixa and self.aceita_range:
+            inicio = int(faixa.split('=')[1].split('-')[0])
+        status = 206 if inicio else 200
+        cls = type(self)
+        with cls.lock:
+            cls.pedidos.append((self.path, faixa, status))
+            cls.ativos += 1
+            cls.simultaneos = max(cls.simultaneos, cls.ativos)
+        try:
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(conteudo) - inicio))
+            if status == 206:
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % (inicio, len(conteudo) - 1, len(conteudo)))
+            self.end_headers()
+            for i in range(inicio, len(conteudo), 64 * 1024):
+                self.wfile.write(conteudo[i:i + 64 * 1024])
+                time.sleep(self.pausa)
+        finally:
+            with cls.lock:
+                cls.ativos -= 1
+
+
+@pytest.fixture
+def servidor():
+    Servidor.arquivos = {'/Empresas%i.zip' % i: zip_falso('EMPRE%i' % i, 300000 + i * 1000, i) for i in range(5)}
+    Servidor.aceita_range = True
+    Servidor.tamanho_head = {}
+    Servidor.pausa = 0
+    Servidor.pedidos = []
+    Servidor.ativos = Servidor.simultaneos = 0
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Servidor)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%i' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_retoma_parcial_com_range(servidor, tmp_path):
+    conteudo = Servidor.arquivos['/Empresas0.zip']
+    destino = str(tmp_path / 'Empresas0.zip')
+    with open(destino + download.SUFIXO_PARCIAL, 'wb') as f:
+        f.write(conteudo[:100000])
+
+    baixado, remoto = download.baixar_arquivo(download.criar_sessao(1), servidor + '/Empresas0.zip', destino)
+
+    assert baixado and remoto['tamanho'] == len(conteudo)
+    assert Servidor.pedidos == [('/Empresas0.zip', 'bytes=100000-', 206)]
+    with open(destino, 'rb') as f:
+        assert f.read() == conteudo
+
+
+def test_servidor_sem_range_recomeca(servidor, tmp_path):
+    Servidor.aceita_range = False
+    conteudo = Servidor.arquivos['/Empresas1.zip']
+    destino = str(tmp_path / 'Empresas1.zip')
+    # Um ".part" que não é o começo do arquivo: se fosse mantido, o
+    # arquivo final ficaria errado
+    with open(destino + download.SUFIXO_PARCIAL, 'wb') as f:
+        f.write(b'x' * 50000)
+
+    baixado, _ = download.baixar_arquivo(download.criar_sessao(1), servidor + '/Empresas1.zip', destino)
+
+    assert baixado
+    assert Servidor.pedidos == [('/Empresas1.zip', 'bytes=50000-', 200)]
+    with open(destino, 'rb') as f:
+        assert f.read() == conteudo
+
+
+def test_renomeia_no_final(servidor, tmp_path):
+    destino = str(tmp_path / 'Empresas2.zip')
+    sessao = download.criar_sessao(1)
+
+    assert download.baixar_arquivo(sessao, servidor + '/Empresas2.zip', destino)[0]
+    assert os.path.isfile(destino)
+    assert not os.path.exists(destino + download.SUFIXO_PARCIAL)
+    with zipfile.ZipFile(destino) as z:
+        assert z.namelist() == ['EMPRE2.CSV']
+
+    # Completo no disco: não baixa de novo (só o HEAD)
+    assert not download.baixar_arquivo(sessao, servidor + '/Empresas2.zip', destino)[0]
+    assert len(Servidor.pedidos) == 1
+
+
+def test_tamanho_diferente_do_servidor(servidor, tmp_path):
+    Servidor.tamanho_head['/Empresas3.zip'] = len(Servidor.arquivos['/Empresas3.zip']) + 10
+    destino = str(tmp_path / 'Empresas3.zip')
+
+    with pytest.raises(IOError, match='Download incompleto'):
+        download.baixar_arquivo(download.criar_sessao(1), servidor + '/Empresas3.zip', destino)
+    # O arquivo final não aparece; o ".part" fica para a próxima execução
+    assert not os.path.exists(destino)
+    assert os.path.isfile(destino + download.SUFIXO_PARCIAL)
+
+
+def test_varios_arquivos_ao_mesmo_tempo(servidor, tmp_path):
+    Servidor.pausa = 0.01
+    urls = [servidor + caminho for caminho in Servidor.arquivos]
+
+    resultado, mb_s = download.baixar_arquivos(urls, str(tmp_path), workers=3, intervalo=60)
+
+    assert Servidor.simultaneos > 1
+    assert mb_s > 0
+    for caminho, conteudo in Servidor.arquivos.items():
+        nome = caminho.lstrip('/')
+        assert resultado[nome]['baixado'] and resultado[nome]['etag'] == '"' + str(len(conteudo)) + '"'
+        with open(os.path.join(str(tmp_path), nome), 'rb') as f:
+            assert f.read() == conteudo
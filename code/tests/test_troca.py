@@ -0,0 +1,80 @@
+'''
+Carga com troca (LOAD_MODE=swap) de tabelas particionadas (PARTITIONS)
+duas vezes seguidas: na segunda troca a tabela em uso já tem partições e
+índices de partição, que precisam sair do caminho da tabela nova. E uma
+dimensão que não foi trocada (primary key com código duplicado) não pode
+ficar registrada como carregada.
+'''
+import carga
+import dados_sinteticos
+import dimensoes
+import leitura
+import pipeline
+import troca
+
+TABELAS = ['empresa', 'estabelecimento']
+
+
+def configurar_swap(monkeypatch, tmp_path, particoes):
+    for variavel, valor in {'OUTPUT_FILES_PATH': str(tmp_path / 'out'), 'EXTRACTED_FILES_PATH': str(tmp_path / 'ext'),
+                            'LOAD_MODE': 'swap', 'PARTITIONS': str(particoes), 'RESUME': 'false', 'STREAM_ZIP': 'false',
+                            'OUTPUT_FORMAT': 'postgres', 'WORKERS': '1'}.items():
+        monkeypatch.setenv(variavel, valor)
+    (tmp_path / 'out').mkdir()
+    return pipeline.configuracao()
+
+
+def test_duas_trocas_com_particoes(banco, monkeypatch, tmp_path):
+    dados_sinteticos.gerar(str(tmp_path / 'ext'), linhas=dados_sinteticos.linhas_por_tabela(2000),
+                           nomes_tabelas=TABELAS)
+    config = configurar_swap(monkeypatch, tmp_path, 4)
+
+    for _ in range(2):
+        pipeline.executar(config, ['load'], TABELAS)
+
+    engine, conn = carga.conectar(config['db'])
+    try:
+        with conn.cursor() as cur:
+            for tabela in TABELAS + ['estabelecimento_cnae_secundaria']:
+                assert troca.particoes_da_tabela(cur, tabela) == [tabela + '_p' + str(i) for i in range(4)]
+                # Os índices das partições seguem <partição>_<posição>
+                for indice, parte, posicao in troca.indices_das_particoes(cur, tabela):
+                    assert indice.strip('"') == parte + '_' + str(posicao)
+                cur.execute("SELECT count(*) FROM pg_class WHERE relname LIKE %s OR relname LIKE %s;",
+                            (tabela + '%' + troca.SUFIXO_NOVA + '%', tabela + '%' + troca.SUFIXO_ANTIGA + '%'))
+                assert cur.fetchone()[0] == 0
+            cur.execute('SELECT count(*) FROM estabelecimento;')
+            assert cur.fetchone()[0] == 2000
+    finally:
+        conn.close()
+        engine.dispose()
+
+
+def test_dimensao_nao_trocada_e_recarregada(banco, monkeypatch, tmp_path, capsys):
+    arquivo, = dados_sinteticos.gerar(str(tmp_path / 'ext'), linhas={'cnae': 100}, nomes_tabelas=['cnae'])
+    config = configurar_swap(monkeypatch, tmp_path, 0)
+    pipeline.executar(config, ['load'], ['cnae'])
+
+    # Release nova com um código duplicado: a primary key de cnae__new
+    # falha e a tabela em uso continua com a release anterior
+    with open(arquivo, 'r', encoding='latin-1') as f:
+        linhas = f.readlines()
+    with open(arquivo, 'w', encoding='latin-1') as f:
+        f.writelines(linhas[1:] + [linhas[1]])
+    hash_novo = leitura.hash_conteudo([arquivo])
+    pipeline.executar(config, ['load'], ['cnae'])
+
+    engine, conn = carga.conectar(config['db'])
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT count(*) FROM cnae;')
+            assert cur.fetchone()[0] == 100
+        assert not dimensoes.inalterada(conn, 'cnae', hash_novo)
+    finally:
+        conn.close()
+        engine.dispose()
+
+    # A execução seguinte com o mesmo arquivo tenta carregar de novo
+    capsys.readouterr()
+    pipeline.executar(config, ['load'], ['cnae'])
+    assert 'Dimensão cnae sem alterações' not in capsys.readouterr().out
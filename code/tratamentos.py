@@ -0,0 +1,62 @@
+'''
+Tratamentos das colunas antes da gravação. Cada coluna que precisa de
+conversão declara o tratamento no esquema em tabelas.py (4º item da
+tupla) e todos usam operações vetorizadas do pandas (.str, to_datetime),
+sem função Python chamada linha a linha.
+'''
+import pandas as pd
+
+import tabelas
+
+
+def data(serie):
+    '''
+    YYYYMMDD -> data ("0", "00000000" e datas inválidas viram NaT/NULL)
+    '''
+    return pd.to_datetime(serie, format='%Y%m%d', errors='coerce')
+
+
+def decimal(serie):
+    '''
+    Valor com vírgula decimal ("1000,50") -> texto com ponto ("1000.50").
+    Continua texto para não passar por float: o banco (numeric) e o
+    Parquet (decimal128) recebem o valor exato.
+    '''
+    return serie.str.replace(',', '.', regex=False)
+
+
+def lista(serie):
+    '''
+    Lista separada por vírgula ("6202300,6203100") -> literal de array do
+    PostgreSQL ("{6202300,6203100}"); sem itens vira NULL
+    '''
+    serie = serie.str.replace(' ', '', regex=False).str.strip(',')
+    serie = serie.where(serie.str.len() > 0)
+    return '{' + serie + '}'
+
+
+TRATAMENTOS = {'data': data, 'decimal': decimal, 'lista': lista}
+
+
+def aplicar(df, tratamentos):
+    '''
+    Aplica os tratamentos {coluna: nome do tratamento} no dataframe
+    '''
+    for coluna, nome in tratamentos.items():
+        df[coluna] = TRATAMENTOS[nome](df[coluna])
+    return df
+
+
+def explodir(df, tabela_derivada):
+    '''
+    Uma linha por item da coluna de lista (já tratada por "lista") com as
+    colunas de chave da tabela de origem: monta a tabela derivada no
+    formato do esquema dela (ex.: estabelecimento_cnae_secundaria).
+    '''
+    spec = tabelas.TABELAS[tabela_derivada]
+    chave = spec['chave']
+    coluna_item = spec['colunas'][len(chave)]
+    itens = df[spec['explodir']].dropna().str.strip('{}').str.split(',').explode()
+    filho = df.loc[itens.index, chave]
+    filho[coluna_item] = pd.to_numeric(itens, errors='coerce').astype(spec['dtypes'][len(chave)])
+    return filho.reset_index(drop=True)
@@ -0,0 +1,151 @@
+'''
+Carga com troca (LOAD_MODE=swap): em vez de apagar as tabelas em uso e
+gravar nelas, cada release é carregada em tabelas novas (<tabela>__new)
+UNLOGGED e sem autovacuum, que não geram WAL durante a carga. Depois da
+carga os índices são criados nas tabelas novas, elas passam por ANALYZE
+(e voltam a ser LOGGED, se configurado) e trocam de lugar com as tabelas
+em uso numa única transação de renomeações. As consultas continuam
+usando as tabelas antigas até o commit e passam a ver as novas completas,
+já com índices e estatísticas.
+
+Tabelas particionadas (PARTITIONS, ver particoes.py): as partições é que
+são UNLOGGED e trocam de nome junto com a tabela (<tabela>_p0__new vira
+<tabela>_p0), com os índices delas (<tabela>_p0_1, <tabela>_p0_2, ...).
+'''
+import time
+
+import psycopg2
+
+import incremental
+
+SUFIXO_NOVA = '__new'
+SUFIXO_ANTIGA = '__old'
+
+
+def indices_da_tabela(cur, nome):
+    '''
+    Nomes dos índices (inclusive os das primary keys) da tabela
+    '''
+    cur.execute('SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = to_regclass(%s);',
+                ('"' + nome + '"',))
+    return [r[0].strip('"') for r in cur.fetchall()]
+
+
+def particoes_da_tabela(cur, nome):
+    '''
+    Nomes das partições da tabela (vazio se ela não é particionada)
+    '''
+    cur.execute('SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(%s);',
+                ('"' + nome + '"',))
+    return [r[0].strip('"') for r in cur.fetchall()]
+
+
+def indices_das_particoes(cur, nome):
+    '''
+    Lista de (índice, partição, posição) dos índices das partições da
+    tabela. O índice vem como regclass (já entre aspas, se preciso) e a
+    posição é a do índice da tabela particionada a que ele pertence (1, 2,
+    ...), a mesma em todas as partições.
+    '''
+    cur.execute('''
+        SELECT x.indexrelid::regclass::text, p.inhrelid::regclass::text,
+               dense_rank() OVER (ORDER BY i.inhparent::regclass::text)
+        FROM pg_inherits p
+        JOIN pg_index x ON x.indrelid = p.inhrelid
+        JOIN pg_inherits i ON i.inhrelid = x.indexrelid
+        WHERE p.inhparent = to_regclass(%s);''', ('"' + nome + '"',))
+    return [(r[0], r[1].strip('"'), r[2]) for r in cur.fetchall()]
+
+
+def sem_erros(nomes_tabelas, indices_criados, sufixo=SUFIXO_NOVA):
+    '''
+    Tabelas cujos índices e primary key foram todos criados nas tabelas
+    novas (indices_criados = resultado de indices.criar_indices). Uma
+    tabela com erro num índice não é trocada: a tabela em uso continua no
+    lugar e a nova fica como <tabela>__new, para conferir.
+    '''
+    com_erro = set(r['tabela'] for r in indices_criados.values() if r['erro'])
+    for tabela in nomes_tabelas:
+        if tabela + sufixo in com_erro:
+            print('Tabela ' + tabela + ' não foi trocada: erro nos índices de ' + tabela + sufixo)
+    return [tabela for tabela in nomes_tabelas if tabela + sufixo not in com_erro]
+
+
+def finalizar(conn, nomes_tabelas, logged=True):
+    '''
+    Prepara as tabelas novas para o uso: ANALYZE, autovacuum de volta e,
+    com "logged", SET LOGGED (reescreve a tabela no WAL; sem ele a tabela
+    continua UNLOGGED e é esvaziada pelo PostgreSQL depois de uma queda do
+    servidor e não vai para as réplicas)
+    '''
+    with conn.cursor() as cur:
+        for tabela in nomes_tabelas:
+            nova = tabela + SUFIXO_NOVA
+            if not incremental.existe_tabela(cur, nova):
+                continue
+            inicio = time.time()
+            for parte in particoes_da_tabela(cur, nova) or [nova]:
+                if logged:
+                    cur.execute('ALTER TABLE "' + parte + '" SET LOGGED;')
+                cur.execute('ALTER TABLE "' + parte + '" RESET (autovacuum_enabled);')
+            cur.execute('ANALYZE "' + nova + '";')
+            conn.commit()
+            print('Tabela ' + nova + ' pronta para a troca (' + str(round(time.time() - inicio)) + ' segundos)')
+
+
+def trocar(conn, nomes_tabelas):
+    '''
+    Troca as tabelas em uso pelas novas numa única transação: a tabela em
+    uso e os índices dela recebem o sufixo __old, a nova e os índices dela
+    perdem o sufixo __new (o mesmo nas partições, ver
+    indices_das_particoes). Depois do commit as tabelas antigas são
+    apagadas. Retorna as tabelas trocadas.
+    '''
+    trocadas = []
+    with conn.cursor() as cur:
+        for tabela in nomes_tabelas:
+            nova = tabela + SUFIXO_NOVA
+            if not incremental.existe_tabela(cur, nova):
+                continue
+            antiga = tabela + SUFIXO_ANTIGA
+            cur.execute('DROP TABLE IF EXISTS "' + antiga + '";')
+            if incremental.existe_tabela(cur, tabela):
+                # Os índices das partições recebem nomes curtos, com a
+                # posição do índice da tabela (ex.: empresa_p0__old_1)
+                for indice, parte, posicao in indices_das_particoes(cur, tabela):
+                    cur.execute('ALTER INDEX ' + indice + ' RENAME TO "' + parte + SUFIXO_ANTIGA + '_' + str(posicao) + '";')
+                for parte in particoes_da_tabela(cur, tabela):
+                    cur.execute('ALTER TABLE "' + parte + '" RENAME TO "' + parte + SUFIXO_ANTIGA + '";')
+                for indice in indices_da_tabela(cur, tabela):
+                    cur.execute('ALTER INDEX "' + indice + '" RENAME TO "' + indice + SUFIXO_ANTIGA + '";')
+                cur.execute('ALTER TABLE "' + tabela + '" RENAME TO "' + antiga + '";')
+            # Os nomes que o PostgreSQL dá aos índices das partições são
+            # cortados em 63 caracteres e se repetem entre a tabela nova e a
+            # em uso: na troca eles viram <partição>_<posição> (ex.: empresa_p0_1)
+            for indice, parte, posicao in indices_das_particoes(cur, nova):
+                parte = parte[:-len(SUFIXO_NOVA)] if parte.endswith(SUFIXO_NOVA) else parte
+                cur.execute('ALTER INDEX ' + indice + ' RENAME TO "' + parte + '_' + str(posicao) + '";')
+            for parte in particoes_da_tabela(cur, nova):
+                if parte.endswith(SUFIXO_NOVA):
+                    cur.execute('ALTER TABLE "' + parte + '" RENAME TO "' + parte[:-len(SUFIXO_NOVA)] + '";')
+            for indice in indices_da_tabela(cur, nova):
+                if indice.endswith(SUFIXO_NOVA):
+                    cur.execute('ALTER INDEX "' + indice + '" RENAME TO "' + indice[:-len(SUFIXO_NOVA)] + '";')
+            cur.execute('ALTER TABLE "' + nova + '" RENAME TO "' + tabela + '";')
+            trocadas.append(tabela)
+    conn.commit()
+    for tabela in trocadas:
+        print('Tabela ' + tabela + ' trocada pela carga nova')
+
+    # Fora da transação da troca: o DROP espera as consultas que ainda
+    # estão lendo as tabelas antigas. Views criadas sobre as tabelas
+    # continuam apontando para as antigas e impedem o DROP.
+    with conn.cursor() as cur:
+        for tabela in trocadas:
+            try:
+                cur.execute('DROP TABLE IF EXISTS "' + tabela + SUFIXO_ANTIGA + '";')
+                conn.commit()
+            except psycopg2.Error as erro:
+                conn.rollback()
+                print('Não foi possível apagar ' + tabela + SUFIXO_ANTIGA + ': ' + str(erro).strip())
+    return trocadas